@@ -0,0 +1,214 @@
+"""
+Cold storage for old chat messages.
+
+``python manage.py archive_messages`` moves messages older than
+``MESSAGE_ARCHIVE_AFTER_DAYS`` out of the ``Message`` table into segment
+files under ``MESSAGE_ARCHIVE_ROOT``, one directory per agent, so the live
+table and its indexes stay small. A segment holds one block per conversation
+and sender: their messages as JSON Lines, compressed on their own (gzip, or
+zstd with ``MESSAGE_ARCHIVE_COMPRESSION = 'zstd'`` and the ``zstandard``
+package), so any block is read with one seek. ``ArchivedMessageBlock`` rows
+index the blocks by agent, conversation, sender and time range.
+
+Only messages already folded into their conversation's summary (up to but
+excluding ``Conversation.summarized_through``) are archived, along with
+messages saved before conversations existed; messages whose reply is still
+being generated are kept too. A conversation resumed after archiving is
+answered from its summary and the messages still live, which are exactly
+the ones the summary does not cover.
+
+Archived messages are read back as unsaved ``Message`` instances, so chat
+history pages through the live table and the archive alike (see
+``api.pagination.ArchivedHistoryPagination``).
+"""
+import gzip
+import json
+import os
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+from .cache import LocalCache
+from .models import ArchivedMessageBlock, GenerationJob, Message
+from users.models import User
+
+ARCHIVED_FIELDS = ('id', 'conversation_id', 'user_id', 'role', 'content', 'token_count', 'created_at', 'updated_at')
+
+EXTENSIONS = {'gzip': 'gz', 'zstd': 'zst'}
+
+# Decompressed blocks, so scrolling through one conversation reads its block once
+block_cache = LocalCache(maxsize=100, ttl=300)
+
+
+def get_root():
+    return Path(getattr(settings, 'MESSAGE_ARCHIVE_ROOT', settings.BASE_DIR / 'var' / 'message_archive'))
+
+
+def get_retention():
+    return timedelta(days=getattr(settings, 'MESSAGE_ARCHIVE_AFTER_DAYS', 90))
+
+
+def get_compression():
+    compression = getattr(settings, 'MESSAGE_ARCHIVE_COMPRESSION', 'gzip')
+    if compression not in EXTENSIONS:
+        raise ImproperlyConfigured(f'Unknown MESSAGE_ARCHIVE_COMPRESSION: {compression!r}')
+    if compression == 'zstd' and zstandard is None:
+        raise ImproperlyConfigured("MESSAGE_ARCHIVE_COMPRESSION = 'zstd' requires the zstandard package")
+    return compression
+
+
+def compress(data, compression):
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+
+def decompress(data, compression):
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImproperlyConfigured('Reading zstd archive blocks requires the zstandard package')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def encode_rows(rows):
+    """JSON Lines for message rows, keeping timestamps to the microsecond."""
+    lines = []
+    for row in rows:
+        row = dict(row, created_at=row['created_at'].isoformat(), updated_at=row['updated_at'].isoformat())
+        lines.append(json.dumps(row) + '\n')
+    return ''.join(lines).encode('utf-8')
+
+
+def archivable_messages(agent_id, before):
+    """An agent's messages created before ``before`` that the live table can do without."""
+    through = 'conversation__summarized_through'
+    summarized = (
+        Q(conversation__isnull=True) |
+        Q(**{f'{through}__created_at__gt': F('created_at')}) |
+        Q(**{f'{through}__created_at': F('created_at'), f'{through}__id__gt': F('id')})
+    )
+    generating = GenerationJob.objects.exclude(
+        status__in=[GenerationJob.Status.COMPLETED, GenerationJob.Status.FAILED]
+    ).values('message')
+    return Message.objects.filter(summarized, agent_id=agent_id, created_at__lt=before).exclude(
+        id__in=generating
+    )
+
+
+def archive_segment(agent_id, before, limit):
+    """
+    Move up to ``limit`` of an agent's oldest archivable messages into a new
+    segment; return how many were moved.
+    """
+    compression = get_compression()
+    with transaction.atomic():
+        rows = list(
+            archivable_messages(agent_id, before).order_by('created_at', 'id').values(*ARCHIVED_FIELDS)[:limit]
+        )
+        if not rows:
+            return 0
+
+        blocks = defaultdict(list)
+        for row in rows:
+            blocks[(row['conversation_id'], row['user_id'])].append(row)
+
+        relative = Path(f'agent_{agent_id}') / (
+            f'{timezone.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}.jsonl.{EXTENSIONS[compression]}'
+        )
+        path = get_root() / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        index = []
+        try:
+            with open(path, 'wb') as segment:
+                for (conversation_id, user_id), messages in blocks.items():
+                    data = compress(encode_rows(messages), compression)
+                    index.append(ArchivedMessageBlock(
+                        agent_id=agent_id,
+                        conversation_id=conversation_id,
+                        user_id=user_id,
+                        path=str(relative),
+                        offset=segment.tell(),
+                        length=len(data),
+                        compression=compression,
+                        message_count=len(messages),
+                        first_created_at=messages[0]['created_at'],
+                        last_created_at=messages[-1]['created_at'],
+                    ))
+                    segment.write(data)
+                segment.flush()
+                os.fsync(segment.fileno())
+
+            ArchivedMessageBlock.objects.bulk_create(index)
+            Message.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+    return len(rows)
+
+
+def archive_messages(agent_ids=None, before=None, segment_size=None, on_progress=None):
+    """
+    Archive the messages older than the retention window (or ``before``) of
+    ``agent_ids``, or of every agent. Returns the number of messages moved.
+    """
+    before = before or timezone.now() - get_retention()
+    segment_size = segment_size or getattr(settings, 'MESSAGE_ARCHIVE_SEGMENT_SIZE', 10000)
+    if agent_ids is None:
+        agent_ids = Message.objects.filter(created_at__lt=before).order_by().values_list(
+            'agent_id', flat=True
+        ).distinct()
+
+    total = 0
+    for agent_id in list(agent_ids):
+        while True:
+            moved = archive_segment(agent_id, before, segment_size)
+            total += moved
+            if on_progress and moved:
+                on_progress(agent_id, total)
+            if moved < segment_size:
+                break
+    return total
+
+
+def read_block(block, cache=True):
+    """Return the message rows of an archived block."""
+    rows = block_cache.get(block.id) if cache else None
+    if rows is None:
+        with open(get_root() / block.path, 'rb') as segment:
+            segment.seek(block.offset)
+            data = decompress(segment.read(block.length), block.compression)
+        rows = [json.loads(line) for line in data.decode('utf-8').splitlines() if line]
+        if cache:
+            block_cache.set(block.id, rows)
+    return rows
+
+
+def load_messages(block):
+    """Return the messages of an archived block as unsaved ``Message`` instances."""
+    messages = []
+    for row in read_block(block):
+        row = dict(row, created_at=parse_datetime(row['created_at']), updated_at=parse_datetime(row['updated_at']))
+        messages.append(Message(agent_id=block.agent_id, **row))
+    return messages
+
+
+def attach_users(messages):
+    """Load the senders of archived messages with one query."""
+    archived = [message for message in messages if message._state.adding and message.user_id]
+    users = User.objects.in_bulk({message.user_id for message in archived})
+    for message in archived:
+        message.user = users.get(message.user_id)
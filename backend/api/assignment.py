@@ -0,0 +1,238 @@
+"""
+Automatic, load-aware ticket routing.
+
+New tickets without an agent are assigned to an active agent that is present
+according to its heartbeats (``api.presence``): online agents before busy
+ones, then the agent with the fewest open (``OPEN`` or ``IN_PROGRESS``)
+tickets. Agents holding
+``TICKET_ROUTING_MAX_OPEN`` open tickets only receive high and urgent
+tickets. Tickets nobody can take stay unassigned until
+``python manage.py route_tickets`` runs.
+
+Open-ticket counts live in ``AgentLoad`` and are updated incrementally with
+atomic ``F()`` expressions whenever a ticket's agent or status changes (see
+``api.signals``), so routing never counts tickets. Code that changes tickets
+without ``save()`` must wrap the change in ``tracking_load`` (and
+``api.stats.tracking_stats``) or call ``adjust_load``;
+``route_tickets --rebuild`` recounts everything.
+
+A single ticket is routed by taking a slot on the chosen agent with a
+compare-and-swap on its counter, retried on the next candidate when another
+request got there first, so concurrent tickets spread over the agents instead
+of piling onto the one that looked least loaded.
+"""
+import heapq
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+
+from . import realtime, stats
+from .models import Agent, AgentLoad, Ticket
+from .presence import get_presence
+from .search import update_search_index
+from .stats import OPEN_STATUSES
+
+# Tickets that may go to agents over capacity
+URGENT_PRIORITIES = (Ticket.Priority.HIGH, Ticket.Priority.URGENT)
+
+# Present agents by preference; offline agents receive no tickets
+PRESENCE_RANKS = {Agent.Status.ONLINE: 0, Agent.Status.BUSY: 1}
+
+# Candidates tried per attempt when routing a single ticket, and attempts
+ROUTING_CANDIDATES = 5
+ROUTING_ATTEMPTS = 3
+
+
+def is_enabled():
+    return getattr(settings, 'TICKET_AUTO_ROUTING', True)
+
+
+def get_capacity():
+    return getattr(settings, 'TICKET_ROUTING_MAX_OPEN', 25)
+
+
+def counted_agent(agent_id, status):
+    """Return the agent whose load a ticket counts towards, or None."""
+    return agent_id if agent_id is not None and status in OPEN_STATUSES else None
+
+
+def adjust_load(deltas):
+    """Add ``{agent_id: delta}`` to the agents' open-ticket counters."""
+    for agent_id, delta in deltas.items():
+        if agent_id is None or not delta:
+            continue
+        counter = AgentLoad.objects.filter(agent_id=agent_id)
+        if not counter.update(open_tickets=F('open_tickets') + delta):
+            # Agents created with bulk_create() have no counter yet
+            AgentLoad.objects.get_or_create(agent_id=agent_id)
+            counter.update(open_tickets=F('open_tickets') + delta)
+
+
+def count_open_by_agent(ticket_ids):
+    rows = Ticket.objects.filter(
+        id__in=ticket_ids, agent__isnull=False, status__in=OPEN_STATUSES
+    ).order_by().values('agent_id').annotate(count=Count('id'))
+    return {row['agent_id']: row['count'] for row in rows}
+
+
+@contextmanager
+def tracking_load(ticket_ids):
+    """
+    Keep the counters right for changes made to ``ticket_ids`` without
+    ``save()`` (``update()``, ``bulk_update()``) inside the block. Use it
+    within a transaction.
+    """
+    before = count_open_by_agent(ticket_ids)
+    yield
+    after = count_open_by_agent(ticket_ids)
+    adjust_load({
+        agent_id: after.get(agent_id, 0) - before.get(agent_id, 0)
+        for agent_id in before.keys() | after.keys()
+    })
+
+
+def ticket_changed(previous, current):
+    """
+    Move a ticket's count between agents. ``previous`` and ``current`` are
+    its counted values (``Ticket.get_counted_values``) before and after the
+    change, None for a created or deleted ticket.
+    """
+    old_agent = counted_agent(previous['agent_id'], previous['status']) if previous else None
+    new_agent = counted_agent(current['agent_id'], current['status']) if current else None
+    if old_agent != new_agent:
+        adjust_load({old_agent: -1, new_agent: 1})
+
+
+def get_candidates(priority=None, limit=None):
+    """
+    Return ``(rank, open_tickets, agent_id)`` for the agents that can take a
+    ticket of ``priority``, best first. Without a priority, agents over
+    capacity are included.
+    """
+    loads = AgentLoad.objects.filter(agent__is_active=True)
+    if priority is not None and priority not in URGENT_PRIORITIES and get_capacity():
+        loads = loads.filter(open_tickets__lt=get_capacity())
+    loads = list(loads.values_list('open_tickets', 'agent_id'))
+    presence = get_presence([agent_id for _, agent_id in loads])
+    candidates = sorted(
+        (PRESENCE_RANKS[presence[agent_id]['status']], open_tickets, agent_id)
+        for open_tickets, agent_id in loads
+        if presence[agent_id]['status'] in PRESENCE_RANKS
+    )
+    return candidates[:limit] if limit else candidates
+
+
+def reserve_agent(priority):
+    """Pick the agent for a new ticket and count the ticket against it; return its id or None."""
+    candidates = []
+    for attempt in range(ROUTING_ATTEMPTS):
+        candidates = get_candidates(priority, ROUTING_CANDIDATES)
+        for rank, open_tickets, agent_id in candidates:
+            # Only succeeds if no other ticket was counted against the agent since we looked
+            if AgentLoad.objects.filter(agent_id=agent_id, open_tickets=open_tickets).update(
+                open_tickets=F('open_tickets') + 1
+            ):
+                return agent_id
+        if not candidates:
+            return None
+    # Heavily contended: settle for the agent that was least loaded last time
+    agent_id = candidates[0][2]
+    adjust_load({agent_id: 1})
+    return agent_id
+
+
+def route_ticket(ticket):
+    """Assign an unassigned open ticket to an agent; return the agent id or None."""
+    if ticket.agent_id is not None or ticket.status not in OPEN_STATUSES:
+        return None
+    with transaction.atomic():
+        agent_id = reserve_agent(ticket.priority)
+        if agent_id is None:
+            return None
+        if not Ticket.objects.filter(id=ticket.id, agent__isnull=True).update(agent_id=agent_id):
+            # Assigned meanwhile by someone else, whose save counted it
+            adjust_load({agent_id: -1})
+            return None
+        previous = ticket.get_counted_values()
+        ticket.agent_id = agent_id
+        ticket._loaded_values = ticket.get_counted_values()
+        stats.ticket_changed(previous, ticket._loaded_values)
+        update_search_index(Ticket.objects.filter(id=ticket.id))
+    return agent_id
+
+
+def route_tickets(queryset, limit=1000, index=True):
+    """
+    Assign up to ``limit`` unassigned open tickets in ``queryset``, most
+    urgent and oldest first, with one UPDATE per agent. Returns the ids of
+    the tickets assigned. With ``index=False`` the caller re-indexes and
+    publishes them.
+    """
+    priority_rank = Case(
+        *[When(priority=priority, then=Value(rank)) for rank, priority in enumerate(
+            [Ticket.Priority.URGENT, Ticket.Priority.HIGH, Ticket.Priority.MEDIUM, Ticket.Priority.LOW]
+        )],
+        output_field=IntegerField()
+    )
+    tickets = list(
+        queryset.filter(agent__isnull=True, status__in=OPEN_STATUSES)
+        .annotate(priority_rank=priority_rank)
+        .order_by('priority_rank', 'created_at', 'id')
+        .values_list('id', 'priority')[:limit]
+    )
+    if not tickets:
+        return []
+
+    with transaction.atomic():
+        capacity = get_capacity()
+        available, full = [], []
+        for candidate in get_candidates():
+            heapq.heappush(full if capacity and candidate[1] >= capacity else available, candidate)
+
+        assignments = defaultdict(list)
+        for ticket_id, priority in tickets:
+            heap = available
+            if priority in URGENT_PRIORITIES and full and (not available or full[0] < available[0]):
+                heap = full
+            if not heap:
+                continue
+            rank, open_tickets, agent_id = heapq.heappop(heap)
+            assignments[agent_id].append(ticket_id)
+            open_tickets += 1
+            heapq.heappush(
+                full if capacity and open_tickets >= capacity else available,
+                (rank, open_tickets, agent_id)
+            )
+
+        routed = []
+        with stats.tracking_stats([ticket_id for ticket_id, _ in tickets]):
+            for agent_id, ticket_ids in assignments.items():
+                # Tickets assigned meanwhile are skipped and not counted
+                assigned = Ticket.objects.filter(id__in=ticket_ids, agent__isnull=True)
+                routed.extend(assigned.values_list('id', flat=True))
+                adjust_load({agent_id: assigned.update(agent_id=agent_id)})
+        if index and routed:
+            update_search_index(Ticket.objects.filter(id__in=routed))
+            realtime.tickets_updated(Ticket.objects.filter(id__in=routed))
+    return routed
+
+
+def rebuild_load():
+    """
+    Recount every agent's open tickets from scratch. Changes made while this
+    runs may be lost, so run it when tickets are quiet.
+    """
+    counts = {
+        row['agent_id']: row['count']
+        for row in Ticket.objects.filter(agent__isnull=False, status__in=OPEN_STATUSES)
+        .order_by().values('agent_id').annotate(count=Count('id'))
+    }
+    with transaction.atomic():
+        for agent_id in Agent.objects.values_list('id', flat=True):
+            AgentLoad.objects.update_or_create(
+                agent_id=agent_id,
+                defaults={'open_tickets': counts.get(agent_id, 0)}
+            )
@@ -0,0 +1,132 @@
+"""
+Caching helpers for agent data.
+
+Every agent has a version number kept in the shared Django cache. It is bumped
+whenever the agent is saved or deleted (see ``api.signals``), and cache keys
+for anything derived from the agent's configuration include it, so stale
+entries are never read again and simply expire.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def agent_version_key(agent_id):
+    return f'agent:{agent_id}:version'
+
+
+def get_version_ttl():
+    return getattr(settings, 'AGENT_CACHE_VERSION_TTL', 24 * 3600)
+
+
+def get_agent_version(agent_id):
+    """Return the current cache version of an agent."""
+    version = cache.get(agent_version_key(agent_id))
+    if version is None:
+        # Seed with a timestamp rather than 1 so an expired or flushed version
+        # can never bring back entries written under an old one. Versions
+        # expire so ids that are only ever looked up do not fill the cache.
+        version = int(time.time() * 1000)
+        if not cache.add(agent_version_key(agent_id), version, timeout=get_version_ttl()):
+            version = cache.get(agent_version_key(agent_id), version)
+    return version
+
+
+def agent_cache_key(agent_id, name):
+    """Cache key for ``name`` under the agent's current version."""
+    return f'agent:{agent_id}:v{get_agent_version(agent_id)}:{name}'
+
+
+def bump_agent_version(agent_id):
+    """Invalidate everything cached for an agent."""
+    try:
+        return cache.incr(agent_version_key(agent_id))
+    except ValueError:
+        return get_agent_version(agent_id)
+
+
+class LocalCache:
+    """Thread-safe in-process LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=1000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def normalize_text(text):
+    """Normalize whitespace and case so trivially different prompts match."""
+    return ' '.join(text.split()).lower()
+
+
+class ResponseCache:
+    """
+    Exact-match cache of agent replies.
+
+    Replies are keyed by a hash of the full request sent to the model: system
+    prompt and normalized history plus the generation parameters. Lookups go
+    to an in-process LRU first and then to the shared Django cache.
+    """
+
+    def __init__(self):
+        self.local = LocalCache(
+            maxsize=getattr(settings, 'RESPONSE_CACHE_LOCAL_MAXSIZE', 1000),
+            ttl=getattr(settings, 'RESPONSE_CACHE_LOCAL_TTL', 300),
+        )
+        self.ttl = getattr(settings, 'RESPONSE_CACHE_TTL', 3600)
+
+    def make_key(self, agent, model, messages, temperature, max_tokens):
+        payload = json.dumps({
+            'model': model,
+            'temperature': temperature,
+            'max_tokens': max_tokens,
+            'messages': [
+                [msg['role'], normalize_text(msg['content'])] for msg in messages
+            ],
+        }, sort_keys=True)
+        digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        return agent_cache_key(agent.id, f'response:{digest}')
+
+    def get(self, key):
+        content = self.local.get(key)
+        if content is None:
+            content = cache.get(key)
+            if content is not None:
+                self.local.set(key, content)
+        return content
+
+    def set(self, key, content):
+        self.local.set(key, content)
+        cache.set(key, content, timeout=self.ttl)
+
+
+response_cache = ResponseCache()
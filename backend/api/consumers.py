@@ -0,0 +1,164 @@
+"""
+WebSocket endpoint for real-time updates (``/ws/``).
+
+Clients authenticate with ``?token=<JWT access token>`` or, in the widget,
+``?visitor=<session token>``, then send JSON actions:
+
+    {"action": "subscribe", "stream": "conversation", "id": 3}
+    {"action": "unsubscribe", "stream": "ticket", "id": 7}
+
+Streams are ``conversation`` (new messages), ``ticket`` (one ticket),
+``agent`` (the tickets assigned to an agent) and ``tickets`` (every ticket,
+staff only). Each subscription is checked against the same rules as the REST
+endpoints; events then arrive as described in ``api.realtime``. Visitors may
+only subscribe to their own conversations.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .models import Agent, Conversation, Ticket
+from .realtime import TICKETS_GROUP, get_channel_layer
+from .visitors import Visitor
+from users.authentication import CachedJWTAuthentication
+from users.models import User
+
+STREAMS = ('conversation', 'ticket', 'agent', 'tickets')
+
+# Close code sent to clients that could not be authenticated
+CLOSE_UNAUTHENTICATED = 4401
+
+
+def database_sync_to_async(func):
+    """Run ``func`` in a worker thread with usable database connections, like a request."""
+    def inner(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(inner)
+
+
+@database_sync_to_async
+def authenticate(query_string):
+    """Return the user or ``Visitor`` identified by the query string, or None."""
+    params = parse_qs(query_string.decode())
+    if params.get('token'):
+        authentication = CachedJWTAuthentication()
+        try:
+            return authentication.get_user(authentication.get_validated_token(params['token'][0]))
+        except (AuthenticationFailed, InvalidToken):
+            return None
+    if params.get('visitor'):
+        return Visitor.from_token(params['visitor'][0])
+    return None
+
+
+@database_sync_to_async
+def can_subscribe(client, stream, object_id):
+    if isinstance(client, Visitor):
+        return stream == 'conversation' and Conversation.objects.filter(
+            id=object_id, agent_id=client.agent_id, visitor_id=client.id
+        ).exists()
+    if stream == 'tickets':
+        return client.is_staff
+    if client.is_staff:
+        return True
+    if stream == 'conversation':
+        return Conversation.objects.filter(id=object_id, user=client).exists()
+    if stream == 'agent':
+        return Agent.objects.filter(id=object_id, user=client).exists()
+    # The tickets listed by TicketViewSet
+    return Ticket.objects.filter(id=object_id).filter(
+        Q(customer=client) |
+        Q(agent__user=client) |
+        (Q(agent__isnull=True) & Q(customer__role=User.Role.CUSTOMER))
+    ).exists()
+
+
+class RealtimeConsumer:
+    """One WebSocket connection: relays client actions and pushes its groups' events."""
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.client = None
+        self.subscription = None
+
+    async def __call__(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+        self.client = await authenticate(self.scope.get('query_string', b''))
+        if self.client is None:
+            await self.send({'type': 'websocket.close', 'code': CLOSE_UNAUTHENTICATED})
+            return
+        await self.send({'type': 'websocket.accept'})
+
+        self.subscription = get_channel_layer().subscribe()
+        receiving = asyncio.ensure_future(self.receive())
+        pushing = asyncio.ensure_future(self.subscription.receive())
+        try:
+            while True:
+                done, _ = await asyncio.wait({receiving, pushing}, return_when=asyncio.FIRST_COMPLETED)
+                if pushing in done:
+                    await self.send({'type': 'websocket.send', 'text': pushing.result()})
+                    pushing = asyncio.ensure_future(self.subscription.receive())
+                if receiving in done:
+                    message = receiving.result()
+                    if message['type'] == 'websocket.disconnect':
+                        break
+                    if message['type'] == 'websocket.receive':
+                        await self.handle(message.get('text') or '')
+                    receiving = asyncio.ensure_future(self.receive())
+        finally:
+            receiving.cancel()
+            pushing.cancel()
+            await self.subscription.close()
+
+    async def reply(self, data):
+        await self.send({'type': 'websocket.send', 'text': json.dumps(data)})
+
+    async def handle(self, text):
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return await self.reply({'type': 'error', 'detail': 'Invalid JSON'})
+        if not isinstance(data, dict) or data.get('action') not in ('subscribe', 'unsubscribe'):
+            return await self.reply({'type': 'error', 'detail': 'Unknown action'})
+
+        stream = data.get('stream')
+        object_id = data.get('id')
+        if stream not in STREAMS:
+            return await self.reply({'type': 'error', 'detail': f'Unknown stream: {stream!r}'})
+        if stream == 'tickets':
+            group, object_id = TICKETS_GROUP, None
+        elif isinstance(object_id, int) and not isinstance(object_id, bool):
+            group = f'{stream}.{object_id}'
+        else:
+            return await self.reply({'type': 'error', 'detail': 'id must be an integer'})
+
+        result = {'stream': stream, 'id': object_id}
+        if data['action'] == 'unsubscribe':
+            await self.subscription.discard(group)
+            return await self.reply({'type': 'unsubscribed', **result})
+
+        if group not in self.subscription.groups:
+            if len(self.subscription.groups) >= getattr(settings, 'REALTIME_MAX_SUBSCRIPTIONS', 50):
+                return await self.reply({'type': 'error', 'detail': 'Too many subscriptions', **result})
+            if not await can_subscribe(self.client, stream, object_id):
+                return await self.reply({'type': 'error', 'detail': 'Not found', **result})
+            await self.subscription.add(group)
+        await self.reply({'type': 'subscribed', **result})
+
+
+async def websocket_application(scope, receive, send):
+    await RealtimeConsumer(scope, receive, send)()
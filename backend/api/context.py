@@ -0,0 +1,237 @@
+"""
+Token-budgeted context building for agent replies.
+
+Each turn sends the agent's system prompt, relevant knowledge base excerpts, a
+rolling summary of older turns and as many recent turns verbatim as fit in the
+history budget. When the verbatim
+history outgrows the budget, the oldest turns are folded into the
+conversation's stored summary, so every later turn only reads the messages
+saved since the last fold. Token counts are cached on each ``Message``.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Q
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+from .llm import get_provider
+
+# Tokens every chat message costs on top of its content (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+DEFAULT_CONTEXT_WINDOW = 8192
+
+KNOWLEDGE_PROMPT = (
+    "Use the following excerpts from the knowledge base to answer when they are relevant:\n\n"
+)
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below between a customer and a support assistant. "
+    "Keep names, account details, decisions and open questions. "
+    "Reply with the summary only."
+)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """Return the tiktoken encoding for ``model``, or None if unavailable."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception:
+        # Encodings are downloaded on first use; fall back to the estimate
+        # when that is not possible (e.g. offline).
+        return None
+
+
+def count_tokens(text, model):
+    """Count the tokens ``text`` uses with ``model``'s tokenizer."""
+    encoding = get_encoding(model)
+    if encoding is None:
+        # Roughly four characters per token for English text
+        return max(1, len(text) // 4) if text else 0
+    return len(encoding.encode(text))
+
+
+def get_context_window(model):
+    windows = getattr(settings, 'MODEL_CONTEXT_WINDOWS', {})
+    return windows.get(model, DEFAULT_CONTEXT_WINDOW)
+
+
+def ensure_token_counts(messages, model):
+    """Compute and store token counts for messages that do not have one yet."""
+    missing = [msg for msg in messages if msg.token_count is None]
+    for msg in missing:
+        msg.token_count = count_tokens(msg.content, model) + MESSAGE_OVERHEAD_TOKENS
+    if missing:
+        type(missing[0]).objects.bulk_update(missing, ['token_count'])
+
+
+class ContextBuilder:
+    """Build the chat messages sent to the LLM for a user message."""
+
+    def __init__(self, message):
+        self.message = message
+        self.agent = message.agent
+        self.conversation = message.conversation
+        self.model = self.agent.model
+        self._history = None
+
+    def get_history_budget(self, reserved):
+        """
+        Tokens available for verbatim history after ``reserved`` tokens
+        (system prompt, summary, reply) are accounted for.
+        """
+        available = get_context_window(self.model) - int(self.agent.max_tokens) - reserved
+        budget = getattr(settings, 'CONTEXT_HISTORY_TOKEN_BUDGET', 3000)
+        return max(0, min(budget, available))
+
+    def get_unsummarized_messages(self):
+        """Messages of the conversation up to this one not yet folded into the summary."""
+        queryset = self.conversation.messages.filter(
+            created_at__lte=self.message.created_at
+        )
+        through = self.conversation.summarized_through
+        if through is not None:
+            queryset = queryset.filter(
+                Q(created_at__gt=through.created_at) |
+                Q(created_at=through.created_at, id__gt=through.id)
+            )
+        return list(queryset.order_by('created_at', 'id'))
+
+    def get_history(self):
+        """The turns not yet folded into the summary, ending with the message."""
+        if self._history is None:
+            if self.conversation is None:
+                # Messages saved before conversations existed have no history
+                self._history = [self.message]
+            else:
+                self._history = self.get_unsummarized_messages()
+        return self._history
+
+    def is_opening_turn(self):
+        """True if the message is the first turn of its conversation."""
+        return len(self.get_history()) == 1 and not (self.conversation and self.conversation.summary)
+
+    def get_cache_messages(self):
+        """
+        The cheap inputs of the reply, for reply cache keys: the prompt, the
+        stored summary and the unsummarized turns. Knowledge excerpts are left
+        out (they follow from the message and the agent's cache version,
+        which knowledge changes bump) and nothing is folded or retrieved, so
+        a cache hit costs no embedding or summary call.
+        """
+        messages = []
+        if self.agent.prompt:
+            messages.append({"role": "system", "content": self.agent.prompt})
+        if self.conversation is not None and self.conversation.summary:
+            messages.append({"role": "system", "content": self.conversation.summary})
+        for msg in self.get_history():
+            messages.append({"role": msg.role, "content": msg.content})
+        return messages
+
+    def split_history(self, messages, budget):
+        """
+        Split ``messages`` into (to_fold, to_keep).
+
+        Nothing is folded while everything fits in ``budget``. Once it does
+        not, only the newest turns fitting in ``CONTEXT_KEEP_RATIO`` of the
+        budget are kept, so the summary is refreshed every few turns rather
+        than on every turn.
+        """
+        total = sum(msg.token_count for msg in messages)
+        if total <= budget:
+            return [], messages
+
+        keep_budget = budget * getattr(settings, 'CONTEXT_KEEP_RATIO', 0.5)
+        kept_tokens = 0
+        split = len(messages)
+        while split > 0:
+            tokens = messages[split - 1].token_count
+            # Always keep the message being answered
+            if kept_tokens + tokens > keep_budget and split < len(messages):
+                break
+            kept_tokens += tokens
+            split -= 1
+        return messages[:split], messages[split:]
+
+    def fold_into_summary(self, messages):
+        """Fold ``messages`` into the conversation's rolling summary and save it."""
+        transcript = '\n'.join(f"{msg.role}: {msg.content}" for msg in messages)
+        if self.conversation.summary:
+            transcript = f"Earlier summary: {self.conversation.summary}\n{transcript}"
+
+        summary = get_provider().complete(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": transcript},
+            ],
+            temperature=0.0,
+            max_tokens=getattr(settings, 'CONTEXT_SUMMARY_MAX_TOKENS', 300),
+        ).strip()
+        if not summary:
+            return
+
+        conversation = self.conversation
+        conversation.summary = summary
+        conversation.summary_token_count = count_tokens(summary, self.model)
+        conversation.summarized_through = messages[-1]
+        conversation.save(update_fields=[
+            'summary', 'summary_token_count', 'summarized_through', 'updated_at'
+        ])
+
+    def get_knowledge(self):
+        """Knowledge base excerpts relevant to the message, formatted for the prompt."""
+        from .knowledge import retrieve
+
+        try:
+            excerpts = retrieve(self.agent, self.message.content, embed=self.message.get_embedding)
+        except Exception as e:
+            print(f"Error retrieving knowledge: {str(e)}")
+            return ''
+        if not excerpts:
+            return ''
+        return KNOWLEDGE_PROMPT + '\n\n---\n\n'.join(excerpts)
+
+    def build(self):
+        prompt = self.agent.prompt
+        knowledge = self.get_knowledge()
+        history = self.get_history()
+        if self.conversation is not None:
+            ensure_token_counts(history, self.model)
+
+            reserved = self.conversation.summary_token_count
+            for text in (prompt, knowledge):
+                if text:
+                    reserved += count_tokens(text, self.model)
+            to_fold, history = self.split_history(history, self.get_history_budget(reserved))
+            if to_fold:
+                try:
+                    self.fold_into_summary(to_fold)
+                except Exception as e:
+                    # The turns are still dropped from the prompt; they will
+                    # be folded on a later turn.
+                    print(f"Error summarizing conversation: {str(e)}")
+
+        conversation = []
+        if prompt:
+            conversation.append({"role": "system", "content": prompt})
+        if knowledge:
+            conversation.append({"role": "system", "content": knowledge})
+        if self.conversation is not None and self.conversation.summary:
+            conversation.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation: {self.conversation.summary}"
+            })
+        for msg in history:
+            role = "user" if msg.role == 'user' else "assistant"
+            conversation.append({"role": role, "content": msg.content})
+        return conversation
@@ -0,0 +1,140 @@
+"""
+Streaming exports of tickets and chat transcripts as CSV or JSON Lines.
+
+Rows are read with ``QuerySet.iterator(chunk_size=EXPORT_CHUNK_SIZE)``, which
+uses a server-side cursor on PostgreSQL, and encoded and sent one chunk at a
+time, so an export holds one chunk in memory however many rows it has. Used
+by ``GET /api/tickets/export/``, ``GET /api/agents/{id}/messages/export/``
+and ``python manage.py export_data``.
+
+Transcripts include archived messages (see ``api.archive``), one block at a
+time, before the live ones.
+"""
+import csv
+import heapq
+import json
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from .archive import read_block
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# Exported column -> queryset lookup
+TICKET_COLUMNS = {
+    'id': 'id',
+    'title': 'title',
+    'description': 'description',
+    'status': 'status',
+    'priority': 'priority',
+    'customer': 'customer_id',
+    'customer_email': 'customer__email',
+    'agent': 'agent_id',
+    'agent_name': 'agent__name',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'closed_at': 'closed_at',
+}
+
+MESSAGE_COLUMNS = {
+    'id': 'id',
+    'agent': 'agent_id',
+    'conversation': 'conversation_id',
+    'user': 'user_id',
+    'role': 'role',
+    'content': 'content',
+    'token_count': 'token_count',
+    'created_at': 'created_at',
+}
+
+
+def get_chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def iter_rows(queryset, columns, chunk_size=None):
+    """Yield the ``columns`` of each row of ``queryset`` as a tuple."""
+    return queryset.values_list(*columns.values()).iterator(chunk_size=chunk_size or get_chunk_size())
+
+
+def iter_archived_messages(blocks):
+    """
+    Yield the archived messages of ``blocks`` as ``MESSAGE_COLUMNS`` tuples,
+    oldest first.
+
+    Each block holds one sender's messages of a conversation, so blocks whose
+    time ranges overlap are merged on ``(created_at, id)``. A block is only
+    read once every message before its first one has been yielded, so only
+    overlapping blocks are held in memory at a time.
+    """
+    heap = []
+
+    def push(block, rows):
+        row = next(rows, None)
+        if row is not None:
+            heapq.heappush(heap, (parse_datetime(row['created_at']), row['id'], row, block, rows))
+
+    pending = blocks.order_by('first_created_at', 'id').iterator(chunk_size=100)
+    next_block = next(pending, None)
+    while heap or next_block is not None:
+        while next_block is not None and (not heap or next_block.first_created_at <= heap[0][0]):
+            push(next_block, iter(read_block(next_block, cache=False)))
+            next_block = next(pending, None)
+        if not heap:
+            continue
+        _, _, row, block, rows = heapq.heappop(heap)
+        yield tuple(
+            block.agent_id if lookup == 'agent_id' else row[lookup]
+            for lookup in MESSAGE_COLUMNS.values()
+        )
+        push(block, rows)
+
+
+def iter_transcript(queryset, blocks=None, chunk_size=None):
+    """Yield the archived messages of ``blocks``, then the messages in ``queryset``."""
+    if blocks is not None:
+        yield from iter_archived_messages(blocks)
+    yield from iter_rows(queryset.order_by('created_at', 'id'), MESSAGE_COLUMNS, chunk_size)
+
+
+class Echo:
+    """A file-like object that returns what is written, for ``csv.writer``."""
+
+    def write(self, value):
+        return value
+
+
+def format_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def encode_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([format_value(value) for value in row])
+
+
+def encode_jsonl(columns, rows):
+    for row in rows:
+        yield json.dumps({column: format_value(value) for column, value in zip(columns, row)}) + '\n'
+
+
+def encode_export(fmt, columns, rows, chunk_size=None):
+    """Encode ``rows`` of ``columns`` in ``fmt``, yielding text a chunk of rows at a time."""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unsupported format: {fmt!r}')
+    chunk_size = chunk_size or get_chunk_size()
+    lines = (encode_csv if fmt == 'csv' else encode_jsonl)(list(columns), rows)
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
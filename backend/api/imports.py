@@ -0,0 +1,257 @@
+"""
+Bulk import of tickets and their customers.
+
+Rows are read lazily from CSV or JSON Lines, so files of any size can be
+imported by ``POST /api/tickets/import/`` or ``python manage.py
+import_tickets``. Each row describes one ticket:
+
+    title, description, customer_email, customer_name, priority, status, agent
+
+Rows are processed in batches of ``TICKET_IMPORT_BATCH_SIZE``. For each batch
+the customers are looked up by email in one query, the missing ones are
+created with unusable passwords, and the tickets are inserted with
+``bulk_create``, all in one transaction. Tickets without an agent are routed
+like tickets created through the API (see ``api.assignment``). Invalid rows
+are skipped and reported; a batch that fails in the database is rolled back
+and reported without stopping the import.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from .assignment import adjust_load, count_open_by_agent, is_enabled, route_tickets
+from .models import Agent, Ticket
+from .realtime import tickets_updated
+from .search import update_search_index
+from .stats import adjust_stats, collect_stats
+from users.models import User
+
+FORMATS = ('csv', 'jsonl')
+
+# Errors kept in the result; further errors are only counted
+MAX_REPORTED_ERRORS = 1000
+
+
+def get_batch_size():
+    return getattr(settings, 'TICKET_IMPORT_BATCH_SIZE', 1000)
+
+
+def detect_format(filename):
+    """Guess the format from a file name, or return None."""
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return None
+
+
+def read_rows(lines, fmt):
+    """
+    Yield ``(line_number, row, error)`` for each record in ``lines`` (an
+    iterable of text lines); ``row`` is a dict, or None if the line could not
+    be parsed.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f'Invalid JSON: {str(e)}'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'Expected a JSON object'
+            continue
+        yield line_number, row, None
+
+
+def clean_row(row):
+    """Validate one row and return its normalized fields; raise ``ValueError``."""
+    def get(name):
+        value = row.get(name)
+        return str(value).strip() if value is not None else ''
+
+    title = get('title')
+    if not title:
+        raise ValueError('title is required')
+    if len(title) > Ticket._meta.get_field('title').max_length:
+        raise ValueError('title is too long')
+
+    email = User.objects.normalize_email(get('customer_email'))
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise ValueError(f'invalid customer_email: {email!r}')
+
+    priority = get('priority').upper() or Ticket.Priority.MEDIUM
+    if priority not in Ticket.Priority.values:
+        raise ValueError(f'invalid priority: {priority!r}')
+    ticket_status = get('status').upper() or Ticket.Status.OPEN
+    if ticket_status not in Ticket.Status.values:
+        raise ValueError(f'invalid status: {ticket_status!r}')
+
+    agent = get('agent')
+    if agent and not agent.isdigit():
+        raise ValueError(f'invalid agent: {agent!r}')
+
+    return {
+        'title': title,
+        'description': get('description'),
+        'customer_email': email,
+        'customer_name': get('customer_name') or 'Customer',
+        'priority': priority,
+        'status': ticket_status,
+        'agent_id': int(agent) if agent else None,
+    }
+
+
+class ImportResult:
+    """Running totals of an import."""
+
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.customers_created = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def as_dict(self):
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'customers_created': self.customers_created,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def get_or_create_customers(rows):
+    """Return a map of email to user id, creating the customers that do not exist."""
+    emails = {row['customer_email'] for row in rows}
+    customers = dict(User.objects.filter(email__in=emails).values_list('email', 'id'))
+
+    names = {row['customer_email']: row['customer_name'] for row in rows}
+    missing = [
+        User(
+            email=email,
+            first_name=names[email].split(' ')[0],
+            last_name=' '.join(names[email].split(' ')[1:]),
+            role=User.Role.CUSTOMER,
+            password=make_password(None),
+        )
+        for email in emails - customers.keys()
+    ]
+    if not missing:
+        return customers, 0
+
+    # Customers created concurrently are skipped here and picked up below.
+    # Each unusable password is random, so the rows that hold ours are the
+    # ones this insert created.
+    User.objects.bulk_create(missing, ignore_conflicts=True)
+    passwords = {user.email: user.password for user in missing}
+    created = 0
+    for email, user_id, password in User.objects.filter(email__in=passwords).values_list(
+        'email', 'id', 'password'
+    ):
+        customers[email] = user_id
+        created += password == passwords[email]
+    return customers, created
+
+
+def import_batch(batch, result):
+    """Validate and insert one batch of ``(line_number, row, error)`` records."""
+    valid = []
+    for line_number, row, error in batch:
+        result.processed += 1
+        if error:
+            result.add_error(line_number, error)
+            continue
+        try:
+            valid.append((line_number, clean_row(row)))
+        except ValueError as e:
+            result.add_error(line_number, str(e))
+
+    agent_ids = {row['agent_id'] for _, row in valid if row['agent_id']}
+    active_agents = set(
+        Agent.objects.filter(id__in=agent_ids, is_active=True).values_list('id', flat=True)
+    ) if agent_ids else set()
+    rows = []
+    for line_number, row in valid:
+        if row['agent_id'] and row['agent_id'] not in active_agents:
+            result.add_error(line_number, f"invalid agent {row['agent_id']}: not found or not active")
+        else:
+            rows.append((line_number, row))
+    if not rows:
+        return
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            customers, customers_created = get_or_create_customers([row for _, row in rows])
+            tickets = Ticket.objects.bulk_create([
+                Ticket(
+                    title=row['title'],
+                    description=row['description'],
+                    priority=row['priority'],
+                    status=row['status'],
+                    customer_id=customers[row['customer_email']],
+                    agent_id=row['agent_id'],
+                    closed_at=now if row['status'] == Ticket.Status.CLOSED else None,
+                )
+                for _, row in rows
+            ])
+            # bulk_create() sends no signals, so count, route, index and publish the new tickets here
+            created = Ticket.objects.filter(id__in=[ticket.id for ticket in tickets])
+            adjust_load(count_open_by_agent([ticket.id for ticket in tickets]))
+            adjust_stats(collect_stats(created))
+            if is_enabled():
+                route_tickets(created, limit=len(tickets), index=False)
+            update_search_index(created)
+            tickets_updated(created)
+    except DatabaseError as e:
+        for line_number, _ in rows:
+            result.add_error(line_number, f'Database error: {str(e)}')
+        return
+
+    result.created += len(tickets)
+    result.customers_created += customers_created
+
+
+def import_tickets(lines, fmt, batch_size=None, on_progress=None):
+    """
+    Import tickets from ``lines`` in format ``fmt`` (``'csv'`` or ``'jsonl'``).
+
+    ``on_progress`` is called with the ``ImportResult`` after every batch.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unsupported format: {fmt!r}')
+    batch_size = batch_size or get_batch_size()
+    result = ImportResult()
+    records = read_rows(lines, fmt)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        import_batch(batch, result)
+        if on_progress:
+            on_progress(result)
+    return result
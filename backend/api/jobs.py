@@ -0,0 +1,130 @@
+"""
+Database-backed queue for agent reply generation.
+
+``MessageViewSet.create`` enqueues a ``GenerationJob`` in the same transaction
+as the user's message and returns immediately. Workers started with
+``python manage.py run_generation_worker`` claim pending jobs, call the LLM
+outside of any transaction and store the assistant's reply.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import GenerationJob
+
+
+def get_lock_timeout():
+    """Seconds after which a RUNNING job is considered abandoned."""
+    return getattr(settings, 'GENERATION_JOB_LOCK_TIMEOUT', 300)
+
+
+def get_max_attempts():
+    return getattr(settings, 'GENERATION_JOB_MAX_ATTEMPTS', 3)
+
+
+def enqueue_generation(message):
+    """Queue generation of the agent's reply to ``message``."""
+    return GenerationJob.objects.create(message=message)
+
+
+def fail_abandoned_jobs():
+    """
+    Mark jobs whose worker died during their last allowed attempt as FAILED;
+    they would otherwise stay RUNNING forever.
+    """
+    now = timezone.now()
+    return GenerationJob.objects.filter(
+        status=GenerationJob.Status.RUNNING,
+        locked_at__lt=now - timedelta(seconds=get_lock_timeout()),
+        attempts__gte=get_max_attempts()
+    ).update(
+        status=GenerationJob.Status.FAILED,
+        error='The worker running this job stopped responding.',
+        locked_at=None,
+        updated_at=now
+    )
+
+
+def claim_next_job():
+    """
+    Atomically claim the oldest runnable job, or return None if there is none.
+
+    A job is runnable when it is pending, or when it has been running for
+    longer than the lock timeout (its worker most likely died). Claiming uses a
+    conditional UPDATE so concurrent workers never pick up the same job.
+    """
+    fail_abandoned_jobs()
+    now = timezone.now()
+    stale = now - timedelta(seconds=get_lock_timeout())
+    runnable = GenerationJob.objects.filter(
+        Q(status=GenerationJob.Status.PENDING) |
+        Q(status=GenerationJob.Status.RUNNING, locked_at__lt=stale),
+        attempts__lt=get_max_attempts()
+    )
+
+    for job_id in runnable.order_by('created_at').values_list('id', flat=True)[:10]:
+        claimed = runnable.filter(id=job_id).update(
+            status=GenerationJob.Status.RUNNING,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now
+        )
+        if claimed:
+            return GenerationJob.objects.select_related('message__agent', 'message__conversation__summarized_through').get(id=job_id)
+    return None
+
+
+def owned(job):
+    """
+    Jobs still held by the claim ``job`` was loaded with; empty once the lock
+    timed out and another worker re-claimed or failed the job.
+    """
+    return GenerationJob.objects.filter(
+        id=job.id, status=GenerationJob.Status.RUNNING, locked_at=job.locked_at
+    )
+
+
+def run_job(job):
+    """
+    Generate and store the reply for a claimed job. The reply is discarded if
+    the claim was lost meanwhile, so a job never gets two replies.
+    """
+    message = job.message
+    try:
+        content = message.generate_agent_response(fail_silently=False)
+        with transaction.atomic():
+            if not owned(job).update(
+                status=GenerationJob.Status.COMPLETED, error='', updated_at=timezone.now()
+            ):
+                job.refresh_from_db()
+                return job
+            if content:
+                job.response = message.save_agent_response(content)
+                GenerationJob.objects.filter(id=job.id).update(response=job.response)
+    except Exception as e:
+        # Leave the job pending so another attempt is made, unless it has
+        # already used up its retries.
+        if job.attempts >= get_max_attempts():
+            job_status = GenerationJob.Status.FAILED
+        else:
+            job_status = GenerationJob.Status.PENDING
+        owned(job).update(status=job_status, error=str(e), locked_at=None, updated_at=timezone.now())
+    job.refresh_from_db()
+    return job
+
+
+def wait_for_job(job, timeout, interval=0.25):
+    """
+    Block until ``job`` has finished or ``timeout`` seconds have passed.
+
+    Used by the long-poll endpoint; returns the refreshed job either way.
+    """
+    deadline = time.monotonic() + timeout
+    while not job.is_finished and time.monotonic() < deadline:
+        time.sleep(interval)
+        job.refresh_from_db()
+    return job
@@ -0,0 +1,193 @@
+"""
+Agent knowledge bases (retrieval-augmented generation).
+
+Uploaded ``KnowledgeDocument`` rows are processed by
+``python manage.py ingest_knowledge``: the text is split into overlapping
+chunks, embedded in batches and appended to the agent's on-disk vector index.
+When building a reply, only the chunks most similar to the user's question
+are added to the prompt.
+
+Chunk embeddings are also kept in the database, so the index can be rebuilt
+(e.g. after a document is deleted) without embedding anything again.
+"""
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import bump_agent_version
+from .llm import get_provider
+from .models import KnowledgeChunk, KnowledgeDocument
+from .semantic_cache import semantic_cache
+from .vector_index import VECTOR_DTYPE, get_index
+
+
+def get_index_path(agent_id):
+    return Path(settings.VECTOR_INDEX_ROOT) / f'agent_{agent_id}' / 'knowledge'
+
+
+def chunk_text(text, size=None, overlap=None):
+    """Split ``text`` into chunks of ``size`` words overlapping by ``overlap`` words."""
+    size = size or getattr(settings, 'KNOWLEDGE_CHUNK_WORDS', 200)
+    overlap = min(overlap if overlap is not None else getattr(settings, 'KNOWLEDGE_CHUNK_OVERLAP', 40), size - 1)
+    words = text.split()
+    chunks = []
+    for start in range(0, len(words), size - overlap):
+        chunks.append(' '.join(words[start:start + size]))
+        if start + size >= len(words):
+            break
+    return chunks
+
+
+def read_document_text(document):
+    if document.content:
+        return document.content
+    if document.file:
+        with document.file.open('rb') as f:
+            return f.read().decode('utf-8', errors='replace')
+    return ''
+
+
+def invalidate_cached_answers(agent_id):
+    """Cached replies may be based on knowledge that just changed."""
+    bump_agent_version(agent_id)
+    semantic_cache.clear(agent_id)
+
+
+def get_ingest_timeout():
+    """Seconds after which a PROCESSING document is considered abandoned."""
+    return getattr(settings, 'KNOWLEDGE_INGEST_TIMEOUT', 600)
+
+
+def claim_next_document():
+    """
+    Atomically claim the oldest pending document, or return None.
+
+    Documents left PROCESSING for longer than the ingest timeout (their worker
+    most likely died) are claimed again.
+    """
+    now = timezone.now()
+    claimable = KnowledgeDocument.objects.filter(
+        Q(status=KnowledgeDocument.Status.PENDING) |
+        Q(status=KnowledgeDocument.Status.PROCESSING, updated_at__lt=now - timedelta(seconds=get_ingest_timeout()))
+    )
+    for document_id in claimable.order_by('created_at').values_list('id', flat=True)[:10]:
+        claimed = claimable.filter(id=document_id).update(
+            status=KnowledgeDocument.Status.PROCESSING,
+            updated_at=now
+        )
+        if claimed:
+            return KnowledgeDocument.objects.get(id=document_id)
+    return None
+
+
+def ingest_document(document):
+    """
+    Chunk, embed and index a claimed document.
+
+    Every chunk is embedded before any is written, and the chunks replace the
+    document's previous ones in one transaction. If ingestion fails, the
+    document's chunks are dropped from the database and the index.
+    """
+    try:
+        texts = chunk_text(read_document_text(document))
+        batch_size = getattr(settings, 'KNOWLEDGE_EMBED_BATCH_SIZE', 64)
+        provider = get_provider()
+        vectors = np.empty((0, 0), dtype=VECTOR_DTYPE)
+        if texts:
+            vectors = np.concatenate([
+                np.asarray(provider.embed(texts[start:start + batch_size]), dtype=VECTOR_DTYPE)
+                for start in range(0, len(texts), batch_size)
+            ])
+
+        with transaction.atomic():
+            replaced, _ = document.chunks.all().delete()
+            chunks = KnowledgeChunk.objects.bulk_create([
+                KnowledgeChunk(
+                    document=document,
+                    agent_id=document.agent_id,
+                    ordinal=ordinal,
+                    content=text,
+                    embedding=vector.tobytes()
+                )
+                for ordinal, (text, vector) in enumerate(zip(texts, vectors))
+            ])
+            document.chunk_count = len(chunks)
+            document.status = KnowledgeDocument.Status.READY
+            document.error = ''
+            document.save(update_fields=['chunk_count', 'status', 'error', 'updated_at'])
+
+        if replaced:
+            rebuild_index(document.agent_id)
+        else:
+            get_index(get_index_path(document.agent_id)).add(vectors, [chunk_payload(chunk) for chunk in chunks])
+        invalidate_cached_answers(document.agent_id)
+    except Exception as e:
+        fail_document(document, e)
+    return document
+
+
+def fail_document(document, error):
+    """Mark a document FAILED and remove whatever was stored for it."""
+    document.chunks.all().delete()
+    document.chunk_count = 0
+    document.status = KnowledgeDocument.Status.FAILED
+    document.error = str(error)
+    document.save(update_fields=['chunk_count', 'status', 'error', 'updated_at'])
+    rebuild_index(document.agent_id)
+    invalidate_cached_answers(document.agent_id)
+
+
+def chunk_payload(chunk):
+    return {
+        'chunk_id': chunk.id,
+        'document_id': chunk.document_id,
+        'content': chunk.content,
+    }
+
+
+def rebuild_index(agent_id):
+    """Rebuild an agent's index from the chunk embeddings stored in the database."""
+    vectors = []
+    payloads = []
+    chunks = KnowledgeChunk.objects.filter(
+        agent_id=agent_id,
+        document__status=KnowledgeDocument.Status.READY
+    ).order_by('id')
+    for chunk in chunks.iterator(chunk_size=1000):
+        vectors.append(np.frombuffer(bytes(chunk.embedding), dtype=VECTOR_DTYPE))
+        payloads.append(chunk_payload(chunk))
+    get_index(get_index_path(agent_id)).rebuild(vectors, payloads)
+
+
+def delete_document(document):
+    """Delete a document and drop its chunks from the agent's index."""
+    agent_id = document.agent_id
+    document.delete()
+    rebuild_index(agent_id)
+    invalidate_cached_answers(agent_id)
+
+
+def retrieve(agent, query, k=None, embed=None):
+    """
+    Return the contents of the ``k`` chunks of the agent's knowledge base most
+    relevant to ``query``. ``embed`` returns the query's embedding, if the
+    caller already has (or will need) it; it is only called when the agent
+    has a knowledge base.
+    """
+    index = get_index(get_index_path(agent.id))
+    if not len(index):
+        return []
+
+    k = k or getattr(settings, 'KNOWLEDGE_TOP_K', 4)
+    min_score = getattr(settings, 'KNOWLEDGE_MIN_SCORE', 0.2)
+    embedding = embed() if embed else get_provider().embed([query])[0]
+    return [
+        payload['content']
+        for score, payload in index.search(embedding, k=k)
+        if score >= min_score
+    ]
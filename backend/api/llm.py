@@ -0,0 +1,203 @@
+"""
+LLM provider backends used to generate agent replies.
+
+The active provider is selected with the ``LLM_PROVIDER`` setting: ``openai``
+talks to the OpenAI API, ``fake`` is a deterministic local provider that needs
+no network access (useful for development and offline tests). A dotted path to
+a custom provider class is also accepted.
+
+API clients are shared process-wide through a registry keyed by provider, base
+URL and API key, so HTTP connections (and their TLS sessions) are kept alive
+and reused across chat turns instead of being re-established for every reply.
+"""
+import hashlib
+import os
+import threading
+import time
+
+import httpx
+import openai
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _build_openai_client(api_key, base_url):
+    http_client = openai.DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=getattr(settings, 'LLM_MAX_CONNECTIONS', 100),
+            max_keepalive_connections=getattr(settings, 'LLM_MAX_KEEPALIVE_CONNECTIONS', 20),
+            keepalive_expiry=getattr(settings, 'LLM_KEEPALIVE_EXPIRY', 60),
+        ),
+        timeout=httpx.Timeout(
+            getattr(settings, 'LLM_TIMEOUT', 60),
+            connect=getattr(settings, 'LLM_CONNECT_TIMEOUT', 5),
+        ),
+    )
+    return openai.OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=http_client,
+        max_retries=getattr(settings, 'LLM_MAX_RETRIES', 2),
+    )
+
+
+def get_client(provider, api_key=None, base_url=None):
+    """
+    Return the shared API client for ``provider``, creating it on first use.
+
+    Clients are keyed by (provider, base URL, API key), so agents pointing at
+    different endpoints or accounts get separate connection pools.
+    """
+    key = (provider, base_url, api_key)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            if provider != 'openai':
+                raise ValueError(f"Unknown LLM client provider: {provider}")
+            client = _clients[key] = _build_openai_client(api_key, base_url)
+    return client
+
+
+def reset_clients(close=True):
+    """
+    Drop every shared client.
+
+    ``close=False`` skips closing the underlying connections; used after a
+    fork, where the sockets still belong to the parent process.
+    """
+    global _clients_lock
+    clients = list(_clients.values())
+    _clients.clear()
+    _clients_lock = threading.Lock()
+    if close:
+        for client in clients:
+            client.close()
+
+
+if hasattr(os, 'register_at_fork'):
+    # Pre-fork servers (gunicorn --preload) must not share pooled connections
+    # between workers.
+    os.register_at_fork(after_in_child=lambda: reset_clients(close=False))
+
+
+class BaseProvider:
+    """Interface every LLM provider implements."""
+
+    def complete(self, *, model, messages, temperature, max_tokens):
+        """Return the full completion text for ``messages``."""
+        return ''.join(self.stream(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        ))
+
+    def stream(self, *, model, messages, temperature, max_tokens):
+        """Yield the completion text as it is generated, one delta at a time."""
+        raise NotImplementedError
+
+    def embed(self, texts):
+        """Return one embedding vector (a list of floats) per text."""
+        raise NotImplementedError
+
+
+class OpenAIProvider(BaseProvider):
+    """Provider backed by the OpenAI chat completions API."""
+
+    def get_client(self):
+        return get_client(
+            'openai',
+            api_key=settings.OPENAI_API_KEY,
+            base_url=getattr(settings, 'OPENAI_BASE_URL', None),
+        )
+
+    def complete(self, *, model, messages, temperature, max_tokens):
+        response = self.get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        if response.choices and response.choices[0].message.content:
+            return response.choices[0].message.content.strip()
+        return ''
+
+    def stream(self, *, model, messages, temperature, max_tokens):
+        response = self.get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+    def embed(self, texts):
+        response = self.get_client().embeddings.create(
+            model=getattr(settings, 'EMBEDDING_MODEL', 'text-embedding-3-small'),
+            input=list(texts),
+        )
+        return [item.embedding for item in response.data]
+
+
+class FakeProvider(BaseProvider):
+    """
+    Offline provider that echoes the last user message back.
+
+    Replies are streamed word by word; ``FAKE_LLM_TOKEN_DELAY`` (seconds) can be
+    set to simulate generation latency. Embeddings are hashed bags of words, so
+    texts sharing words are similar.
+    """
+    EMBEDDING_DIM = 256
+
+    def reply_for(self, messages):
+        last_user = next(
+            (m['content'] for m in reversed(messages) if m['role'] == 'user'),
+            ''
+        )
+        return f"You said: {last_user}"
+
+    def stream(self, *, model, messages, temperature, max_tokens):
+        delay = getattr(settings, 'FAKE_LLM_TOKEN_DELAY', 0)
+        words = self.reply_for(messages).split(' ')
+        for index, word in enumerate(words[:max_tokens]):
+            if delay:
+                time.sleep(delay)
+            yield word if index == 0 else f" {word}"
+
+    def embed(self, texts):
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.EMBEDDING_DIM
+            for word in text.lower().split():
+                word = word.strip('.,!?;:"\'()')
+                digest = hashlib.md5(word.encode('utf-8')).digest()
+                vector[int.from_bytes(digest[:4], 'little') % self.EMBEDDING_DIM] += 1.0
+            vectors.append(vector)
+        return vectors
+
+
+PROVIDERS = {
+    'openai': OpenAIProvider,
+    'fake': FakeProvider,
+}
+
+
+def get_provider(name=None):
+    """Return an instance of the configured (or named) LLM provider."""
+    name = name or getattr(settings, 'LLM_PROVIDER', 'openai')
+    provider_class = PROVIDERS.get(name) or import_string(name)
+    return provider_class()
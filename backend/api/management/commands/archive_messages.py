@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.archive import archive_messages, get_retention
+
+
+class Command(BaseCommand):
+    help = 'Move old chat messages out of the database into compressed archive segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            help='Archive messages older than this many days (default: MESSAGE_ARCHIVE_AFTER_DAYS)'
+        )
+        parser.add_argument(
+            '--agent',
+            type=int,
+            action='append',
+            help='Only archive the messages of this agent (may be repeated)'
+        )
+        parser.add_argument(
+            '--segment-size',
+            type=int,
+            help='Messages per segment file (default: MESSAGE_ARCHIVE_SEGMENT_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        days = options['older_than']
+        retention = timedelta(days=days) if days is not None else get_retention()
+        before = timezone.now() - retention
+
+        def report(agent_id, total):
+            self.stdout.write(f'Archived {total} message(s) so far (agent {agent_id})')
+
+        total = archive_messages(
+            agent_ids=options['agent'],
+            before=before,
+            segment_size=options['segment_size'],
+            on_progress=report
+        )
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} message(s) created before {before:%Y-%m-%d %H:%M}'))
@@ -0,0 +1,201 @@
+import random
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.models import Agent, Conversation, GenerationJob, Message, Ticket
+from api.pagination import KeysetPagination
+from api.search import update_search_index
+from api.views import AgentViewSet, MessageViewSet, TicketViewSet
+from users.models import User
+
+# Plan lines reporting a full table scan, per database vendor
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\S+)'),
+    'sqlite': re.compile(r'\bSCAN (\S+)(?: AS \S+)?$', re.MULTILINE),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway dataset, EXPLAIN the hot queries the API viewsets '
+        'generate and flag sequential scans. All seeded rows are rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tickets',
+            type=int,
+            default=5000,
+            help='Number of tickets to seed (default: 5000)'
+        )
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=20000,
+            help='Number of chat messages to seed (default: 20000)'
+        )
+        parser.add_argument(
+            '--fail-on-seq-scan',
+            action='store_true',
+            help='Exit with an error if any query uses a sequential scan'
+        )
+
+    def handle(self, *args, **options):
+        pattern = SEQ_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            self.stdout.write(self.style.WARNING(
+                f'Sequential scan detection is not supported on {connection.vendor}; '
+                'plans are printed but not checked'
+            ))
+
+        flagged = []
+        with transaction.atomic():
+            users = self.seed(options['tickets'], options['messages'])
+            self.analyze()
+
+            for name, queryset in self.get_queries(users):
+                plan = queryset.explain()
+                scans = pattern.findall(plan) if pattern else []
+                if scans:
+                    flagged.append(name)
+                    self.stdout.write(self.style.ERROR(
+                        f'{name}: sequential scan on {", ".join(sorted(set(scans)))}'
+                    ))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'{name}: OK'))
+                if scans or options['verbosity'] > 1:
+                    self.stdout.write(f'  {str(queryset.query)}')
+                    self.stdout.write('  ' + plan.replace('\n', '\n  '))
+
+            transaction.set_rollback(True)
+
+        if flagged and options['fail_on_seq_scan']:
+            raise CommandError(f'{len(flagged)} query(ies) use a sequential scan')
+
+    def seed(self, ticket_count, message_count):
+        """Create users, agents, tickets and messages; return the users the queries run as."""
+        rng = random.Random(0)
+        tag = random.getrandbits(32)
+
+        def make_users(prefix, count, **fields):
+            return User.objects.bulk_create([
+                User(email=f'{prefix}{i}-{tag}@explain.invalid', password='!', **fields)
+                for i in range(count)
+            ])
+
+        admin = make_users('admin', 1, role=User.Role.ADMIN, is_staff=True)[0]
+        owners = make_users('owner', 20, role=User.Role.AGENT)
+        customers = make_users('customer', max(10, ticket_count // 10))
+
+        agents = Agent.objects.bulk_create([
+            Agent(user=owner, name=f'Agent {i}', is_active=bool(i % 4))
+            for i, owner in enumerate(owners * 5)
+        ])
+
+        Ticket.objects.bulk_create([
+            Ticket(
+                title=f'Ticket {i}',
+                description='Seeded by explain_queries',
+                status=rng.choice(Ticket.Status.values),
+                priority=rng.choice(Ticket.Priority.values),
+                customer=rng.choice(customers),
+                agent=rng.choice(agents + [None])
+            )
+            for i in range(ticket_count)
+        ], batch_size=1000)
+        update_search_index(Ticket.objects.all())
+
+        active_agents = [agent for agent in agents if agent.is_active]
+        conversations = Conversation.objects.bulk_create([
+            Conversation(agent=rng.choice(active_agents), user=customer)
+            for customer in customers
+        ])
+        messages = []
+        for i in range(message_count):
+            conversation = rng.choice(conversations)
+            from_user = i % 2 == 0
+            messages.append(Message(
+                agent=conversation.agent,
+                conversation=conversation,
+                user=conversation.user if from_user else None,
+                role=Message.Role.USER if from_user else Message.Role.ASSISTANT,
+                content=f'Message {i}'
+            ))
+        messages = Message.objects.bulk_create(messages, batch_size=1000)
+        GenerationJob.objects.bulk_create([
+            GenerationJob(
+                message=message,
+                status=rng.choice(GenerationJob.Status.values)
+            )
+            for message in messages
+            if message.role == Message.Role.USER
+        ], batch_size=1000)
+
+        return {
+            'admin': admin,
+            'owner': agents[0].user,
+            'customer': conversations[0].user,
+            'agent': conversations[0].agent,
+        }
+
+    def analyze(self):
+        """Refresh planner statistics so the plans reflect the seeded data."""
+        if connection.vendor in ('postgresql', 'sqlite'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def get_view_queryset(self, viewset, user, params=None, **kwargs):
+        """Return the page query a list request to ``viewset`` would run."""
+        request = Request(APIRequestFactory().get('/', params or {}))
+        request.user = user
+        view = viewset(request=request, kwargs=kwargs, format_kwarg=None, action='list')
+        queryset = view.filter_queryset(view.get_queryset())
+
+        paginator = view.paginator
+        if isinstance(paginator, KeysetPagination):
+            field, descending = paginator.get_ordering(request, queryset, view)
+            prefix = '-' if descending else ''
+            return queryset.order_by(f'{prefix}{field}', f'{prefix}id')[:paginator.page_size + 1]
+        if paginator is not None:
+            return queryset[:paginator.page_size]
+        return queryset
+
+    def get_queries(self, users):
+        admin, owner, customer, agent = (
+            users['admin'], users['owner'], users['customer'], users['agent']
+        )
+        return [
+            ('tickets: admin list', self.get_view_queryset(TicketViewSet, admin)),
+            ('tickets: customer list', self.get_view_queryset(TicketViewSet, customer)),
+            ('tickets: agent list', self.get_view_queryset(TicketViewSet, owner)),
+            ('tickets: by status and priority', self.get_view_queryset(
+                TicketViewSet, admin, {'status': Ticket.Status.OPEN, 'priority': Ticket.Priority.HIGH}
+            )),
+            ('tickets: search', self.get_view_queryset(
+                TicketViewSet, admin, {'search': 'seeded tick'}
+            )),
+            ('tickets: by customer', self.get_view_queryset(
+                TicketViewSet, admin, {'customer': customer.id}
+            )),
+            ('agents: own list', self.get_view_queryset(AgentViewSet, owner)),
+            ('agents: own active', Agent.objects.filter(user=owner, is_active=True)),
+            ('messages: admin list', self.get_view_queryset(
+                MessageViewSet, admin, agent_pk=agent.id
+            )),
+            ('messages: customer list', self.get_view_queryset(
+                MessageViewSet, customer, agent_pk=agent.id
+            )),
+            ('messages: sent by user', Message.objects.filter(
+                agent=agent, user=customer
+            ).order_by('-created_at')[:20]),
+            ('conversations: latest', Conversation.objects.filter(
+                agent=agent, user=customer
+            ).order_by('-created_at')[:1]),
+            ('generation jobs: claim', GenerationJob.objects.filter(
+                status=GenerationJob.Status.PENDING
+            ).order_by('created_at')[:10]),
+        ]
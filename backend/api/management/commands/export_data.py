@@ -0,0 +1,94 @@
+from django.core.management.base import BaseCommand, CommandError
+from django_filters.filterset import filterset_factory
+
+from api.exports import FORMATS, MESSAGE_COLUMNS, TICKET_COLUMNS, encode_export, iter_rows, iter_transcript
+from api.models import ArchivedMessageBlock, Message, Ticket
+from api.search import is_supported, search_tickets
+
+# The filters of TicketViewSet
+FILTER_FIELDS = ['status', 'priority', 'agent', 'customer']
+
+
+class Command(BaseCommand):
+    help = 'Stream tickets or chat transcripts to a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['tickets', 'messages'], help='What to export')
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default='csv',
+            help='Output format (default: csv)'
+        )
+        parser.add_argument(
+            '--output',
+            default='-',
+            help="File to write, or '-' for standard output (the default)"
+        )
+        parser.add_argument('--status', help='Tickets: only this status')
+        parser.add_argument('--priority', help='Tickets: only this priority')
+        parser.add_argument('--customer', help='Tickets: only this customer id')
+        parser.add_argument('--search', help='Tickets: full-text search, ordered by relevance')
+        parser.add_argument('--agent', help='Only tickets or messages of this agent id (required for messages)')
+        parser.add_argument('--conversation', type=int, help='Messages: only this conversation')
+        parser.add_argument(
+            '--no-archived',
+            action='store_true',
+            help='Messages: leave out archived messages'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Rows fetched and written at a time (default: EXPORT_CHUNK_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        if options['kind'] == 'tickets':
+            columns = TICKET_COLUMNS
+            rows = iter_rows(self.get_tickets(options), columns, options['chunk_size'])
+        else:
+            columns = MESSAGE_COLUMNS
+            rows = self.get_messages(options)
+
+        chunks = encode_export(options['format'], columns, rows, options['chunk_size'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Exported {options['kind']} to {options['output']}"))
+
+    def get_tickets(self, options):
+        """Tickets matching the same filters as `GET /api/tickets/`."""
+        queryset = Ticket.objects.order_by('-created_at')
+        params = {
+            name: options[name] for name in FILTER_FIELDS
+            if options[name] is not None
+        }
+        filterset = filterset_factory(Ticket, fields=FILTER_FIELDS)(data=params, queryset=queryset)
+        if not filterset.is_valid():
+            raise CommandError(f'Invalid filter: {filterset.errors.as_text()}')
+        queryset = filterset.qs
+        if options['search']:
+            if not is_supported():
+                raise CommandError('--search is not supported on this database')
+            queryset = search_tickets(queryset, options['search']).order_by('-search_rank', '-created_at')
+        return queryset
+
+    def get_messages(self, options):
+        if not options['agent']:
+            raise CommandError('--agent is required to export messages')
+        try:
+            agent_id = int(options['agent'])
+        except ValueError:
+            raise CommandError('--agent must be an agent id')
+        messages = Message.objects.filter(agent_id=agent_id)
+        blocks = ArchivedMessageBlock.objects.filter(agent_id=agent_id)
+        if options['conversation']:
+            messages = messages.filter(conversation_id=options['conversation'])
+            blocks = blocks.filter(conversation_id=options['conversation'])
+        if options['no_archived']:
+            blocks = None
+        return iter_transcript(messages, blocks, options['chunk_size'])
@@ -0,0 +1,57 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import FORMATS, detect_format, import_tickets
+
+
+class Command(BaseCommand):
+    help = 'Import tickets (and create their customers) from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help="File to import, or '-' to read from standard input"
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Input format (default: guessed from the file extension)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Rows inserted per transaction (default: TICKET_IMPORT_BATCH_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        if fmt is None:
+            raise CommandError('Cannot guess the format of the file; pass --format')
+
+        def report(result):
+            self.stdout.write(
+                f'{result.processed} row(s) processed: {result.created} ticket(s) created, '
+                f'{result.customers_created} customer(s) created, {result.failed} failed'
+            )
+
+        if path == '-':
+            result = import_tickets(sys.stdin, fmt, options['batch_size'], on_progress=report)
+        else:
+            try:
+                with open(path, encoding='utf-8-sig', newline='') as f:
+                    result = import_tickets(f, fmt, options['batch_size'], on_progress=report)
+            except OSError as e:
+                raise CommandError(f'Cannot read {path}: {str(e)}')
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        if result.failed > len(result.errors):
+            self.stderr.write(f'... and {result.failed - len(result.errors)} more error(s)')
+
+        style = self.style.WARNING if result.failed else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Imported {result.created} ticket(s) and {result.customers_created} new customer(s); '
+            f'{result.failed} row(s) failed'
+        ))
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.knowledge import claim_next_document, ingest_document, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Chunk, embed and index pending knowledge base documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process all pending documents and exit instead of polling forever'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds to sleep when there is nothing to process (default: 5.0)'
+        )
+        parser.add_argument(
+            '--rebuild',
+            type=int,
+            metavar='AGENT_ID',
+            help='Rebuild the index of one agent from stored embeddings and exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild'] is not None:
+            rebuild_index(options['rebuild'])
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt knowledge index for agent {options['rebuild']}"))
+            return
+
+        processed = 0
+        try:
+            while True:
+                close_old_connections()
+                document = claim_next_document()
+
+                if document is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                document = ingest_document(document)
+                processed += 1
+                self.stdout.write(f'{document}: {document.chunk_count} chunk(s)')
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} document(s)'))
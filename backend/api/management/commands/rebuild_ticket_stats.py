@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the ticket statistics rollup from the tickets'
+
+    def handle(self, *args, **options):
+        rows = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ticket statistics ({rows} rollup row(s))'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from api.assignment import rebuild_load, route_tickets
+from api.models import Ticket
+
+
+class Command(BaseCommand):
+    help = 'Assign unassigned open tickets to agents by load, and optionally recount agent loads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help="Recount every agent's open tickets before routing"
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Tickets assigned per transaction (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rebuild_load()
+            self.stdout.write('Recounted open tickets per agent')
+
+        total = 0
+        while True:
+            routed = route_tickets(Ticket.objects.all(), limit=options['batch_size'])
+            if not routed:
+                break
+            total += len(routed)
+            self.stdout.write(f'Assigned {total} ticket(s)')
+
+        self.stdout.write(self.style.SUCCESS(f'Routed {total} ticket(s)'))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Process queued agent reply generation jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process all pending jobs and exit instead of polling forever'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to sleep when the queue is empty (default: 1.0)'
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        self.stdout.write('Generation worker started')
+
+        try:
+            while True:
+                close_old_connections()
+                job = claim_next_job()
+
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                job = run_job(job)
+                processed += 1
+                self.stdout.write(f'{job}')
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} job(s)'))
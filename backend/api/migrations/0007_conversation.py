@@ -0,0 +1,76 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_conversations(apps, schema_editor):
+    """
+    Group existing user messages into one conversation per (agent, user).
+
+    Assistant replies saved before conversations existed were not linked to a
+    user, so they cannot be attributed and are left without a conversation.
+    """
+    Conversation = apps.get_model('api', 'Conversation')
+    Message = apps.get_model('api', 'Message')
+
+    pairs = (
+        Message.objects.filter(user__isnull=False, conversation__isnull=True)
+        .order_by()
+        .values_list('agent_id', 'user_id')
+        .distinct()
+    )
+    for agent_id, user_id in pairs:
+        conversation = Conversation.objects.create(agent_id=agent_id, user_id=user_id)
+        Message.objects.filter(
+            agent_id=agent_id,
+            user_id=user_id,
+            conversation__isnull=True
+        ).update(conversation=conversation)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0006_generationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='agent',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to='api.agent'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='api.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at'], name='api_msg_conv_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['agent', 'user', '-created_at'], name='api_conv_agent_user_idx'),
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_conversation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='summarized_through',
+            field=models.ForeignKey(blank=True, help_text='Last message folded into the summary', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.message'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary',
+            field=models.TextField(blank=True, help_text='Rolling summary of the turns no longer sent verbatim to the model'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='summary_token_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='token_count',
+            field=models.PositiveIntegerField(blank=True, help_text='Cached token count of the message, including per-message overhead', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_context_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='cache_responses',
+            field=models.BooleanField(default=False, help_text='Reuse earlier replies to identical prompts instead of calling the model'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_agent_cache_responses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='semantic_cache_enabled',
+            field=models.BooleanField(default=False, help_text='Reuse earlier answers to similar opening questions instead of calling the model'),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='semantic_cache_threshold',
+            field=models.FloatField(default=0.92, help_text='Minimum cosine similarity (0.0 to 1.0) for a semantic cache hit'),
+        ),
+    ]
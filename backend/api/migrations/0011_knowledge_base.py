@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_agent_semantic_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KnowledgeDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255)),
+                ('file', models.FileField(blank=True, help_text='Plain text or markdown file to index', upload_to='knowledge/%Y/%m/')),
+                ('content', models.TextField(blank=True, help_text='Document text; read from the uploaded file when empty')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('READY', 'Ready'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('error', models.TextField(blank=True)),
+                ('chunk_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to='api.agent')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='KnowledgeChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordinal', models.PositiveIntegerField()),
+                ('content', models.TextField()),
+                ('embedding', models.BinaryField(help_text='float32 embedding vector')),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='knowledge_chunks', to='api.agent')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='api.knowledgedocument')),
+            ],
+            options={
+                'ordering': ['document', 'ordinal'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='knowledgedocument',
+            index=models.Index(fields=['status', 'created_at'], name='api_kbdoc_status_created_idx'),
+        ),
+    ]
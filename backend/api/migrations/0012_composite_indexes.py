@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_knowledge_base'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agent',
+            index=models.Index(fields=['user', 'is_active'], name='api_agent_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['agent', 'created_at'], name='api_msg_agent_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['agent', 'user', 'created_at'], name='api_msg_agent_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['-created_at', '-id'], name='api_ticket_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['status', 'priority', '-created_at'], name='api_ticket_status_prio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['customer', '-created_at'], name='api_ticket_customer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['agent', '-created_at'], name='api_ticket_agent_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE api_ticket ADD COLUMN search_vector tsvector')
+        schema_editor.execute(
+            'CREATE INDEX api_ticket_search_idx ON api_ticket USING GIN (search_vector)'
+        )
+        schema_editor.execute("""
+            UPDATE api_ticket t SET search_vector =
+                setweight(to_tsvector('english', coalesce(t.title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(t.description, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(
+                    (SELECT email FROM users_user WHERE id = t.customer_id), ''
+                )), 'C') ||
+                setweight(to_tsvector('simple', coalesce(
+                    (SELECT name FROM api_agent WHERE id = t.agent_id), ''
+                )), 'C')
+        """)
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE api_ticket_fts USING fts5('
+            "title, description, customer_email, agent_name, tokenize='porter unicode61')"
+        )
+        schema_editor.execute("""
+            INSERT INTO api_ticket_fts (rowid, title, description, customer_email, agent_name)
+            SELECT t.id, t.title, t.description, u.email, coalesce(a.name, '')
+            FROM api_ticket t
+            JOIN users_user u ON u.id = t.customer_id
+            LEFT JOIN api_agent a ON a.id = t.agent_id
+        """)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS api_ticket_search_idx')
+        schema_editor.execute('ALTER TABLE api_ticket DROP COLUMN IF EXISTS search_vector')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS api_ticket_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_composite_indexes'),
+        ('users', '0002_user_role_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
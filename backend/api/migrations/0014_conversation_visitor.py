@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_ticket_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='visitor_id',
+            field=models.CharField(blank=True, help_text='Anonymous widget visitor this conversation belongs to', max_length=32),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['agent', 'visitor_id', '-created_at'], name='api_conv_agent_visitor_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def count_open_tickets(apps, schema_editor):
+    Agent = apps.get_model('api', 'Agent')
+    AgentLoad = apps.get_model('api', 'AgentLoad')
+    Ticket = apps.get_model('api', 'Ticket')
+    counts = dict(
+        Ticket.objects.filter(agent__isnull=False, status__in=['OPEN', 'IN_PROGRESS'])
+        .order_by().values('agent_id').annotate(count=models.Count('id'))
+        .values_list('agent_id', 'count')
+    )
+    AgentLoad.objects.bulk_create([
+        AgentLoad(agent_id=agent_id, open_tickets=counts.get(agent_id, 0))
+        for agent_id in Agent.objects.values_list('id', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_conversation_visitor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentLoad',
+            fields=[
+                ('agent', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='load', serialize=False, to='api.agent')),
+                ('open_tickets', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_open_tickets, migrations.RunPython.noop),
+    ]
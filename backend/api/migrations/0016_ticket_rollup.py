@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_rollup(apps, schema_editor):
+    Ticket = apps.get_model('api', 'Ticket')
+    TicketRollup = apps.get_model('api', 'TicketRollup')
+    rows = Ticket.objects.order_by().values('agent_id', 'status', 'priority').annotate(
+        ticket_count=models.Count('id'),
+        resolved_count=models.Count('closed_at'),
+        resolution=models.Sum(models.ExpressionWrapper(
+            models.F('closed_at') - models.F('created_at'), output_field=models.DurationField()
+        ))
+    )
+    TicketRollup.objects.bulk_create([
+        TicketRollup(
+            agent_id=row['agent_id'],
+            status=row['status'],
+            priority=row['priority'],
+            count=row['ticket_count'],
+            resolved=row['resolved_count'],
+            resolution_seconds=row['resolution'].total_seconds() if row['resolution'] else 0.0
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_agent_load'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('OPEN', 'Open'), ('IN_PROGRESS', 'In Progress'), ('RESOLVED', 'Resolved'), ('CLOSED', 'Closed')], max_length=20)),
+                ('priority', models.CharField(choices=[('LOW', 'Low'), ('MEDIUM', 'Medium'), ('HIGH', 'High'), ('URGENT', 'Urgent')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('resolved', models.IntegerField(default=0)),
+                ('resolution_seconds', models.FloatField(default=0)),
+                ('agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ticket_rollups', to='api.agent')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ticketrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('agent__isnull', False)), fields=('agent', 'status', 'priority'), name='api_rollup_agent_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='ticketrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('agent__isnull', True)), fields=('status', 'priority'), name='api_rollup_unassigned_uniq'),
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
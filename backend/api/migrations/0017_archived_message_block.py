@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 07:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0016_ticket_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMessageBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(help_text='Segment file, relative to MESSAGE_ARCHIVE_ROOT', max_length=255)),
+                ('offset', models.BigIntegerField(help_text='Byte offset of the block in the segment')),
+                ('length', models.PositiveIntegerField(help_text='Compressed size of the block in bytes')),
+                ('compression', models.CharField(max_length=10)),
+                ('message_count', models.PositiveIntegerField()),
+                ('first_created_at', models.DateTimeField()),
+                ('last_created_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_message_blocks', to='api.agent')),
+                ('conversation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_message_blocks', to='api.conversation')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_message_blocks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['first_created_at'],
+                'indexes': [models.Index(fields=['agent', 'last_created_at'], name='api_archive_agent_last_idx'), models.Index(fields=['conversation', 'last_created_at'], name='api_archive_conv_last_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def reindex_tickets(apps, schema_editor):
+    # Index every field with the query config, and emails as their words
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("""
+        UPDATE api_ticket t SET search_vector =
+            setweight(to_tsvector('english', coalesce(t.title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(t.description, '')), 'B') ||
+            setweight(to_tsvector('english', regexp_replace(coalesce(
+                (SELECT email FROM users_user WHERE id = t.customer_id), ''
+            ), '[^[:alnum:]_]+', ' ', 'g')), 'C') ||
+            setweight(to_tsvector('english', coalesce(
+                (SELECT name FROM api_agent WHERE id = t.agent_id), ''
+            )), 'C')
+    """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_archived_message_block'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_tickets, migrations.RunPython.noop),
+    ]
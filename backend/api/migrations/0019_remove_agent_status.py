@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 09:06
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_reindex_ticket_search'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='agent',
+            name='status',
+        ),
+    ]
@@ -1,11 +1,16 @@
 from django.db import models
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
-import openai
 from django.utils import timezone
 
+from .cache import response_cache
+from .context import ContextBuilder
+from .llm import get_provider
+from .semantic_cache import semantic_cache
+
 class Agent(models.Model):
     """Model representing a support agent."""
+    # Presence, derived from heartbeats (see api.presence)
     class Status(models.TextChoices):
         ONLINE = 'ONLINE', _('Online')
         OFFLINE = 'OFFLINE', _('Offline')
@@ -19,11 +24,6 @@ class Agent(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     is_active = models.BooleanField(default=True)
-    status = models.CharField(
-        max_length=10,
-        choices=Status.choices,
-        default=Status.OFFLINE
-    )
     model = models.CharField(
         max_length=100, 
         default='gpt-4', 
@@ -50,14 +50,29 @@ class Agent(models.Model):
         help_text='Configuration for the chat widget (colors, position, etc.)',
         blank=True
     )
+    cache_responses = models.BooleanField(
+        default=False,
+        help_text='Reuse earlier replies to identical prompts instead of calling the model'
+    )
+    semantic_cache_enabled = models.BooleanField(
+        default=False,
+        help_text='Reuse earlier answers to similar opening questions instead of calling the model'
+    )
+    semantic_cache_threshold = models.FloatField(
+        default=0.92,
+        help_text='Minimum cosine similarity (0.0 to 1.0) for a semantic cache hit'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
-        return f"{self.name} ({self.get_status_display()})"
+        return self.name
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['user', 'is_active'], name='api_agent_user_active_idx'),
+        ]
 
 
 class Ticket(models.Model):
@@ -102,15 +117,149 @@ class Ticket(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     closed_at = models.DateTimeField(null=True, blank=True)
     
+    COUNTED_FIELDS = ('agent_id', 'status', 'priority', 'created_at', 'closed_at')
+    
     def __str__(self):
         return f"{self.title} - {self.get_status_display()}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the agent load counters and statistics were based on
+        if all(field in field_names for field in cls.COUNTED_FIELDS):
+            instance._loaded_values = instance.get_counted_values()
+        return instance
+    
+    def get_counted_values(self):
+        """Values the agent load counters (api.assignment) and statistics (api.stats) depend on."""
+        return {field: getattr(self, field) for field in self.COUNTED_FIELDS}
+    
     class Meta:
         ordering = ['-created_at']
         permissions = [
             ('can_assign_ticket', 'Can assign ticket to agents'),
             ('can_close_ticket', 'Can close tickets'),
         ]
+        # Keyset pagination orders by (created_at, id); each branch of the
+        # non-admin OR filter gets its own index so they can be combined
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='api_ticket_created_idx'),
+            models.Index(fields=['status', 'priority', '-created_at'], name='api_ticket_status_prio_idx'),
+            models.Index(fields=['customer', '-created_at'], name='api_ticket_customer_idx'),
+            models.Index(fields=['agent', '-created_at'], name='api_ticket_agent_idx'),
+        ]
+
+
+class AgentLoad(models.Model):
+    """
+    Number of open tickets assigned to an agent, maintained incrementally by
+    ``api.assignment`` so ticket routing never has to count them.
+    """
+    agent = models.OneToOneField(
+        Agent,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='load'
+    )
+    open_tickets = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.agent_id}: {self.open_tickets} open ticket(s)"
+
+
+class TicketRollup(models.Model):
+    """
+    Ticket counts and resolution times per agent, status and priority,
+    maintained incrementally by ``api.stats`` for the dashboard.
+    """
+    agent = models.ForeignKey(
+        Agent,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='ticket_rollups'
+    )
+    status = models.CharField(max_length=20, choices=Ticket.Status.choices)
+    priority = models.CharField(max_length=10, choices=Ticket.Priority.choices)
+    count = models.IntegerField(default=0)
+    # Tickets with a closed_at, and the total seconds from creation to closing
+    resolved = models.IntegerField(default=0)
+    resolution_seconds = models.FloatField(default=0)
+    
+    def __str__(self):
+        return f"{self.agent_id or 'Unassigned'} {self.status} {self.priority}: {self.count}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['agent', 'status', 'priority'],
+                condition=models.Q(agent__isnull=False),
+                name='api_rollup_agent_uniq'
+            ),
+            models.UniqueConstraint(
+                fields=['status', 'priority'],
+                condition=models.Q(agent__isnull=True),
+                name='api_rollup_unassigned_uniq'
+            ),
+        ]
+
+
+class ConversationQuerySet(models.QuerySet):
+    def latest_for(self, agent, user):
+        """Return the user's most recent conversation with ``agent``, or None."""
+        return self.filter(agent=agent, user=user).order_by('-created_at').first()
+    
+    def latest_for_visitor(self, agent, visitor_id):
+        """Return an anonymous visitor's most recent conversation with ``agent``, or None."""
+        return self.filter(agent=agent, visitor_id=visitor_id).order_by('-created_at').first()
+
+
+class Conversation(models.Model):
+    """Model representing a chat session between a user and an agent."""
+    agent = models.ForeignKey(
+        Agent,
+        on_delete=models.CASCADE,
+        related_name='conversations'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='conversations',
+        null=True,
+        blank=True
+    )
+    visitor_id = models.CharField(
+        max_length=32,
+        blank=True,
+        help_text='Anonymous widget visitor this conversation belongs to'
+    )
+    summary = models.TextField(
+        blank=True,
+        help_text='Rolling summary of the turns no longer sent verbatim to the model'
+    )
+    summary_token_count = models.PositiveIntegerField(default=0)
+    summarized_through = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True,
+        blank=True,
+        help_text='Last message folded into the summary'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = ConversationQuerySet.as_manager()
+    
+    def __str__(self):
+        return f"Conversation {self.id} with {self.agent.name}"
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['agent', 'user', '-created_at'], name='api_conv_agent_user_idx'),
+            models.Index(fields=['agent', 'visitor_id', '-created_at'], name='api_conv_agent_visitor_idx'),
+        ]
 
 
 class Message(models.Model):
@@ -119,16 +268,30 @@ class Message(models.Model):
         USER = 'user', _('User')
         ASSISTANT = 'assistant', _('Assistant')
     
+    ERROR_RESPONSE = "I'm sorry, I encountered an error while processing your message."
+    
     agent = models.ForeignKey(
         Agent,
         on_delete=models.CASCADE,
         related_name='messages'
     )
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='messages',
+        null=True,
+        blank=True
+    )
     content = models.TextField()
     role = models.CharField(
         max_length=10,
         choices=Role.choices
     )
+    token_count = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text='Cached token count of the message, including per-message overhead'
+    )
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -142,50 +305,306 @@ class Message(models.Model):
     def __str__(self):
         return f"{self.role.upper()}: {self.content[:50]}{'...' if len(self.content) > 50 else ''}"
     
-    def generate_agent_response(self):
-        """Generate a response from the agent based on the user's message."""
-        if self.role != 'user' or not hasattr(self, 'agent'):
-            return None
-            
-        try:
-            # Get the conversation history
-            messages = Message.objects.filter(
-                agent=self.agent,
-                created_at__lte=self.created_at
-            ).order_by('created_at')
-            
-            # Prepare conversation history for the AI
-            conversation = []
-            for msg in messages:
-                if msg.role == 'user':
-                    conversation.append({"role": "user", "content": msg.content})
-                else:
-                    conversation.append({"role": "assistant", "content": msg.content})
-            
-            # Add system prompt if available
-            if self.agent.prompt:
-                conversation.insert(0, {"role": "system", "content": self.agent.prompt})
-            
-            # Initialize the OpenAI client
-            client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-            
-            # Call the OpenAI API
-            response = client.chat.completions.create(
+    def build_conversation(self, builder=None):
+        """Build the list of chat messages sent to the LLM for this message."""
+        return (builder or ContextBuilder(self)).build()
+    
+    def get_generation_kwargs(self, builder=None):
+        """Keyword arguments passed to the LLM provider for this message."""
+        return {
+            'model': self.agent.model,
+            'messages': self.build_conversation(builder),
+            'temperature': float(self.agent.temperature),
+            'max_tokens': int(self.agent.max_tokens),
+        }
+    
+    def save_agent_response(self, content):
+        """Store ``content`` as the agent's reply to this message."""
+        return Message.objects.create(
+            agent=self.agent,
+            conversation=self.conversation,
+            content=content,
+            role='assistant',
+            user=None  # System-generated message
+        )
+    
+    def get_embedding(self):
+        """
+        Embedding of the message's content, computed once per turn and shared
+        by knowledge retrieval and the semantic cache.
+        """
+        if getattr(self, '_embedding', None) is None:
+            self._embedding = get_provider().embed([self.content])[0]
+        return self._embedding
+    
+    def get_cached_response(self, builder):
+        """
+        Look this turn up in the agent's reply caches.
+        
+        Checks the exact-match cache, then the semantic cache for opening
+        questions, before ``builder`` builds the context, so a hit skips the
+        knowledge retrieval and summary calls. Returns ``(content,
+        remember)``: the cached reply (or None) and a callable that stores a
+        freshly generated reply in the caches that missed.
+        """
+        cache_key = None
+        embedding = None
+        
+        if self.agent.cache_responses:
+            cache_key = response_cache.make_key(
+                self.agent,
                 model=self.agent.model,
-                messages=conversation,
+                messages=builder.get_cache_messages(),
                 temperature=float(self.agent.temperature),
                 max_tokens=int(self.agent.max_tokens)
             )
+            content = response_cache.get(cache_key)
+            if content:
+                return content, lambda content: None
+        
+        if self.agent.semantic_cache_enabled and builder.is_opening_turn():
+            try:
+                embedding = self.get_embedding()
+                content = semantic_cache.lookup(self.agent, embedding)
+            except Exception as e:
+                print(f"Error querying semantic cache: {str(e)}")
+                embedding = content = None
+            if content:
+                if cache_key:
+                    response_cache.set(cache_key, content)
+                return content, lambda content: None
+        
+        def remember(content):
+            if cache_key:
+                response_cache.set(cache_key, content)
+            if embedding is not None:
+                try:
+                    semantic_cache.add(self.agent, self.content, embedding, content)
+                except Exception as e:
+                    print(f"Error updating semantic cache: {str(e)}")
+        
+        return None, remember
+    
+    def generate_agent_response(self, fail_silently=True):
+        """
+        Generate a response from the agent based on the user's message.
+        
+        Provider errors give the generic error reply, or are raised with
+        ``fail_silently=False`` so the job queue can retry them.
+        """
+        if self.role != 'user' or not hasattr(self, 'agent'):
+            return None
+            
+        try:
+            builder = ContextBuilder(self)
+            content, remember = self.get_cached_response(builder)
+            if content:
+                return content
             
-            # Extract and return the response
-            if response.choices and len(response.choices) > 0:
-                return response.choices[0].message.content.strip()
+            content = get_provider().complete(**self.get_generation_kwargs(builder))
+            if content:
+                remember(content)
+                return content
                 
         except Exception as e:
+            if not fail_silently:
+                raise
             print(f"Error generating agent response: {str(e)}")
-            return "I'm sorry, I encountered an error while processing your message."
+            return self.ERROR_RESPONSE
             
         return "I'm not sure how to respond to that."
     
+    def stream_agent_response(self):
+        """
+        Generate a response from the agent, yielding text deltas as they arrive.
+        
+        Mirrors ``generate_agent_response``: if the provider fails before
+        producing any output, the generic error reply is yielded instead.
+        """
+        if self.role != 'user' or not hasattr(self, 'agent'):
+            return
+        
+        emitted = False
+        try:
+            builder = ContextBuilder(self)
+            content, remember = self.get_cached_response(builder)
+            if content:
+                yield content
+                return
+            
+            parts = []
+            for delta in get_provider().stream(**self.get_generation_kwargs(builder)):
+                emitted = True
+                parts.append(delta)
+                yield delta
+            
+            content = ''.join(parts).strip()
+            if content:
+                remember(content)
+        except Exception as e:
+            print(f"Error streaming agent response: {str(e)}")
+            if not emitted:
+                yield self.ERROR_RESPONSE
+    
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'created_at'], name='api_msg_conv_created_idx'),
+            models.Index(fields=['agent', 'created_at'], name='api_msg_agent_created_idx'),
+            models.Index(fields=['agent', 'user', 'created_at'], name='api_msg_agent_user_idx'),
+        ]
+
+
+class GenerationJob(models.Model):
+    """Queued request to generate the agent's reply to a user message."""
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', _('Pending')
+        RUNNING = 'RUNNING', _('Running')
+        COMPLETED = 'COMPLETED', _('Completed')
+        FAILED = 'FAILED', _('Failed')
+    
+    message = models.OneToOneField(
+        Message,
+        on_delete=models.CASCADE,
+        related_name='generation_job'
+    )
+    response = models.OneToOneField(
+        Message,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True,
+        blank=True
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Job {self.id} for message {self.message_id} ({self.get_status_display()})"
+    
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.COMPLETED, self.Status.FAILED)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='api_genjob_status_created_idx'),
+        ]
+
+
+class ArchivedMessageBlock(models.Model):
+    """
+    Index entry for a compressed block of archived messages of one agent,
+    conversation and sender, stored in a segment file (see ``api.archive``).
+    """
+    agent = models.ForeignKey(
+        Agent,
+        on_delete=models.CASCADE,
+        related_name='archived_message_blocks'
+    )
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='archived_message_blocks',
+        null=True,
+        blank=True
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='archived_message_blocks',
+        null=True,
+        blank=True
+    )
+    path = models.CharField(max_length=255, help_text='Segment file, relative to MESSAGE_ARCHIVE_ROOT')
+    offset = models.BigIntegerField(help_text='Byte offset of the block in the segment')
+    length = models.PositiveIntegerField(help_text='Compressed size of the block in bytes')
+    compression = models.CharField(max_length=10)
+    message_count = models.PositiveIntegerField()
+    first_created_at = models.DateTimeField()
+    last_created_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.message_count} archived messages of agent {self.agent_id} in {self.path}"
+    
+    class Meta:
+        ordering = ['first_created_at']
+        indexes = [
+            models.Index(fields=['agent', 'last_created_at'], name='api_archive_agent_last_idx'),
+            models.Index(fields=['conversation', 'last_created_at'], name='api_archive_conv_last_idx'),
+        ]
+
+
+class KnowledgeDocument(models.Model):
+    """Model representing a document in an agent's knowledge base."""
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', _('Pending')
+        PROCESSING = 'PROCESSING', _('Processing')
+        READY = 'READY', _('Ready')
+        FAILED = 'FAILED', _('Failed')
+    
+    agent = models.ForeignKey(
+        Agent,
+        on_delete=models.CASCADE,
+        related_name='documents'
+    )
+    title = models.CharField(max_length=255)
+    file = models.FileField(
+        upload_to='knowledge/%Y/%m/',
+        blank=True,
+        help_text='Plain text or markdown file to index'
+    )
+    content = models.TextField(
+        blank=True,
+        help_text='Document text; read from the uploaded file when empty'
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING
+    )
+    error = models.TextField(blank=True)
+    chunk_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.title} ({self.get_status_display()})"
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='api_kbdoc_status_created_idx'),
+        ]
+
+
+class KnowledgeChunk(models.Model):
+    """A retrievable passage of a knowledge base document and its embedding."""
+    document = models.ForeignKey(
+        KnowledgeDocument,
+        on_delete=models.CASCADE,
+        related_name='chunks'
+    )
+    agent = models.ForeignKey(
+        Agent,
+        on_delete=models.CASCADE,
+        related_name='knowledge_chunks'
+    )
+    ordinal = models.PositiveIntegerField()
+    content = models.TextField()
+    embedding = models.BinaryField(help_text='float32 embedding vector')
+    
+    def __str__(self):
+        return f"{self.document.title} #{self.ordinal}"
+    
+    class Meta:
+        ordering = ['document', 'ordinal']
@@ -0,0 +1,218 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .archive import attach_users, load_messages
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on (ordering field, id).
+
+    Pages are fetched with an indexed range scan from the last row seen
+    instead of an OFFSET, and no COUNT(*) is run, so every page costs the same
+    however deep it is. Cursors are opaque and work in both directions:
+    ``next`` continues after the last row of the page, ``previous`` goes back
+    from its first row.
+
+    The ordering field comes from the view's ``OrderingFilter`` (or its
+    ``ordering``) and must be non-nullable; ``id`` breaks ties. It may be an
+    annotation, such as the ``search_rank`` of a ticket search.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    # Start from the end of the ordering when no cursor is given (e.g. the
+    # newest page of a chat transcript), then page backward with `previous`.
+    start_at_end = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.view = view
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, queryset, view)
+
+        cursor = self.decode_cursor(request, queryset)
+        if cursor is None:
+            position, reverse = None, self.start_at_end
+        else:
+            position, reverse = cursor[:2], cursor[2]
+
+        # Walking backward is walking forward in the opposite order
+        descending = self.descending != reverse
+        rows = self.fetch_rows(queryset, position, descending)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_previous = has_more
+            self.has_next = position is not None
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = rows
+        return rows
+
+    def fetch_rows(self, queryset, position, descending):
+        """Return up to ``page_size + 1`` rows past ``position`` in the given direction."""
+        if position is not None:
+            lookup = 'lt' if descending else 'gt'
+            value, pk = position
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value}) |
+                Q(**{self.field: value, f'id__{lookup}': pk})
+            )
+
+        prefix = '-' if descending else ''
+        return list(queryset.order_by(f'{prefix}{self.field}', f'{prefix}id')[:self.page_size + 1])
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, request, queryset, view):
+        """Return (field name, descending) for the requested ordering."""
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        else:
+            ordering = getattr(view, 'ordering', None)
+
+        if isinstance(ordering, str):
+            ordering = [ordering]
+        term = ordering[0] if ordering else self.ordering
+        return term.lstrip('-'), term.startswith('-')
+
+    def encode_cursor(self, row, reverse):
+        value = getattr(row, self.field)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        payload = json.dumps({'v': value, 'i': row.pk, 'r': int(reverse)}, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, queryset):
+        """Return (value, id, reverse) from the request's cursor, or None."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            value = payload['v']
+            try:
+                value = queryset.model._meta.get_field(self.field).to_python(value)
+            except FieldDoesNotExist:
+                # Annotations (e.g. a search rank) are stored as plain JSON values
+                pass
+            return value, int(payload['i']), bool(payload['r'])
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ChatHistoryPagination(KeysetPagination):
+    """Keyset pagination that opens on the newest page of a transcript."""
+    start_at_end = True
+
+
+class ArchivedHistoryPagination(ChatHistoryPagination):
+    """
+    Chat history pagination that reads through to archived messages (see
+    ``api.archive``). The view's ``get_archived_blocks()`` selects the blocks
+    the user may read; only blocks that can hold rows of the page are
+    opened, so pages within the live table cost one extra indexed query.
+    """
+
+    def fetch_rows(self, queryset, position, descending):
+        rows = super().fetch_rows(queryset, position, descending)
+        get_blocks = getattr(self.view, 'get_archived_blocks', None)
+        if get_blocks is None or self.field != 'created_at':
+            return rows
+
+        count = self.page_size + 1
+        blocks = get_blocks()
+        # Archived rows past the last live row fetched cannot be on the page
+        edge = rows[-1].created_at if len(rows) == count else None
+        if descending:
+            if position is not None:
+                blocks = blocks.filter(first_created_at__lte=position[0])
+            if edge is not None:
+                blocks = blocks.filter(last_created_at__gte=edge)
+            blocks = blocks.order_by('-last_created_at')
+        else:
+            if position is not None:
+                blocks = blocks.filter(last_created_at__gte=position[0])
+            if edge is not None:
+                blocks = blocks.filter(first_created_at__lte=edge)
+            blocks = blocks.order_by('first_created_at')
+
+        def key(message):
+            return message.created_at, message.id
+
+        def in_range(message):
+            if position is None:
+                return True
+            return key(message) < tuple(position) if descending else key(message) > tuple(position)
+
+        found = list(rows)
+        for block in blocks.iterator(chunk_size=50):
+            if len(found) >= count:
+                found.sort(key=key, reverse=descending)
+                del found[count:]
+                # Blocks come in order, so no later block can reach the page
+                last = found[-1].created_at
+                if (block.last_created_at < last) if descending else (block.first_created_at > last):
+                    break
+            found.extend(message for message in load_messages(block) if in_range(message))
+
+        found.sort(key=key, reverse=descending)
+        found = found[:count]
+        attach_users(found)
+        return found
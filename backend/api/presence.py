@@ -0,0 +1,69 @@
+"""
+Agent presence derived from heartbeats.
+
+Whoever is answering for an agent sends ``POST /api/agents/{id}/heartbeat/``
+every ``AGENT_HEARTBEAT_INTERVAL`` seconds, optionally reporting that they
+are busy. Each heartbeat is kept in the shared Django cache (process memory,
+or Redis when ``REDIS_URL`` is set) for ``AGENT_PRESENCE_TTL`` seconds, so an
+agent whose heartbeats stop drops to offline by itself:
+
+    ONLINE   a recent heartbeat
+    BUSY     a recent heartbeat reporting busy
+    OFFLINE  no heartbeat within AGENT_PRESENCE_TTL seconds
+
+Reading presence is a cache lookup (one ``get_many`` for any number of
+agents) and never writes to the database. Ticket routing
+(``api.assignment``) follows it too.
+"""
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Agent
+
+# Statuses a heartbeat may report; OFFLINE ends the presence instead
+HEARTBEAT_STATUSES = (Agent.Status.ONLINE, Agent.Status.BUSY)
+
+
+def get_interval():
+    return getattr(settings, 'AGENT_HEARTBEAT_INTERVAL', 30)
+
+
+def get_ttl():
+    return getattr(settings, 'AGENT_PRESENCE_TTL', 90)
+
+
+def presence_key(agent_id):
+    return f'presence:agent:{agent_id}'
+
+
+def record_heartbeat(agent_id, agent_status=Agent.Status.ONLINE):
+    """Record that ``agent_id`` is present with ``agent_status``, or going offline."""
+    if agent_status not in HEARTBEAT_STATUSES:
+        cache.delete(presence_key(agent_id))
+        return
+    cache.set(presence_key(agent_id), (agent_status, time.time()), timeout=get_ttl())
+
+
+def get_presence(agent_ids):
+    """Return ``{agent_id: {'status': ..., 'last_seen': ...}}`` with one cache read."""
+    keys = {presence_key(agent_id): agent_id for agent_id in agent_ids}
+    heartbeats = cache.get_many(keys)
+    presence = {}
+    for key, agent_id in keys.items():
+        agent_status, last_seen = heartbeats.get(key, (Agent.Status.OFFLINE, None))
+        presence[agent_id] = {
+            'status': agent_status,
+            'last_seen': datetime.fromtimestamp(last_seen, timezone.utc) if last_seen else None,
+        }
+    return presence
+
+
+def get_status(agent_id):
+    return get_presence([agent_id])[agent_id]['status']
+
+
+def is_online(agent_id):
+    return get_status(agent_id) == Agent.Status.ONLINE
@@ -0,0 +1,253 @@
+"""
+Real-time updates pushed to WebSocket clients.
+
+New messages and ticket changes are published to groups once their
+transaction commits:
+
+    conversation.<id>   messages created in a conversation
+    ticket.<id>         changes to one ticket
+    agent.<id>          changes to the tickets assigned to an agent
+    tickets             changes to any ticket (staff only)
+
+Clients connect to ``/ws/`` (see ``api.consumers``) and subscribe to the
+groups they may read. Events are encoded when published and sent as is to
+every subscriber of the group:
+
+    {"type": "message.created", "group": "conversation.3", "data": {...}}
+
+Groups are fanned out by a channel layer chosen with
+``REALTIME_CHANNEL_LAYER``: ``'memory'`` keeps subscriptions in the process,
+which is enough for a single server and for tests, and ``'redis'`` relays
+events through Redis pub/sub so every worker sees every event. Subscribers
+that fall ``REALTIME_QUEUE_SIZE`` events behind lose the oldest ones.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+TICKETS_GROUP = 'tickets'
+
+TICKET_EVENT_FIELDS = (
+    'id', 'title', 'status', 'priority', 'agent_id', 'customer_id', 'created_at', 'updated_at', 'closed_at'
+)
+
+
+def get_queue_size():
+    return getattr(settings, 'REALTIME_QUEUE_SIZE', 100)
+
+
+class Subscription:
+    """Events for one client, received on the event loop that created it."""
+
+    def __init__(self, layer):
+        self.layer = layer
+        self.groups = set()
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.maxsize = get_queue_size()
+
+    def put(self, text):
+        """Queue an event; safe to call from any thread."""
+        self.loop.call_soon_threadsafe(self._put, text)
+
+    def _put(self, text):
+        if self.queue.qsize() >= self.maxsize:
+            # Too slow to keep up: drop the oldest event
+            self.queue.get_nowait()
+        self.queue.put_nowait(text)
+
+    async def add(self, group):
+        self.groups.add(group)
+        self.layer.add(group, self)
+
+    async def discard(self, group):
+        self.groups.discard(group)
+        self.layer.discard(group, self)
+
+    async def receive(self):
+        """Wait for the next event, as encoded text."""
+        return await self.queue.get()
+
+    async def close(self):
+        for group in list(self.groups):
+            await self.discard(group)
+
+
+class InMemoryChannelLayer:
+    """Channel layer for a single process: subscriptions are kept in a dict."""
+
+    def __init__(self):
+        self.groups = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, group, text):
+        with self._lock:
+            subscriptions = list(self.groups.get(group, ()))
+        for subscription in subscriptions:
+            subscription.put(text)
+
+    def subscribe(self):
+        return Subscription(self)
+
+    def add(self, group, subscription):
+        with self._lock:
+            self.groups[group].add(subscription)
+
+    def discard(self, group, subscription):
+        with self._lock:
+            subscriptions = self.groups.get(group)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.groups[group]
+
+
+class RedisSubscription(Subscription):
+    """A subscription to Redis pub/sub channels, read by a background task."""
+
+    def __init__(self, layer):
+        super().__init__(layer)
+        self.pubsub = layer.get_async_client().pubsub(ignore_subscribe_messages=True)
+        self.reader = None
+
+    async def add(self, group):
+        self.groups.add(group)
+        await self.pubsub.subscribe(self.layer.channel_name(group))
+        if self.reader is None:
+            self.reader = asyncio.ensure_future(self.read())
+
+    async def discard(self, group):
+        self.groups.discard(group)
+        await self.pubsub.unsubscribe(self.layer.channel_name(group))
+
+    async def read(self):
+        while True:
+            message = await self.pubsub.get_message(timeout=None)
+            if message is not None and message['type'] == 'message':
+                data = message['data']
+                self._put(data.decode() if isinstance(data, bytes) else data)
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+        await self.pubsub.reset()
+
+
+class RedisChannelLayer:
+    """Channel layer shared by all workers through Redis pub/sub."""
+
+    prefix = 'realtime:'
+
+    def __init__(self, url):
+        import redis
+
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self.async_client = None
+
+    def channel_name(self, group):
+        return f'{self.prefix}{group}'
+
+    def get_async_client(self):
+        """Client for subscriptions, created on the server's event loop."""
+        if self.async_client is None:
+            import redis.asyncio
+
+            self.async_client = redis.asyncio.Redis.from_url(self.url)
+        return self.async_client
+
+    def publish(self, group, text):
+        self.client.publish(self.channel_name(group), text)
+
+    def subscribe(self):
+        return RedisSubscription(self)
+
+
+_layer = None
+_layer_lock = threading.Lock()
+
+
+def get_channel_layer():
+    """Return the process's channel layer, created on first use."""
+    global _layer
+    if _layer is None:
+        with _layer_lock:
+            if _layer is None:
+                if getattr(settings, 'REALTIME_CHANNEL_LAYER', 'memory') == 'redis':
+                    _layer = RedisChannelLayer(settings.REALTIME_REDIS_URL)
+                else:
+                    _layer = InMemoryChannelLayer()
+    return _layer
+
+
+def encode_event(group, event, data):
+    return json.dumps({'type': event, 'group': group, 'data': data}, cls=DjangoJSONEncoder)
+
+
+def send_events(events):
+    layer = get_channel_layer()
+    for group, text in events:
+        try:
+            layer.publish(group, text)
+        except Exception:
+            # Clients catch up on reconnect; never fail the write for this
+            logger.warning('Could not publish a real-time event to %s', group, exc_info=True)
+
+
+def publish(events):
+    """Send ``(groups, event, data)`` events once the current transaction commits."""
+    encoded = [
+        (group, encode_event(group, event, data))
+        for groups, event, data in events
+        for group in groups
+    ]
+    if encoded:
+        transaction.on_commit(lambda: send_events(encoded))
+
+
+def message_event(message):
+    return {
+        'id': message.id,
+        'agent': message.agent_id,
+        'conversation': message.conversation_id,
+        'content': message.content,
+        'role': message.role,
+        'user': message.user_id,
+        'created_at': message.created_at,
+    }
+
+
+def message_created(message):
+    if message.conversation_id is not None:
+        publish([([f'conversation.{message.conversation_id}'], 'message.created', message_event(message))])
+
+
+def ticket_groups(values):
+    groups = [f"ticket.{values['id']}", TICKETS_GROUP]
+    if values['agent_id'] is not None:
+        groups.append(f"agent.{values['agent_id']}")
+    return groups
+
+
+def ticket_event(values):
+    data = {field: values[field] for field in TICKET_EVENT_FIELDS}
+    data['agent'] = data.pop('agent_id')
+    data['customer'] = data.pop('customer_id')
+    return ticket_groups(values), 'ticket.updated', data
+
+
+def ticket_updated(ticket):
+    publish([ticket_event({field: getattr(ticket, field) for field in TICKET_EVENT_FIELDS})])
+
+
+def tickets_updated(queryset):
+    """Publish the tickets in ``queryset`` (changed without ``save()``) with one query."""
+    publish([ticket_event(values) for values in queryset.order_by().values(*TICKET_EVENT_FIELDS)])
@@ -0,0 +1,54 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def format_sse(event, data):
+    """Encode a single server-sent event with a JSON payload."""
+    payload = json.dumps(data, cls=JSONEncoder)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Renderer for ``text/event-stream`` responses.
+
+    Streaming views return a ``StreamingHttpResponse`` directly; this renderer
+    only handles regular responses (validation errors, 404s, ...) sent to a
+    client that asked for an event stream, encoding them as one ``error`` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return format_sse('error', data).encode(self.charset)
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Renderer for streamed exports (see ``api.exports``).
+
+    Export views return a ``StreamingHttpResponse`` directly; this renderer
+    only handles regular responses (errors) sent to a client that asked for
+    an export, encoding them as one line of JSON.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data, cls=JSONEncoder) + '\n').encode(self.charset)
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class JSONLinesRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'jsonl'
@@ -0,0 +1,154 @@
+"""
+Full-text ticket search.
+
+Tickets are indexed on their title, description, customer email and agent
+name, so ``?search=`` is answered from an index instead of ``LIKE '%q%'``
+scans across joins:
+
+* PostgreSQL: a weighted ``tsvector`` column on ``api_ticket`` with a GIN
+  index, ranked with ``ts_rank``. Every field is indexed and queried with
+  ``SEARCH_CONFIG``, and emails are indexed as their words (``jane``,
+  ``doe``, ``example``, ``com``), split the way queries are.
+* SQLite: an FTS5 table keyed by ticket id, ranked with ``bm25``.
+
+Both are created by migration ``0013_ticket_search`` and kept in sync by the
+signals in ``api.signals``; code that writes tickets without ``save()``
+(bulk operations) must call ``update_search_index`` itself. Other databases
+fall back to DRF's ``icontains`` search.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Value
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+from .models import Agent, Ticket
+from users.models import User
+
+SEARCH_CONFIG = 'english'
+
+FTS_TABLE = 'api_ticket_fts'
+
+# Fields whose changes require a ticket to be re-indexed
+INDEXED_FIELDS = {'title', 'description', 'customer', 'agent'}
+
+
+def get_search_terms(query):
+    """Split a search string into plain words, dropping query syntax."""
+    return re.findall(r'\w+', query.lower())
+
+
+def is_supported():
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+def update_search_index(queryset):
+    """Re-index the tickets in ``queryset`` from their current rows."""
+    if not is_supported():
+        return
+    sql, params = queryset.values('id').query.sql_with_params()
+    tables = {
+        'ticket': Ticket._meta.db_table,
+        'user': User._meta.db_table,
+        'agent': Agent._meta.db_table,
+    }
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"""
+                UPDATE {tables['ticket']} t SET search_vector =
+                    setweight(to_tsvector(%s, coalesce(t.title, '')), 'A') ||
+                    setweight(to_tsvector(%s, coalesce(t.description, '')), 'B') ||
+                    setweight(to_tsvector(%s, regexp_replace(coalesce(
+                        (SELECT email FROM {tables['user']} WHERE id = t.customer_id), ''
+                    ), '[^[:alnum:]_]+', ' ', 'g')), 'C') ||
+                    setweight(to_tsvector(%s, coalesce(
+                        (SELECT name FROM {tables['agent']} WHERE id = t.agent_id), ''
+                    )), 'C')
+                WHERE t.id IN ({sql})
+                """,
+                [SEARCH_CONFIG] * 4 + list(params)
+            )
+        else:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({sql})', params)
+            cursor.execute(
+                f"""
+                INSERT INTO {FTS_TABLE} (rowid, title, description, customer_email, agent_name)
+                SELECT t.id, t.title, t.description, u.email, coalesce(a.name, '')
+                FROM {tables['ticket']} t
+                JOIN {tables['user']} u ON u.id = t.customer_id
+                LEFT JOIN {tables['agent']} a ON a.id = t.agent_id
+                WHERE t.id IN ({sql})
+                """,
+                params
+            )
+
+
+def remove_from_search_index(ticket_ids):
+    """Drop deleted tickets from the index (the PostgreSQL column goes with the row)."""
+    if connection.vendor != 'sqlite' or not ticket_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(ticket_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', list(ticket_ids))
+
+
+def search_tickets(queryset, query):
+    """
+    Filter ``queryset`` to tickets matching every word of ``query`` (the last
+    one as a prefix, for search-as-you-type) and annotate ``search_rank``,
+    higher being more relevant.
+    """
+    terms = get_search_terms(query)
+    if not terms:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    table = Ticket._meta.db_table
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(terms) + ':*'
+        return queryset.annotate(
+            search_rank=RawSQL(
+                f'ts_rank({table}.search_vector, to_tsquery(%s, %s))',
+                [SEARCH_CONFIG, tsquery],
+                output_field=FloatField()
+            )
+        ).filter(RawSQL(
+            f'{table}.search_vector @@ to_tsquery(%s, %s)',
+            [SEARCH_CONFIG, tsquery],
+            output_field=BooleanField()
+        ))
+
+    match = ' '.join(f'"{term}"' for term in terms) + '*'
+    return queryset.annotate(
+        # bm25 is lower for better matches; weights follow the column order
+        search_rank=RawSQL(
+            f'(SELECT -bm25({FTS_TABLE}, 10.0, 5.0, 2.0, 2.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id)',
+            [match],
+            output_field=FloatField()
+        )
+    ).filter(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+
+
+class TicketSearchFilter(filters.SearchFilter):
+    """``?search=`` backed by the full-text index, annotating ``search_rank``."""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        if not is_supported():
+            queryset = super().filter_queryset(request, queryset, view)
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+        return search_tickets(queryset, query)
+
+
+class TicketOrderingFilter(filters.OrderingFilter):
+    """Order search results by relevance unless another ordering is requested."""
+
+    def get_default_ordering(self, view):
+        if view.request.query_params.get(api_settings.SEARCH_PARAM, '').strip():
+            return ['-search_rank']
+        return super().get_default_ordering(view)
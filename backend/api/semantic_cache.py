@@ -0,0 +1,47 @@
+"""
+Semantic answer cache.
+
+For agents with ``semantic_cache_enabled``, the opening question of each
+conversation is embedded and compared with earlier opening questions in a
+per-agent vector index. When the closest one is at least
+``Agent.semantic_cache_threshold`` similar, its stored answer is reused
+instead of calling the LLM. Only opening questions are cached since later
+questions usually depend on the rest of the conversation.
+
+Fresh answers are appended to the index as they are generated, and the index
+is deleted whenever the agent is saved so answers never outlive the prompt
+that produced them.
+"""
+from pathlib import Path
+
+from django.conf import settings
+
+from .vector_index import get_index
+
+
+def get_index_path(agent_id):
+    return Path(settings.VECTOR_INDEX_ROOT) / f'agent_{agent_id}' / 'semantic_cache'
+
+
+class SemanticCache:
+
+    def lookup(self, agent, embedding):
+        """Return the stored answer closest to ``embedding`` if it is similar enough."""
+        results = get_index(get_index_path(agent.id)).search(embedding, k=1)
+        if results:
+            score, payload = results[0]
+            if score >= agent.semantic_cache_threshold:
+                return payload['answer']
+        return None
+
+    def add(self, agent, question, embedding, answer):
+        get_index(get_index_path(agent.id)).add(
+            [embedding],
+            [{'question': question, 'answer': answer}]
+        )
+
+    def clear(self, agent_id):
+        get_index(get_index_path(agent_id)).clear()
+
+
+semantic_cache = SemanticCache()
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Agent, Ticket, Message
+from .models import Agent, Ticket, Conversation, Message, GenerationJob, KnowledgeDocument
+from .presence import get_presence, get_status
 
 User = get_user_model()
 
@@ -11,15 +12,31 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'email', 'first_name', 'last_name', 'role', 'is_active', 'date_joined')
         read_only_fields = ('id', 'is_active', 'date_joined')
 
+class AgentListSerializer(serializers.ListSerializer):
+    """Reads the presence of every agent in the list with one cache read."""
+    
+    def to_representation(self, data):
+        agents = list(data.all() if hasattr(data, 'all') else data)
+        self.context['presence'] = get_presence([agent.id for agent in agents])
+        return super().to_representation(agents)
+
+
 class AgentSerializer(serializers.ModelSerializer):
-    """Serializer for the Agent model."""
+    """Serializer for the Agent model; ``status`` is the agent's heartbeat presence."""
     user = UserSerializer(read_only=True)
+    status = serializers.SerializerMethodField()
+    
+    def get_status(self, obj):
+        presence = self.context.get('presence', {}).get(obj.id)
+        return presence['status'] if presence else get_status(obj.id)
     
     class Meta:
         model = Agent
+        list_serializer_class = AgentListSerializer
         fields = (
             'id', 'user', 'name', 'description', 'is_active', 'status', 
             'model', 'prompt', 'temperature', 'welcome_message', 'widget_config',
+            'cache_responses', 'semantic_cache_enabled', 'semantic_cache_threshold',
             'created_at', 'updated_at'
         )
         read_only_fields = ('id', 'user', 'created_at', 'updated_at')
@@ -29,6 +46,12 @@ class AgentSerializer(serializers.ModelSerializer):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
+
+class AgentHeartbeatSerializer(serializers.Serializer):
+    """Presence reported by an agent heartbeat."""
+    status = serializers.ChoiceField(choices=Agent.Status.choices, default=Agent.Status.ONLINE)
+
+
 class TicketSerializer(serializers.ModelSerializer):
     """Serializer for the Ticket model."""
     customer = serializers.PrimaryKeyRelatedField(
@@ -94,13 +117,53 @@ class TicketStatusUpdateSerializer(serializers.Serializer):
         instance.save()
         return instance
 
+class TicketBulkSerializer(serializers.Serializer):
+    """
+    Selects the tickets of a bulk update, either by `ids` or by a `filter` of
+    ticket list parameters (`status`, `priority`, `agent`, `customer`, `search`).
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    filter = serializers.DictField(required=False, allow_empty=False)
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError("Provide either ids or a filter.")
+        return attrs
+
+class TicketBulkStatusSerializer(TicketBulkSerializer):
+    """Serializer for changing the status of many tickets."""
+    status = serializers.ChoiceField(choices=Ticket.Status.choices)
+
+class TicketBulkPrioritySerializer(TicketBulkSerializer):
+    """Serializer for changing the priority of many tickets."""
+    priority = serializers.ChoiceField(choices=Ticket.Priority.choices)
+
+class TicketBulkAssignSerializer(TicketBulkSerializer):
+    """Serializer for assigning many tickets to an agent."""
+    agent_id = serializers.PrimaryKeyRelatedField(
+        queryset=Agent.objects.filter(is_active=True),
+        error_messages={'does_not_exist': 'Invalid agent ID or agent is not active'}
+    )
+
+class ConversationSerializer(serializers.ModelSerializer):
+    """Serializer for chat sessions between a user and an agent."""
+    class Meta:
+        model = Conversation
+        fields = ('id', 'agent', 'user', 'created_at', 'updated_at')
+        read_only_fields = fields
+
 class MessageSerializer(serializers.ModelSerializer):
     """Serializer for chat messages between users and agents."""
     user = UserSerializer(read_only=True)
+    conversation = serializers.PrimaryKeyRelatedField(
+        queryset=Conversation.objects.all(),
+        required=False,
+        allow_null=True
+    )
     
     class Meta:
         model = Message
-        fields = ('id', 'agent', 'content', 'role', 'user', 'created_at', 'updated_at')
+        fields = ('id', 'agent', 'conversation', 'content', 'role', 'user', 'created_at', 'updated_at')
         read_only_fields = ('id', 'user', 'created_at', 'updated_at')
     
     def create(self, validated_data):
@@ -109,3 +172,32 @@ class MessageSerializer(serializers.ModelSerializer):
         if request and hasattr(request, 'user') and request.user.is_authenticated:
             validated_data['user'] = request.user
         return super().create(validated_data)
+
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    """Serializer for queued agent reply generation jobs."""
+    response = MessageSerializer(read_only=True)
+    
+    class Meta:
+        model = GenerationJob
+        fields = ('id', 'message', 'status', 'response', 'error', 'attempts', 'created_at', 'updated_at')
+        read_only_fields = fields
+
+
+class KnowledgeDocumentSerializer(serializers.ModelSerializer):
+    """Serializer for knowledge base documents."""
+    class Meta:
+        model = KnowledgeDocument
+        fields = (
+            'id', 'agent', 'title', 'file', 'content', 'status', 'error',
+            'chunk_count', 'created_at', 'updated_at'
+        )
+        read_only_fields = ('id', 'agent', 'status', 'error', 'chunk_count', 'created_at', 'updated_at')
+        extra_kwargs = {
+            'content': {'write_only': True},
+        }
+    
+    def validate(self, attrs):
+        if not attrs.get('file') and not attrs.get('content'):
+            raise serializers.ValidationError("Provide either a file or the document content.")
+        return attrs
@@ -0,0 +1,105 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import assignment, realtime, stats
+from .cache import bump_agent_version
+from .models import Agent, AgentLoad, Message, Ticket
+from .search import INDEXED_FIELDS, remove_from_search_index, update_search_index
+from .semantic_cache import semantic_cache
+from users.models import User
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+def invalidate_agent_cache(sender, instance, **kwargs):
+    """Drop cached data derived from an agent's configuration."""
+    bump_agent_version(instance.id)
+    semantic_cache.clear(instance.id)
+
+
+def changes_any(update_fields, fields):
+    return update_fields is None or bool(set(update_fields) & set(fields))
+
+
+@receiver(post_save, sender=Ticket)
+def index_ticket(sender, instance, update_fields=None, **kwargs):
+    if changes_any(update_fields, INDEXED_FIELDS):
+        update_search_index(Ticket.objects.filter(id=instance.id))
+
+
+@receiver(post_delete, sender=Ticket)
+def unindex_ticket(sender, instance, **kwargs):
+    remove_from_search_index([instance.id])
+
+
+@receiver(post_save, sender=Agent)
+def reindex_agent_tickets(sender, instance, created, update_fields=None, **kwargs):
+    """Tickets are searchable by their agent's name."""
+    if not created and changes_any(update_fields, ['name']):
+        update_search_index(Ticket.objects.filter(agent=instance))
+
+
+@receiver(post_save, sender=User)
+def reindex_customer_tickets(sender, instance, created, update_fields=None, **kwargs):
+    """Tickets are searchable by their customer's email."""
+    if not created and changes_any(update_fields, ['email']):
+        update_search_index(Ticket.objects.filter(customer=instance))
+
+
+@receiver(post_save, sender=Agent)
+def create_agent_load(sender, instance, created, **kwargs):
+    if created:
+        AgentLoad.objects.get_or_create(agent=instance)
+
+
+# Saving any of these may change the agent load counters or statistics
+COUNTED_UPDATE_FIELDS = ['agent', 'agent_id', 'status', 'priority', 'closed_at']
+
+
+@receiver(pre_save, sender=Ticket)
+def remember_ticket_values(sender, instance, update_fields=None, **kwargs):
+    """Fetch what the counters were based on for tickets not loaded from the database."""
+    if (instance.pk is not None and not hasattr(instance, '_loaded_values')
+            and changes_any(update_fields, COUNTED_UPDATE_FIELDS)):
+        instance._loaded_values = Ticket.objects.filter(pk=instance.pk).values(*Ticket.COUNTED_FIELDS).first()
+
+
+@receiver(post_save, sender=Ticket)
+def update_ticket_counters(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keep agents' open-ticket counts and the statistics rollup current, and
+    route new unassigned tickets.
+    """
+    if changes_any(update_fields, COUNTED_UPDATE_FIELDS):
+        previous = None if created else getattr(instance, '_loaded_values', None)
+        current = instance.get_counted_values()
+        assignment.ticket_changed(previous, current)
+        stats.ticket_changed(previous, current)
+        instance._loaded_values = current
+    if created and instance.agent_id is None and assignment.is_enabled():
+        assignment.route_ticket(instance)
+
+
+@receiver(post_save, sender=Ticket)
+def publish_ticket(sender, instance, **kwargs):
+    """Push the change to WebSocket clients; after routing, so the agent is included."""
+    realtime.ticket_updated(instance)
+
+
+@receiver(post_save, sender=Message)
+def publish_message(sender, instance, created, **kwargs):
+    if created:
+        realtime.message_created(instance)
+
+
+@receiver(post_delete, sender=Ticket)
+def release_ticket_counters(sender, instance, **kwargs):
+    previous = getattr(instance, '_loaded_values', None) or instance.get_counted_values()
+    assignment.ticket_changed(previous, None)
+    stats.ticket_changed(previous, None)
+
+
+@receiver(pre_delete, sender=Agent)
+def unassign_agent_stats(sender, instance, **kwargs):
+    """The agent's tickets are about to be unassigned without signals."""
+    stats.agent_deleted(instance.id)
@@ -0,0 +1,187 @@
+"""
+Ticket statistics for the dashboard.
+
+``TicketRollup`` holds one row per agent (or unassigned), status and priority
+with the number of tickets, how many of them were resolved (have a
+``closed_at``) and their total time to resolution. The rows are updated
+incrementally whenever a ticket is created, deleted or changes agent, status,
+priority or ``closed_at`` (see ``api.signals``), so ``GET /api/tickets/stats/``
+reads a few rows per agent however many tickets there are.
+
+Code that changes tickets without ``save()`` must wrap the change in
+``tracking_stats`` or call ``adjust_stats``; ``python manage.py
+rebuild_ticket_stats`` recomputes the table from the tickets.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+
+from .models import Ticket, TicketRollup
+
+OPEN_STATUSES = (Ticket.Status.OPEN, Ticket.Status.IN_PROGRESS)
+
+
+def contribution(values):
+    """Return the rollup key of a ticket and the ``(count, resolved, seconds)`` it adds."""
+    key = (values['agent_id'], values['status'], values['priority'])
+    if values['closed_at'] is None or values['created_at'] is None:
+        return key, (1, 0, 0.0)
+    return key, (1, 1, (values['closed_at'] - values['created_at']).total_seconds())
+
+
+def adjust_stats(deltas):
+    """Add ``{(agent_id, status, priority): (count, resolved, seconds)}`` to the rollup."""
+    for (agent_id, ticket_status, priority), (count, resolved, seconds) in deltas.items():
+        if not (count or resolved or seconds):
+            continue
+        rows = TicketRollup.objects.filter(agent_id=agent_id, status=ticket_status, priority=priority)
+        changes = {
+            'count': F('count') + count,
+            'resolved': F('resolved') + resolved,
+            'resolution_seconds': F('resolution_seconds') + seconds,
+        }
+        if rows.update(**changes):
+            continue
+        try:
+            with transaction.atomic():
+                TicketRollup.objects.create(
+                    agent_id=agent_id, status=ticket_status, priority=priority,
+                    count=count, resolved=resolved, resolution_seconds=seconds
+                )
+        except IntegrityError:
+            # Created concurrently
+            rows.update(**changes)
+
+
+def ticket_changed(previous, current):
+    """
+    Move a ticket between rollup rows. ``previous`` and ``current`` are its
+    counted values (``Ticket.get_counted_values``) before and after the
+    change, None for a created or deleted ticket.
+    """
+    deltas = defaultdict(lambda: (0, 0, 0.0))
+    for values, sign in ((previous, -1), (current, 1)):
+        if values is None:
+            continue
+        key, added = contribution(values)
+        deltas[key] = tuple(total + sign * value for total, value in zip(deltas[key], added))
+    adjust_stats(deltas)
+
+
+def collect_stats(queryset):
+    """Aggregate the tickets in ``queryset`` into rollup deltas with one query."""
+    rows = queryset.order_by().values('agent_id', 'status', 'priority').annotate(
+        ticket_count=Count('id'),
+        resolved_count=Count('closed_at'),
+        resolution=Sum(ExpressionWrapper(F('closed_at') - F('created_at'), output_field=DurationField()))
+    )
+    return {
+        (row['agent_id'], row['status'], row['priority']): (
+            row['ticket_count'],
+            row['resolved_count'],
+            row['resolution'].total_seconds() if row['resolution'] else 0.0
+        )
+        for row in rows
+    }
+
+
+@contextmanager
+def tracking_stats(ticket_ids):
+    """
+    Keep the rollup right for changes made to ``ticket_ids`` without
+    ``save()`` inside the block. Use it within a transaction.
+    """
+    before = collect_stats(Ticket.objects.filter(id__in=ticket_ids))
+    yield
+    after = collect_stats(Ticket.objects.filter(id__in=ticket_ids))
+    zero = (0, 0, 0.0)
+    adjust_stats({
+        key: tuple(new - old for new, old in zip(after.get(key, zero), before.get(key, zero)))
+        for key in before.keys() | after.keys()
+    })
+
+
+def agent_deleted(agent_id):
+    """Tickets of a deleted agent become unassigned; move their counts along."""
+    adjust_stats({
+        (None, row.status, row.priority): (row.count, row.resolved, row.resolution_seconds)
+        for row in TicketRollup.objects.filter(agent_id=agent_id)
+    })
+
+
+def rebuild_stats():
+    """
+    Recompute the rollup from the tickets. Changes made while this runs may
+    be lost, so run it when tickets are quiet.
+    """
+    totals = collect_stats(Ticket.objects.all())
+    with transaction.atomic():
+        TicketRollup.objects.all().delete()
+        TicketRollup.objects.bulk_create([
+            TicketRollup(
+                agent_id=agent_id, status=ticket_status, priority=priority,
+                count=count, resolved=resolved, resolution_seconds=seconds
+            )
+            for (agent_id, ticket_status, priority), (count, resolved, seconds) in totals.items()
+        ])
+    return len(totals)
+
+
+def average(seconds, resolved):
+    return round(seconds / resolved, 1) if resolved else None
+
+
+def summarize(rollups):
+    """Build the dashboard statistics from rollup rows (with their agents selected)."""
+    by_status = dict.fromkeys(Ticket.Status.values, 0)
+    by_priority = dict.fromkeys(Ticket.Priority.values, 0)
+    resolution_by_priority = {priority: [0, 0.0] for priority in Ticket.Priority.values}
+    agents = {}
+
+    for row in rollups:
+        if not row.count:
+            # Left behind by tickets that moved to another row
+            continue
+        by_status[row.status] += row.count
+        by_priority[row.priority] += row.count
+        resolution_by_priority[row.priority][0] += row.resolved
+        resolution_by_priority[row.priority][1] += row.resolution_seconds
+
+        agent = agents.setdefault(row.agent_id, {
+            'agent': row.agent_id,
+            'name': row.agent.name if row.agent_id else None,
+            'total': 0,
+            'open': 0,
+            'by_status': dict.fromkeys(Ticket.Status.values, 0),
+            'resolved': 0,
+            'resolution_seconds': 0.0,
+        })
+        agent['total'] += row.count
+        agent['by_status'][row.status] += row.count
+        if row.status in OPEN_STATUSES:
+            agent['open'] += row.count
+        agent['resolved'] += row.resolved
+        agent['resolution_seconds'] += row.resolution_seconds
+
+    for agent in agents.values():
+        agent['average_resolution_seconds'] = average(agent.pop('resolution_seconds'), agent['resolved'])
+
+    resolved = sum(count for count, _ in resolution_by_priority.values())
+    seconds = sum(total for _, total in resolution_by_priority.values())
+    return {
+        'total': sum(by_status.values()),
+        'open': sum(by_status[status] for status in OPEN_STATUSES),
+        'by_status': by_status,
+        'by_priority': by_priority,
+        'by_agent': sorted(agents.values(), key=lambda agent: (agent['agent'] is None, agent['name'] or '')),
+        'resolution': {
+            'resolved': resolved,
+            'average_seconds': average(seconds, resolved),
+            'by_priority': {
+                priority: {'resolved': count, 'average_seconds': average(total, count)}
+                for priority, (count, total) in resolution_by_priority.items()
+            },
+        },
+    }
@@ -1,3 +1,1499 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import Throttled
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.models import User
+from .archive import archive_messages
+from .cache import agent_cache_key
+from .context import ContextBuilder
+from .assignment import rebuild_load, route_tickets
+from .jobs import claim_next_job, run_job
+from .knowledge import claim_next_document, get_index_path, ingest_document, retrieve
+from .vector_index import get_index
+from .llm import FakeProvider, get_client, get_provider, reset_clients
+from .stats import rebuild_stats
+from .throttling import generation_limiter, get_bucket_backend
+from .models import (
+    Agent, AgentLoad, ArchivedMessageBlock, Conversation, GenerationJob, KnowledgeChunk, KnowledgeDocument,
+    Message, Ticket,
+)
+from .presence import record_heartbeat
+from .views_widget import widget_config_cache
+from .visitors import Visitor
+from support_backend.asgi import application
+
+
+@override_settings(LLM_PROVIDER='fake')
+class QueryCountTests(APITestCase):
+    """
+    List and detail endpoints must load related rows in a fixed number of
+    queries, however many rows a page holds.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            email='admin@example.com', password='password', is_staff=True, role=User.Role.ADMIN
+        )
+        cls.owner = User.objects.create_user(
+            email='owner@example.com', password='password', role=User.Role.AGENT
+        )
+        cls.customer = User.objects.create_user(
+            email='customer@example.com', password='password', role=User.Role.CUSTOMER
+        )
+        cls.agents = [
+            Agent.objects.create(user=cls.owner, name=f'Agent {i}')
+            for i in range(5)
+        ]
+        cls.conversation = Conversation.objects.create(agent=cls.agents[0], user=cls.customer)
+
+    def create_tickets(self, count):
+        for i in range(count):
+            customer = User.objects.create_user(
+                email=f'customer{Ticket.objects.count()}@example.com', password='password'
+            )
+            Ticket.objects.create(
+                title=f'Ticket {i}',
+                description='Description',
+                customer=customer,
+                agent=self.agents[i % len(self.agents)]
+            )
+
+    def create_messages(self, count):
+        for i in range(count):
+            Message.objects.create(
+                agent=self.agents[0],
+                conversation=self.conversation,
+                user=self.customer,
+                role='user',
+                content=f'Message {i}'
+            )
+            Message.objects.create(
+                agent=self.agents[0],
+                conversation=self.conversation,
+                role='assistant',
+                content=f'Reply {i}'
+            )
+
+    def assertQueryCountStable(self, url, user, num):
+        """Assert ``url`` takes ``num`` queries with a small and a full page."""
+        self.client.force_authenticate(user)
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_ticket_list_admin(self):
+        self.create_tickets(3)
+        self.assertQueryCountStable('/api/tickets/', self.admin, 1)
+        self.create_tickets(17)
+        response = self.assertQueryCountStable('/api/tickets/', self.admin, 1)
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_ticket_list_non_admin(self):
+        self.create_tickets(20)
+        response = self.assertQueryCountStable('/api/tickets/', self.owner, 1)
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_ticket_detail(self):
+        self.create_tickets(1)
+        ticket = Ticket.objects.get()
+        self.assertQueryCountStable(f'/api/tickets/{ticket.id}/', self.owner, 1)
+
+    def test_agent_list(self):
+        self.assertQueryCountStable('/api/agents/', self.admin, 2)
+        for i in range(15):
+            Agent.objects.create(user=self.owner, name=f'More {i}')
+        self.assertQueryCountStable('/api/agents/', self.admin, 2)
+
+    def test_message_list(self):
+        self.create_messages(2)
+        url = f'/api/agents/{self.agents[0].id}/messages/'
+        self.assertQueryCountStable(url, self.customer, 2)
+        self.create_messages(10)
+        response = self.assertQueryCountStable(url, self.customer, 2)
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_message_history(self):
+        self.create_messages(15)
+        url = f'/api/agents/{self.agents[0].id}/messages/history/'
+        # Agent, messages, and archived blocks that could hold older ones
+        response = self.assertQueryCountStable(url, self.admin, 3)
+        self.assertEqual(len(response.data['results']), 20)
+
+
+def parse_sse(content):
+    """Split a server-sent event stream into (event, data) pairs."""
+    events = []
+    for frame in content.decode().split('\n\n'):
+        if not frame:
+            continue
+        event, data = frame.split('\n')
+        events.append((event.removeprefix('event: '), json.loads(data.removeprefix('data: '))))
+    return events
+
+
+@override_settings(LLM_PROVIDER='fake')
+class StreamingReplyTests(APITestCase):
+    """Replies are streamed as server-sent events, token by token."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='user@example.com', password='password')
+        self.agent = Agent.objects.create(user=self.user, name='Support')
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/agents/{self.agent.id}/messages/'
+
+    def stream(self, **extra):
+        response = self.client.post(self.url, {'content': 'Where is my order', 'role': 'user'}, format='json', **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        # One event per chunk, each a complete frame
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertTrue(all(chunk.startswith('event: ') and chunk.endswith('\n\n') for chunk in chunks))
+        return parse_sse(''.join(chunks).encode())
+
+    def test_stream(self):
+        events = self.stream(HTTP_ACCEPT='text/event-stream')
+        names = [event for event, _ in events]
+        self.assertEqual(names[0], 'user_message')
+        self.assertEqual(names[-2:], ['agent_message', 'done'])
+        self.assertEqual(set(names[1:-2]), {'token'})
+
+        deltas = ''.join(data['delta'] for event, data in events if event == 'token')
+        self.assertEqual(deltas, 'You said: Where is my order')
+        agent_message = events[-2][1]
+        self.assertEqual(agent_message['content'], deltas)
+        self.assertEqual(events[-1][1], {'agent_message': agent_message['id']})
+        self.assertEqual(Message.objects.get(id=agent_message['id']).role, Message.Role.ASSISTANT)
+
+    def test_stream_query_param(self):
+        self.assertEqual(self.stream(QUERY_STRING='stream=true')[-1][0], 'done')
+
+    def test_errors_are_events(self):
+        response = self.client.post(self.url, {'role': 'user'}, format='json', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, 400)
+        [(event, data)] = parse_sse(response.content)
+        self.assertEqual(event, 'error')
+        self.assertIn('content', data)
+
+    @override_settings(AGENT_MAX_CONCURRENT_GENERATIONS=1)
+    def test_unread_stream_releases_slot_on_close(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        data = {'content': 'Hello', 'role': 'user'}
+        response = self.client.post(self.url, data, format='json', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.client.post(self.url, data, format='json', HTTP_ACCEPT='text/event-stream').status_code, 429
+        )
+        # The client went away before the first chunk
+        response.close()
+        self.assertEqual(
+            self.client.post(self.url, data, format='json', HTTP_ACCEPT='text/event-stream').status_code, 200
+        )
+
+    @override_settings(LLM_PROVIDER='api.tests.FailingProvider')
+    def test_provider_failure(self):
+        events = self.stream(HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(events[1], ('token', {'delta': Message.ERROR_RESPONSE}))
+        self.assertEqual(events[-1][0], 'done')
+
+    def test_provider_registry(self):
+        self.assertIsInstance(get_provider(), FakeProvider)
+        self.assertIsInstance(get_provider('api.tests.FailingProvider'), FailingProvider)
+        provider = get_provider('fake')
+        deltas = list(provider.stream(
+            model='any', messages=[{'role': 'user', 'content': 'Hi there'}], temperature=0, max_tokens=2
+        ))
+        self.assertEqual(deltas, ['You', ' said:'])
+        self.assertEqual(provider.complete(
+            model='any', messages=[{'role': 'user', 'content': 'Hi'}], temperature=0, max_tokens=10
+        ), 'You said: Hi')
+
+
+@override_settings(LLM_PROVIDER='fake', CONTEXT_HISTORY_TOKEN_BUDGET=100, CONTEXT_KEEP_RATIO=0.5)
+class ContextBuilderTests(APITestCase):
+    """Replies see recent turns verbatim within the token budget and a summary of the rest."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='user@example.com', password='password')
+        self.agent = Agent.objects.create(user=self.user, name='Support', prompt='Be helpful.')
+        self.conversation = Conversation.objects.create(agent=self.agent, user=self.user)
+
+    def add(self, content, role=Message.Role.USER):
+        return Message.objects.create(
+            agent=self.agent, conversation=self.conversation, content=content, role=role,
+            user=self.user if role == Message.Role.USER else None
+        )
+
+    def test_short_history_is_sent_verbatim(self):
+        self.add('Hello')
+        self.add('Hi, how can I help?', role=Message.Role.ASSISTANT)
+        message = self.add('Where is my order?')
+        self.assertEqual(message.build_conversation(), [
+            {'role': 'system', 'content': 'Be helpful.'},
+            {'role': 'user', 'content': 'Hello'},
+            {'role': 'assistant', 'content': 'Hi, how can I help?'},
+            {'role': 'user', 'content': 'Where is my order?'},
+        ])
+        self.assertFalse(Message.objects.filter(token_count__isnull=True).exists())
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, '')
+
+    def test_old_turns_are_folded_into_summary(self):
+        for i in range(20):
+            self.add(f'Message {i} ' + 'about my order ' * 5,
+                     role=Message.Role.USER if i % 2 == 0 else Message.Role.ASSISTANT)
+        message = self.add('What about my refund?')
+        conversation = message.build_conversation()
+
+        self.conversation.refresh_from_db()
+        self.assertTrue(self.conversation.summary)
+        self.assertIsNotNone(self.conversation.summarized_through)
+        self.assertEqual(conversation[1]['content'],
+                         f'Summary of the earlier conversation: {self.conversation.summary}')
+        verbatim = [turn['content'] for turn in conversation if turn['role'] != 'system']
+        self.assertEqual(verbatim[-1], 'What about my refund?')
+        self.assertLess(len(verbatim), 21)
+        kept = Message.objects.filter(conversation=self.conversation, content__in=verbatim)
+        self.assertLessEqual(sum(kept.values_list('token_count', flat=True)), 100)
+
+        # The next turn fits in the budget and reuses the stored summary
+        summarized_through = self.conversation.summarized_through_id
+        self.add('Thanks').build_conversation()
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summarized_through_id, summarized_through)
+
+
+class LLMClientPoolTests(SimpleTestCase):
+    """API clients are shared per provider, endpoint and key."""
+
+    def setUp(self):
+        reset_clients()
+        self.addCleanup(reset_clients)
+
+    def test_clients_are_reused(self):
+        client = get_client('openai', api_key='key-a', base_url='https://llm.example.com/v1')
+        self.assertIs(get_client('openai', api_key='key-a', base_url='https://llm.example.com/v1'), client)
+        self.assertIsNot(get_client('openai', api_key='key-b', base_url='https://llm.example.com/v1'), client)
+        self.assertIsNot(get_client('openai', api_key='key-a'), client)
+
+    @override_settings(LLM_MAX_RETRIES=0)
+    def test_client_settings(self):
+        self.assertEqual(get_client('openai', api_key='key-a').max_retries, 0)
+
+    def test_reset_clients(self):
+        client = get_client('openai', api_key='key-a')
+        reset_clients()
+        self.assertIsNot(get_client('openai', api_key='key-a'), client)
+
+    def test_unknown_provider(self):
+        with self.assertRaises(ValueError):
+            get_client('unknown')
+
+
+class CountingProvider(FakeProvider):
+    """Fake provider that counts the replies and embedding calls it makes."""
+    calls = 0
+    embeddings = 0
+
+    def stream(self, **kwargs):
+        CountingProvider.calls += 1
+        return super().stream(**kwargs)
+
+    def embed(self, texts):
+        CountingProvider.embeddings += 1
+        return super().embed(texts)
+
+
+@override_settings(LLM_PROVIDER='api.tests.CountingProvider')
+class ResponseCacheTests(APITestCase):
+    """Agents with cache_responses reuse replies to identical requests."""
+
+    def setUp(self):
+        cache.clear()
+        CountingProvider.calls = 0
+        self.user = User.objects.create_user(email='user@example.com', password='password')
+        self.agent = Agent.objects.create(user=self.user, name='Support', cache_responses=True)
+
+    def ask(self, content):
+        conversation = Conversation.objects.create(agent=self.agent, user=self.user)
+        message = Message.objects.create(
+            agent=self.agent, conversation=conversation, user=self.user, role=Message.Role.USER, content=content
+        )
+        return message.generate_agent_response()
+
+    def test_identical_requests_hit_cache(self):
+        self.assertEqual(self.ask('Where is my order?'), 'You said: Where is my order?')
+        # Whitespace and case are normalized
+        self.assertEqual(self.ask('where  is my ORDER?'), 'You said: Where is my order?')
+        self.assertEqual(CountingProvider.calls, 1)
+
+        self.ask('Where is my refund?')
+        self.assertEqual(CountingProvider.calls, 2)
+
+    def test_hit_skips_context_building(self):
+        self.ask('Where is my order?')
+        # No knowledge retrieval or summary fold on a hit
+        with mock.patch.object(ContextBuilder, 'build', side_effect=AssertionError('context built')):
+            self.assertEqual(self.ask('Where is my order?'), 'You said: Where is my order?')
+        self.assertEqual(CountingProvider.calls, 1)
+
+    def test_saving_agent_invalidates(self):
+        self.ask('Where is my order?')
+        self.agent.prompt = 'Answer in French.'
+        self.agent.save()
+        self.ask('Where is my order?')
+        self.assertEqual(CountingProvider.calls, 2)
+
+    def test_disabled_by_default(self):
+        self.agent.cache_responses = False
+        self.agent.save()
+        self.ask('Where is my order?')
+        self.ask('Where is my order?')
+        self.assertEqual(CountingProvider.calls, 2)
+
+
+@override_settings(LLM_PROVIDER='api.tests.CountingProvider')
+class SemanticCacheTests(APITestCase):
+    """Similar opening questions reuse an earlier answer from the vector index."""
+
+    def setUp(self):
+        index_root = tempfile.TemporaryDirectory()
+        self.addCleanup(index_root.cleanup)
+        settings_override = override_settings(VECTOR_INDEX_ROOT=index_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        CountingProvider.calls = 0
+        self.user = User.objects.create_user(email='user@example.com', password='password')
+        self.agent = Agent.objects.create(
+            user=self.user, name='Support', semantic_cache_enabled=True, semantic_cache_threshold=0.8
+        )
+
+    def ask(self, content, conversation=None):
+        conversation = conversation or Conversation.objects.create(agent=self.agent, user=self.user)
+        message = Message.objects.create(
+            agent=self.agent, conversation=conversation, user=self.user, role=Message.Role.USER, content=content
+        )
+        return message.generate_agent_response()
+
+    def test_similar_opening_question_hits(self):
+        answer = self.ask('How do I reset my password?')
+        self.assertEqual(self.ask('How do I reset my password please?'), answer)
+        self.assertEqual(CountingProvider.calls, 1)
+
+        self.assertEqual(self.ask('Can I change my email address?'), 'You said: Can I change my email address?')
+        self.assertEqual(CountingProvider.calls, 2)
+
+    def test_only_opening_questions(self):
+        self.ask('How do I reset my password?')
+        conversation = Conversation.objects.create(agent=self.agent, user=self.user)
+        self.ask('Hello', conversation)
+        self.ask('How do I reset my password?', conversation)
+        self.assertEqual(CountingProvider.calls, 3)
+
+    def test_question_embedded_once(self):
+        KnowledgeDocument.objects.create(agent=self.agent, title='Passwords', content='Use the reset link.')
+        ingest_document(claim_next_document())
+        CountingProvider.embeddings = 0
+        self.ask('How do I reset my password?')
+        # Shared by the semantic cache and knowledge retrieval
+        self.assertEqual(CountingProvider.embeddings, 1)
+
+    def test_saving_agent_clears_index(self):
+        self.ask('How do I reset my password?')
+        self.agent.prompt = 'Answer in French.'
+        self.agent.save()
+        self.ask('How do I reset my password?')
+        self.assertEqual(CountingProvider.calls, 2)
+
+
+class KeysetPaginationTests(APITestCase):
+    """Ticket lists and chat messages are paged with opaque keyset cursors."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password='password', is_staff=True, role=User.Role.ADMIN
+        )
+        customer = User.objects.create_user(email='customer@example.com', password='password')
+        self.tickets = [
+            Ticket.objects.create(title=f'Ticket {i}', description='Help', customer=customer)
+            for i in range(7)
+        ]
+        # Ties on created_at are broken by id
+        Ticket.objects.filter(id__in=[ticket.id for ticket in self.tickets[2:5]]).update(
+            created_at=self.tickets[2].created_at
+        )
+        self.client.force_authenticate(self.admin)
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            pages.append([ticket['id'] for ticket in response.data['results']])
+            url = response.data[link]
+        return pages
+
+    def test_forward_and_back(self):
+        pages = self.walk('/api/tickets/?page_size=3', 'next')
+        expected = sorted(Ticket.objects.values_list('created_at', 'id'), reverse=True)
+        self.assertEqual([ticket_id for page in pages for ticket_id in page], [pk for _, pk in expected])
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        last = self.client.get('/api/tickets/?page_size=3').data['next']
+        last = self.client.get(last).data['next']
+        back = self.walk(self.client.get(last).data['previous'], 'previous')
+        self.assertEqual(back, pages[1::-1])
+
+    def test_ordering(self):
+        pages = self.walk('/api/tickets/?page_size=4&ordering=created_at', 'next')
+        self.assertEqual(pages[0][0], min(Ticket.objects.values_list('created_at', 'id'))[1])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/tickets/?cursor=not-a-cursor').status_code, 404)
+
+    def test_page_size_is_at_least_one(self):
+        response = self.client.get('/api/tickets/?page_size=0')
+        self.assertEqual(len(response.data['results']), 1)
+
+
+class FailingProvider(FakeProvider):
+    """Fake provider whose every call fails."""
+
+    def stream(self, **kwargs):
+        raise RuntimeError('Provider unavailable')
+
+
+@override_settings(LLM_PROVIDER='fake', GENERATION_QUEUE_ENABLED=True, GENERATION_JOB_MAX_ATTEMPTS=2)
+class GenerationJobTests(APITestCase):
+    """Queued replies are generated by workers, and failed generations retried."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='user@example.com', password='password')
+        self.agent = Agent.objects.create(user=self.user, name='Support')
+        self.client.force_authenticate(self.user)
+
+    def send(self, content='Hello'):
+        response = self.client.post(
+            f'/api/agents/{self.agent.id}/messages/', {'content': content, 'role': 'user'}, format='json'
+        )
+        self.assertEqual(response.status_code, 202)
+        return GenerationJob.objects.get(id=response.data['job']['id'])
+
+    def test_job_completes(self):
+        job = self.send()
+        job = run_job(claim_next_job())
+        self.assertEqual(job.status, GenerationJob.Status.COMPLETED)
+        response = self.client.get(f'/api/agents/{self.agent.id}/messages/jobs/{job.id}/')
+        self.assertEqual(response.data['response']['content'], 'You said: Hello')
+
+    @override_settings(LLM_PROVIDER='api.tests.FailingProvider')
+    def test_provider_failure_is_retried_then_fails(self):
+        job = self.send()
+        job = run_job(claim_next_job())
+        self.assertEqual((job.status, job.attempts), (GenerationJob.Status.PENDING, 1))
+        self.assertEqual(job.error, 'Provider unavailable')
+        self.assertFalse(Message.objects.filter(role=Message.Role.ASSISTANT).exists())
+
+        job = run_job(claim_next_job())
+        self.assertEqual((job.status, job.attempts), (GenerationJob.Status.FAILED, 2))
+        self.assertIsNone(claim_next_job())
+        self.assertFalse(Message.objects.filter(role=Message.Role.ASSISTANT).exists())
+
+    def test_foreign_conversation_is_rejected(self):
+        other = User.objects.create_user(email='other@example.com', password='password')
+        conversation = Conversation.objects.create(agent=self.agent, user=other)
+        response = self.client.post(f'/api/agents/{self.agent.id}/messages/', {
+            'content': 'Hello', 'role': 'user', 'conversation': conversation.id
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('conversation', response.data)
+        self.assertFalse(Message.objects.exists())
+
+    @override_settings(GENERATION_JOB_LOCK_TIMEOUT=0)
+    def test_lost_claim_discards_reply(self):
+        self.send()
+        job = claim_next_job()
+        # The lock times out and another worker re-claims the job
+        reclaimed = claim_next_job()
+        self.assertEqual((reclaimed.id, reclaimed.attempts), (job.id, 2))
+
+        job = run_job(job)
+        self.assertEqual(job.status, GenerationJob.Status.RUNNING)
+        self.assertFalse(Message.objects.filter(role=Message.Role.ASSISTANT).exists())
+
+        reclaimed = run_job(reclaimed)
+        self.assertEqual(reclaimed.status, GenerationJob.Status.COMPLETED)
+        self.assertEqual(Message.objects.filter(role=Message.Role.ASSISTANT).count(), 1)
+
+    @override_settings(GENERATION_QUEUE_ENABLED=False)
+    def test_inline_without_queue(self):
+        response = self.client.post(
+            f'/api/agents/{self.agent.id}/messages/', {'content': 'Hello', 'role': 'user'}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['agent_message']['content'], 'You said: Hello')
+        self.assertFalse(GenerationJob.objects.exists())
+
+    def test_abandoned_last_attempt_fails(self):
+        job = self.send()
+        GenerationJob.objects.filter(id=job.id).update(
+            status=GenerationJob.Status.RUNNING, attempts=2, locked_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertIsNone(claim_next_job())
+        job.refresh_from_db()
+        self.assertEqual(job.status, GenerationJob.Status.FAILED)
+
+
+@override_settings(LLM_PROVIDER='fake', GENERATION_QUEUE_ENABLED=True, RATE_LIMIT_BACKEND='cache')
+class ChatRateLimitTests(APITestCase):
+    """Chat messages are rate limited by token buckets, with Retry-After."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(email='user@example.com', password='password')
+        self.agent = Agent.objects.create(user=self.user, name='Support')
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/agents/{self.agent.id}/messages/'
+
+    def send(self, **extra):
+        return self.client.post(self.url, {'content': 'Hello', 'role': 'user'}, format='json', **extra)
+
+    @override_settings(CHAT_RATE_LIMITS={'user': '3/min'})
+    def test_user_limit(self):
+        for _ in range(3):
+            self.assertEqual(self.send().status_code, 202)
+        response = self.send()
+        self.assertEqual(response.status_code, 429)
+        # One token refills every 20 seconds
+        self.assertIn(response['Retry-After'], ('19', '20'))
+
+    @override_settings(CHAT_RATE_LIMITS={'ip': '3/min'})
+    def test_forwarded_for_is_not_trusted(self):
+        statuses = [
+            self.send(HTTP_X_FORWARDED_FOR=f'203.0.113.{i}').status_code
+            for i in range(5)
+        ]
+        self.assertEqual(statuses, [202, 202, 202, 429, 429])
+
+    @override_settings(AGENT_MAX_CONCURRENT_GENERATIONS=1)
+    def test_generation_counter_never_goes_negative(self):
+        generation_limiter.acquire(self.agent.id)
+        # The counter expires while the first generation is in flight
+        cache.delete(generation_limiter.counter_key(self.agent.id))
+        generation_limiter.acquire(self.agent.id)
+        generation_limiter.release(self.agent.id)
+        generation_limiter.release(self.agent.id)
+
+        generation_limiter.acquire(self.agent.id)
+        with self.assertRaises(Throttled):
+            generation_limiter.acquire(self.agent.id)
+
+    @override_settings(CHAT_RATE_LIMITS={'ip': '3/min'})
+    def test_concurrent_requests_do_not_overspend(self):
+        backend = get_bucket_backend()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(backend.consume('ratelimit:test', 3, 0.05)))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(0), 3)
+
+
+class TicketSearchTests(APITestCase):
+    """
+    ``?search=`` uses the full-text index of the test database: FTS5 on
+    SQLite, the ``tsvector`` column on PostgreSQL.
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password='password', is_staff=True, role=User.Role.ADMIN
+        )
+        jane = User.objects.create_user(email='jane.doe@example.com', password='password')
+        bob = User.objects.create_user(email='bob@other.org', password='password')
+        agent = Agent.objects.create(user=self.admin, name='Billing Team')
+        self.refund = Ticket.objects.create(
+            title='Refund request', description='I was charged twice for my subscription',
+            customer=jane, agent=agent
+        )
+        self.login = Ticket.objects.create(title='Login broken', description='Cannot sign in', customer=bob)
+        self.other = Ticket.objects.create(
+            title='Question', description='Do you offer a refund on yearly plans?', customer=bob
+        )
+        self.client.force_authenticate(self.admin)
+
+    def search(self, query):
+        response = self.client.get('/api/tickets/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [ticket['id'] for ticket in response.data['results']]
+
+    def test_customer_email(self):
+        self.assertEqual(self.search('jane.doe@example.com'), [self.refund.id])
+        self.assertEqual(self.search('jane'), [self.refund.id])
+        self.assertCountEqual(self.search('other.org'), [self.login.id, self.other.id])
+
+    def test_words_stems_and_prefix(self):
+        self.assertEqual(self.search('charges'), [self.refund.id])
+        self.assertEqual(self.search('billing'), [self.refund.id])
+        self.assertEqual(self.search('subscr'), [self.refund.id])
+        self.assertEqual(self.search('login jane'), [])
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search('refund'), [self.refund.id, self.other.id])
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL search index')
+    def test_postgresql_indexes_email_words(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT search_vector::text FROM api_ticket WHERE id = %s', [self.refund.id])
+            vector = cursor.fetchone()[0]
+        for word in ('jane', 'doe', 'exampl', 'com'):
+            self.assertIn(f"'{word}'", vector)
+
+
+class FlakyEmbeddingProvider(FakeProvider):
+    """Fake provider whose second embedding batch fails."""
+    calls = 0
+
+    def embed(self, texts):
+        FlakyEmbeddingProvider.calls += 1
+        if FlakyEmbeddingProvider.calls == 2:
+            raise RuntimeError('Embedding service unavailable')
+        return super().embed(texts)
+
+
+@override_settings(
+    LLM_PROVIDER='fake', KNOWLEDGE_CHUNK_WORDS=4, KNOWLEDGE_CHUNK_OVERLAP=0, KNOWLEDGE_EMBED_BATCH_SIZE=2
+)
+class KnowledgeIngestTests(APITestCase):
+    """Documents are chunked, embedded and indexed all or nothing."""
+
+    def setUp(self):
+        index_root = tempfile.TemporaryDirectory()
+        self.addCleanup(index_root.cleanup)
+        settings_override = override_settings(VECTOR_INDEX_ROOT=index_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        owner = User.objects.create_user(email='owner@example.com', password='password')
+        self.agent = Agent.objects.create(user=owner, name='Support')
+        self.document = KnowledgeDocument.objects.create(
+            agent=self.agent, title='Refunds',
+            content='Refunds are issued within five days. Contact billing for refunds over one hundred dollars.'
+        )
+
+    def index_size(self):
+        return len(get_index(get_index_path(self.agent.id)))
+
+    def test_ingest_and_reingest(self):
+        document = ingest_document(claim_next_document())
+        self.assertEqual((document.status, document.chunk_count), (KnowledgeDocument.Status.READY, 4))
+        self.assertIn('Refunds are issued within', retrieve(self.agent, 'When are refunds issued?'))
+
+        ingest_document(document)
+        self.assertEqual(KnowledgeChunk.objects.count(), 4)
+        self.assertEqual(self.index_size(), 4)
+
+    @override_settings(LLM_PROVIDER='api.tests.FlakyEmbeddingProvider')
+    def test_failure_leaves_nothing_behind(self):
+        FlakyEmbeddingProvider.calls = 0
+        document = ingest_document(claim_next_document())
+        self.assertEqual(document.status, KnowledgeDocument.Status.FAILED)
+        self.assertEqual(document.error, 'Embedding service unavailable')
+        self.assertFalse(KnowledgeChunk.objects.exists())
+        self.assertEqual(self.index_size(), 0)
+
+    def test_abandoned_processing_is_reclaimed(self):
+        KnowledgeDocument.objects.filter(id=self.document.id).update(
+            status=KnowledgeDocument.Status.PROCESSING, updated_at=timezone.now() - timedelta(minutes=5)
+        )
+        self.assertIsNone(claim_next_document())
+        KnowledgeDocument.objects.filter(id=self.document.id).update(
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(claim_next_document().id, self.document.id)
+
+
+class VectorIndexTests(SimpleTestCase):
+    """Rows only count once committed, so a crashed append cannot misalign the files."""
+
+    def setUp(self):
+        index_root = tempfile.TemporaryDirectory()
+        self.addCleanup(index_root.cleanup)
+        self.index = get_index(f'{index_root.name}/index')
+
+    def test_uncommitted_rows_are_dropped(self):
+        self.index.add([[1, 0], [0, 1]], ['east', 'north'])
+        # A writer that crashed after appending a payload but before its offset and vector
+        with open(self.index.payloads_path, 'ab') as payload_file:
+            payload_file.write(b'"lost"\n')
+        with open(self.index.vectors_path, 'ab') as vectors_file:
+            vectors_file.write(b'\0' * 3)
+        self.assertEqual(len(self.index), 2)
+
+        self.index.add([[-1, 0]], ['west'])
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.search([-1, 0.1])[0][1], 'west')
+        self.assertEqual(self.index.search([0.1, 1])[0][1], 'north')
+        self.assertEqual(self.index.payloads_path.read_text().count('lost'), 0)
+
+
+class WidgetConfigTests(APITestCase):
+    """The public widget config is served from the cache once warm."""
+
+    def setUp(self):
+        cache.clear()
+        widget_config_cache.clear()
+        owner = User.objects.create_user(email='owner@example.com', password='password')
+        self.agent = Agent.objects.create(user=owner, name='Support', widget_config={'title': 'Hi'})
+        self.url = f'/api/widgets/{self.agent.id}/config/'
+
+    def test_warm_cache_skips_database(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['widget_config'], {'title': 'Hi'})
+        self.assertIn('public', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalidated_on_save(self):
+        etag = self.client.get(self.url)['ETag']
+        self.agent.widget_config = {'title': 'Hello'}
+        self.agent.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['widget_config'], {'title': 'Hello'})
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_online_follows_presence(self):
+        self.assertFalse(self.client.get(self.url).json()['data']['is_online'])
+        record_heartbeat(self.agent.id)
+        with self.assertNumQueries(1):
+            self.assertTrue(self.client.get(self.url).json()['data']['is_online'])
+
+    def test_inactive_agent(self):
+        self.agent.is_active = False
+        self.agent.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_unknown_agent_not_cached_in_shared_cache(self):
+        url = f'/api/widgets/{self.agent.id + 1}/config/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        key = agent_cache_key(self.agent.id + 1, 'widget_config:offline')
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(widget_config_cache.get(key)['status'], 404)
+
+    def test_bootstrap_anonymous(self):
+        url = f'/api/widgets/{self.agent.id}/bootstrap/'
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        data = response.json()['data']
+        self.assertEqual(data['welcome_message'], self.agent.welcome_message)
+        self.assertEqual(data['messages'], [])
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_bootstrap_returning_visitor(self):
+        conversation = Conversation.objects.create(agent=self.agent, user=self.agent.user)
+        for i in range(3):
+            Message.objects.create(
+                agent=self.agent, conversation=conversation, user=self.agent.user,
+                role='user', content=f'Message {i}'
+            )
+        self.client.force_authenticate(self.agent.user)
+        response = self.client.get(f'/api/widgets/{self.agent.id}/bootstrap/')
+        data = response.json()['data']
+        self.assertEqual(data['conversation'], conversation.id)
+        self.assertEqual([msg['content'] for msg in data['messages']], ['Message 0', 'Message 1', 'Message 2'])
+        self.assertIn('private', response['Cache-Control'])
+
+
+@override_settings(LLM_PROVIDER='fake', GENERATION_QUEUE_ENABLED=True)
+class WidgetChatTests(APITestCase):
+    """Anonymous visitors chat through signed session tokens."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        owner = User.objects.create_user(email='owner@example.com', password='password')
+        self.agent = Agent.objects.create(user=owner, name='Support')
+        self.url = f'/api/agents/{self.agent.id}/chat'
+
+    def send(self, content='Hello', session=None):
+        extra = {'HTTP_X_VISITOR_TOKEN': session} if session else {}
+        response = self.client.post(self.url, {'message': content}, format='json', **extra)
+        self.assertEqual(response.status_code, 202)
+        return response.data
+
+    def test_new_visitor_gets_session(self):
+        data = self.send()
+        visitor = Visitor.from_token(data['session'])
+        self.assertEqual(visitor.agent_id, self.agent.id)
+        conversation = Conversation.objects.get(id=data['conversation'])
+        self.assertEqual(conversation.visitor_id, visitor.id)
+        self.assertIsNone(conversation.user_id)
+
+        run_job(claim_next_job())
+        response = self.client.get(
+            f'{self.url}/jobs/{data["job"]["id"]}/', HTTP_X_VISITOR_TOKEN=data['session']
+        )
+        self.assertEqual(response.data['response']['content'], 'You said: Hello')
+
+    def test_session_continues_conversation(self):
+        first = self.send()
+        second = self.send('Again', session=first['session'])
+        self.assertEqual(second['conversation'], first['conversation'])
+        self.assertEqual(Visitor.from_token(second['session']).id, Visitor.from_token(first['session']).id)
+
+    def test_invalid_session_starts_over(self):
+        first = self.send()
+        other_agent = Agent.objects.create(user=self.agent.user, name='Sales')
+        for session in (first['session'] + 'x', Visitor(other_agent.id).get_token()):
+            data = self.send(session=session)
+            self.assertNotEqual(data['conversation'], first['conversation'])
+            self.assertNotEqual(Visitor.from_token(data['session']).id, Visitor.from_token(first['session']).id)
+
+    def test_job_requires_own_session(self):
+        data = self.send()
+        url = f'{self.url}/jobs/{data["job"]["id"]}/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        other = Visitor(self.agent.id).get_token()
+        self.assertEqual(self.client.get(url, HTTP_X_VISITOR_TOKEN=other).status_code, 404)
+
+
+class TicketImportTests(APITestCase):
+    """Bulk ticket import resolves customers by email in batches."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password='password', is_staff=True, role=User.Role.ADMIN
+        )
+        self.existing = User.objects.create_user(email='existing@example.com', password='password')
+
+    def upload(self, content, name='tickets.jsonl'):
+        return self.client.post(
+            '/api/tickets/import/',
+            {'file': SimpleUploadedFile(name, content.encode())},
+            format='multipart'
+        )
+
+    def test_import_jsonl(self):
+        self.client.force_authenticate(self.admin)
+        rows = [
+            {'title': 'Refund', 'description': 'Please', 'customer_email': 'existing@example.com'},
+            {'title': 'Crash', 'description': 'On start', 'customer_email': 'new@example.com', 'status': 'closed'},
+            {'title': 'Broken', 'customer_email': 'not-an-email'},
+        ]
+        response = self.upload('\n'.join(json.dumps(row) for row in rows) + '\nnot json\n')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['customers_created'], 1)
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4])
+
+        self.assertEqual(self.existing.tickets_created.get().title, 'Refund')
+        crash = Ticket.objects.get(title='Crash')
+        self.assertFalse(crash.customer.has_usable_password())
+        self.assertIsNotNone(crash.closed_at)
+
+    def test_concurrently_created_customer_not_counted(self):
+        self.client.force_authenticate(self.admin)
+        bulk_create = User.objects.bulk_create
+
+        def create_first(users, **kwargs):
+            # Another import creates one of the customers first
+            User.objects.create_user(email='first@example.com')
+            return bulk_create(users, **kwargs)
+
+        rows = [
+            {'title': 'Refund', 'customer_email': 'first@example.com'},
+            {'title': 'Crash', 'customer_email': 'second@example.com'},
+        ]
+        with mock.patch.object(User.objects, 'bulk_create', create_first):
+            response = self.upload('\n'.join(json.dumps(row) for row in rows))
+        self.assertEqual((response.data['created'], response.data['customers_created']), (2, 1))
+        self.assertEqual(Ticket.objects.get(title='Refund').customer.email, 'first@example.com')
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.existing)
+        response = self.upload('title,description,customer_email\n', name='tickets.csv')
+        self.assertEqual(response.status_code, 403)
+
+
+class TicketBulkUpdateTests(APITestCase):
+    """Bulk ticket updates check permissions for the whole set."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password='password', is_staff=True, role=User.Role.ADMIN
+        )
+        self.customer = User.objects.create_user(email='customer@example.com', password='password')
+        other = User.objects.create_user(email='other@example.com', password='password')
+        self.own = [
+            Ticket.objects.create(title=f'Spam {i}', description='Buy now', customer=self.customer)
+            for i in range(3)
+        ]
+        self.other = Ticket.objects.create(title='Printer', description='Jammed', customer=other)
+
+    def test_close_own_tickets(self):
+        self.client.force_authenticate(self.customer)
+        # Select, permission check, load and rollup counts around the update,
+        # moving the tickets to a new rollup row and loading them for the
+        # real-time event, inside savepoints
+        with self.assertNumQueries(15):
+            response = self.client.post('/api/tickets/bulk/status/', {
+                'ids': [ticket.id for ticket in self.own], 'status': 'CLOSED'
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 3)
+        for ticket in self.own:
+            ticket.refresh_from_db()
+            self.assertEqual(ticket.status, Ticket.Status.CLOSED)
+            self.assertIsNotNone(ticket.closed_at)
+
+    def test_denied_ticket_blocks_whole_set(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.post('/api/tickets/bulk/priority/', {
+            'ids': [self.own[0].id, self.other.id], 'priority': 'LOW'
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data['ids'], [self.other.id])
+        self.own[0].refresh_from_db()
+        self.assertEqual(self.own[0].priority, Ticket.Priority.MEDIUM)
+
+    def test_assign_by_filter(self):
+        agent = Agent.objects.create(user=self.admin, name='Triage')
+        self.client.force_authenticate(self.admin)
+        response = self.client.post('/api/tickets/bulk/assign/', {
+            'filter': {'customer': self.customer.id, 'search': 'buy'}, 'agent_id': agent.id
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual(agent.tickets_assigned.count(), 3)
+        self.assertEqual(self.client.get('/api/tickets/', {'search': 'triage'}).data['results'][0]['agent']['id'], agent.id)
+
+    def test_unknown_filter_rejected(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.post('/api/tickets/bulk/status/', {
+            'filter': {'stauts': 'OPEN'}, 'status': 'CLOSED'
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Ticket.objects.filter(status=Ticket.Status.CLOSED).exists())
+
+
+class TicketRoutingTests(APITestCase):
+    """New tickets go to the least loaded available agent."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.owner = User.objects.create_user(email='owner@example.com', password='password')
+        self.customer = User.objects.create_user(email='customer@example.com', password='password')
+        self.online = Agent.objects.create(user=self.owner, name='Online')
+        self.busy = Agent.objects.create(user=self.owner, name='Busy')
+        # Not sending heartbeats
+        self.offline = Agent.objects.create(user=self.owner, name='Offline')
+        record_heartbeat(self.online.id)
+        record_heartbeat(self.busy.id, Agent.Status.BUSY)
+
+    def create_ticket(self, **fields):
+        return Ticket.objects.create(title='Help', description='Please', customer=self.customer, **fields)
+
+    def open_tickets(self, agent):
+        return AgentLoad.objects.get(agent=agent).open_tickets
+
+    def test_routes_by_presence_and_load(self):
+        with self.settings(TICKET_ROUTING_MAX_OPEN=2):
+            tickets = [self.create_ticket() for _ in range(3)]
+            urgent = self.create_ticket(priority=Ticket.Priority.URGENT)
+        self.assertEqual(
+            [ticket.agent_id for ticket in tickets],
+            [self.online.id, self.online.id, self.busy.id]
+        )
+        # Over capacity, urgent tickets still go to online agents first
+        self.assertEqual(urgent.agent_id, self.online.id)
+        self.assertEqual(self.open_tickets(self.online), 3)
+        self.assertEqual(Ticket.objects.get(id=urgent.id).agent_id, self.online.id)
+
+    def test_counters_follow_changes(self):
+        ticket = self.create_ticket()
+        self.assertEqual(self.open_tickets(self.online), 1)
+
+        ticket = Ticket.objects.get(id=ticket.id)
+        ticket.agent = self.busy
+        ticket.save()
+        self.assertEqual((self.open_tickets(self.online), self.open_tickets(self.busy)), (0, 1))
+
+        ticket.status = Ticket.Status.CLOSED
+        ticket.save()
+        self.assertEqual(self.open_tickets(self.busy), 0)
+
+        self.create_ticket().delete()
+        self.assertEqual(self.open_tickets(self.online), 0)
+
+    def test_route_backlog(self):
+        with self.settings(TICKET_AUTO_ROUTING=False):
+            tickets = [self.create_ticket() for _ in range(4)]
+        self.assertEqual(len(route_tickets(Ticket.objects.all())), 4)
+        self.assertEqual(self.open_tickets(self.online), 4)
+        self.assertFalse(Ticket.objects.filter(agent__isnull=True).exists())
+        rebuild_load()
+        self.assertEqual(self.open_tickets(self.online), 4)
+
+    def test_offline_agents_get_nothing(self):
+        record_heartbeat(self.online.id, Agent.Status.OFFLINE)
+        record_heartbeat(self.busy.id, Agent.Status.OFFLINE)
+        self.assertIsNone(self.create_ticket().agent_id)
+
+        record_heartbeat(self.offline.id, Agent.Status.BUSY)
+        self.assertEqual(self.create_ticket().agent_id, self.offline.id)
+
+
+class TicketStatsTests(APITestCase):
+    """Ticket statistics come from the rollup, which follows ticket changes."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password='password', is_staff=True, role=User.Role.ADMIN
+        )
+        self.customer = User.objects.create_user(email='customer@example.com', password='password')
+        self.agent = Agent.objects.create(user=self.admin, name='Support')
+
+    def create_ticket(self, **fields):
+        return Ticket.objects.create(title='Help', description='Please', customer=self.customer, **fields)
+
+    def get_stats(self):
+        self.client.force_authenticate(self.admin)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tickets/stats/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_stats_follow_ticket_changes(self):
+        ticket = self.create_ticket(priority=Ticket.Priority.HIGH)
+        self.create_ticket(agent=self.agent)
+        self.create_ticket(agent=self.agent).delete()
+
+        ticket = Ticket.objects.get(id=ticket.id)
+        ticket.agent = self.agent
+        ticket.status = Ticket.Status.CLOSED
+        ticket.closed_at = ticket.created_at + timedelta(hours=2)
+        ticket.save()
+
+        data = self.get_stats()
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(data['open'], 1)
+        self.assertEqual(data['by_status'][Ticket.Status.CLOSED], 1)
+        self.assertEqual(data['by_priority'][Ticket.Priority.HIGH], 1)
+        self.assertEqual(data['resolution']['average_seconds'], 7200)
+        [agent] = data['by_agent']
+        self.assertEqual((agent['agent'], agent['total'], agent['open']), (self.agent.id, 2, 1))
+
+        # The incremental rollup matches one rebuilt from the tickets
+        rebuild_stats()
+        self.assertEqual(self.get_stats(), data)
+
+    def test_bulk_and_agent_deletion(self):
+        tickets = [self.create_ticket(agent=self.agent) for _ in range(3)]
+        self.client.force_authenticate(self.admin)
+        self.client.post('/api/tickets/bulk/status/', {
+            'ids': [ticket.id for ticket in tickets[:2]], 'status': 'CLOSED'
+        }, format='json')
+        self.assertEqual(self.get_stats()['resolution']['resolved'], 2)
+
+        self.agent.delete()
+        data = self.get_stats()
+        self.assertEqual(data['by_agent'][0]['agent'], None)
+        self.assertEqual(data['by_agent'][0]['total'], 3)
+
+
+class RealtimeTests(APITestCase):
+    """WebSocket clients are pushed the events of the streams they may read."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password='password', is_staff=True, role=User.Role.ADMIN
+        )
+        self.agent = Agent.objects.create(user=self.admin, name='Support')
+        record_heartbeat(self.agent.id)
+        self.addCleanup(cache.clear)
+        self.visitor = Visitor(self.agent.id)
+        self.conversation = Conversation.objects.create(agent=self.agent, visitor_id=self.visitor.id)
+        self.other = Conversation.objects.create(agent=self.agent, visitor_id=Visitor(self.agent.id).id)
+
+    async def connect(self, query_string):
+        communicator = ApplicationCommunicator(application, {
+            'type': 'websocket', 'path': '/ws/', 'query_string': query_string.encode()
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator, await communicator.receive_output(5)
+
+    async def request(self, communicator, **data):
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+        return await self.receive(communicator)
+
+    async def receive(self, communicator):
+        return json.loads((await communicator.receive_output(5))['text'])
+
+    async def disconnect(self, communicator):
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+
+    def save(self, create):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create()
+
+    async def test_visitor_receives_messages_of_own_conversation(self):
+        communicator, accepted = await self.connect(f'visitor={self.visitor.get_token()}')
+        self.assertEqual(accepted['type'], 'websocket.accept')
+
+        reply = await self.request(communicator, action='subscribe', stream='conversation', id=self.other.id)
+        self.assertEqual(reply['type'], 'error')
+        reply = await self.request(communicator, action='subscribe', stream='tickets')
+        self.assertEqual(reply['type'], 'error')
+        reply = await self.request(communicator, action='subscribe', stream='conversation', id=self.conversation.id)
+        self.assertEqual(reply['type'], 'subscribed')
+
+        message = await sync_to_async(self.save)(lambda: Message.objects.create(
+            agent=self.agent, conversation=self.conversation, content='Hello', role=Message.Role.ASSISTANT
+        ))
+        event = await self.receive(communicator)
+        self.assertEqual(event['type'], 'message.created')
+        self.assertEqual(event['group'], f'conversation.{self.conversation.id}')
+        self.assertEqual((event['data']['id'], event['data']['content']), (message.id, 'Hello'))
+        await self.disconnect(communicator)
+
+    async def test_staff_receives_ticket_updates(self):
+        communicator, accepted = await self.connect(f'token={AccessToken.for_user(self.admin)}')
+        self.assertEqual(accepted['type'], 'websocket.accept')
+        reply = await self.request(communicator, action='subscribe', stream='tickets')
+        self.assertEqual(reply['type'], 'subscribed')
+
+        ticket = await sync_to_async(self.save)(lambda: Ticket.objects.create(
+            title='Help', description='Please', customer=self.admin
+        ))
+        event = await self.receive(communicator)
+        self.assertEqual((event['type'], event['group']), ('ticket.updated', 'tickets'))
+        self.assertEqual(event['data']['id'], ticket.id)
+        # Routed before the event was sent
+        self.assertEqual(event['data']['agent'], self.agent.id)
+        await self.disconnect(communicator)
+
+    async def test_unauthenticated_connection_is_closed(self):
+        communicator, closed = await self.connect('token=invalid')
+        self.assertEqual(closed, {'type': 'websocket.close', 'code': 4401})
+
+
+class GatedProvider(FakeProvider):
+    """Fake provider that holds back the rest of its reply until `release` is set."""
+    release = threading.Event()
+
+    def stream(self, **kwargs):
+        words = super().stream(**kwargs)
+        yield next(words)
+        self.release.wait(10)
+        yield from words
+
+
+@override_settings(LLM_PROVIDER='api.tests.GatedProvider')
+class ASGIStreamingTests(APITransactionTestCase):
+    """Under ASGI, streamed replies are sent as they are generated."""
+
+    def setUp(self):
+        GatedProvider.release.clear()
+        self.addCleanup(GatedProvider.release.set)
+        self.user = User.objects.create_user(email='user@example.com', password='password')
+        self.agent = Agent.objects.create(user=self.user, name='Support')
+
+    async def test_first_token_arrives_before_reply_is_done(self):
+        body = json.dumps({'content': 'Hello there', 'role': 'user'}).encode()
+        communicator = ApplicationCommunicator(application, {
+            'type': 'http',
+            'method': 'POST',
+            'path': f'/api/agents/{self.agent.id}/messages/',
+            'query_string': b'stream=true',
+            'headers': [
+                (b'authorization', f'Bearer {AccessToken.for_user(self.user)}'.encode()),
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+            ],
+        })
+        await communicator.send_input({'type': 'http.request', 'body': body})
+        start = await communicator.receive_output(5)
+        self.assertEqual(start['status'], 200)
+
+        body = ''
+        while 'event: token' not in body:
+            body += (await communicator.receive_output(5))['body'].decode()
+        self.assertNotIn('event: done', body)
+
+        GatedProvider.release.set()
+        while True:
+            event = await communicator.receive_output(5)
+            body += event.get('body', b'').decode()
+            if not event.get('more_body'):
+                break
+        self.assertIn('event: done', body)
+        reply = await sync_to_async(Message.objects.get)(role=Message.Role.ASSISTANT)
+        self.assertEqual(reply.content, 'You said: Hello there')
+
+
+class AgentPresenceTests(APITestCase):
+    """Presence comes from heartbeats in the cache, never from database writes."""
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(email='owner@example.com', password='password')
+        other = User.objects.create_user(email='other@example.com', password='password')
+        self.agents = [Agent.objects.create(user=self.owner, name=f'Agent {i}') for i in range(3)]
+        self.hidden = Agent.objects.create(user=other, name='Hidden')
+        self.client.force_authenticate(self.owner)
+
+    def test_heartbeat(self):
+        url = f'/api/agents/{self.agents[0].id}/heartbeat/'
+        response = self.client.post(url, {'status': 'BUSY'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], Agent.Status.BUSY)
+        self.assertIsNotNone(response.data['last_seen'])
+
+        self.assertEqual(self.client.post(url, {'status': 'OFFLINE'}).data['status'], Agent.Status.OFFLINE)
+        self.assertEqual(self.client.post(f'/api/agents/{self.hidden.id}/heartbeat/').status_code, 404)
+
+    def test_bulk_presence(self):
+        record_heartbeat(self.agents[0].id)
+        record_heartbeat(self.agents[1].id, Agent.Status.BUSY)
+        record_heartbeat(self.hidden.id)
+
+        ids = ','.join(str(agent.id) for agent in [*self.agents, self.hidden])
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/agents/presence/?ids={ids}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {agent_id: data['status'] for agent_id, data in response.json().items()},
+            {
+                str(self.agents[0].id): Agent.Status.ONLINE,
+                str(self.agents[1].id): Agent.Status.BUSY,
+                str(self.agents[2].id): Agent.Status.OFFLINE,
+            }
+        )
+        self.assertEqual(self.client.get('/api/agents/presence/?ids=1,x').status_code, 400)
+
+    def test_agents_serialized_and_filtered_by_presence(self):
+        record_heartbeat(self.agents[1].id, Agent.Status.BUSY)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/agents/')
+        self.assertEqual(
+            [agent['status'] for agent in response.data['results']],
+            [Agent.Status.OFFLINE, Agent.Status.BUSY, Agent.Status.OFFLINE]
+        )
+        response = self.client.get('/api/agents/', {'status': 'BUSY'})
+        self.assertEqual([agent['id'] for agent in response.data['results']], [self.agents[1].id])
+        self.assertEqual(self.client.get(f'/api/agents/{self.agents[1].id}/').data['status'], Agent.Status.BUSY)
+        self.assertEqual(self.client.get('/api/agents/', {'status': 'AWAY'}).status_code, 400)
+
+
+class MessageArchiveTests(APITestCase):
+    """Old messages move to archive segments and history reads through to them."""
+
+    def setUp(self):
+        archive_root = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_root.cleanup)
+        settings_override = override_settings(MESSAGE_ARCHIVE_ROOT=archive_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.owner = User.objects.create_user(email='owner@example.com', password='password')
+        self.customer = User.objects.create_user(email='customer@example.com', password='password')
+        self.agent = Agent.objects.create(user=self.owner, name='Support')
+        self.conversation = Conversation.objects.create(agent=self.agent, user=self.customer)
+        start = timezone.now() - timedelta(days=100)
+        self.messages = []
+        for i in range(10):
+            message = Message.objects.create(
+                agent=self.agent, conversation=self.conversation, content=f'Message {i}',
+                role='user' if i % 2 == 0 else 'assistant', user=self.customer if i % 2 == 0 else None
+            )
+            # The first eight are old enough to archive
+            created_at = start + timedelta(minutes=i) if i < 8 else timezone.now()
+            Message.objects.filter(id=message.id).update(created_at=created_at)
+            self.messages.append(message)
+        self.url = f'/api/agents/{self.agent.id}/messages/history/?conversation={self.conversation.id}&page_size=3'
+
+    def summarize_through(self, message):
+        self.conversation.summarized_through = message
+        self.conversation.save()
+
+    def test_archive_and_read_through(self):
+        self.summarize_through(self.messages[7])
+
+        self.assertEqual(archive_messages(), 7)
+        self.assertEqual(list(Message.objects.values_list('id', flat=True).order_by('id')),
+                         [self.messages[i].id for i in (7, 8, 9)])
+        # One block per sender
+        self.assertEqual(ArchivedMessageBlock.objects.count(), 2)
+
+        self.client.force_authenticate(self.customer)
+        contents, url = [], self.url
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            contents = [message['content'] for message in response.data['results']] + contents
+            url = response.data['previous']
+        self.assertEqual(contents, [f'Message {i}' for i in range(10)])
+        self.assertEqual(response.data['results'][0]['user']['email'], self.customer.email)
+
+        # Scrolling forward again from the oldest page
+        response = self.client.get(response.data['next'])
+        self.assertEqual([message['content'] for message in response.data['results']],
+                         ['Message 1', 'Message 2', 'Message 3'])
+
+    def test_only_summarized_messages_are_archived(self):
+        # Never summarized: the whole history still feeds replies
+        self.assertEqual(archive_messages(), 0)
+        self.summarize_through(self.messages[2])
+        self.assertEqual(archive_messages(), 2)
+        self.assertEqual(Message.objects.count(), 8)
+        self.assertEqual(
+            [msg['content'] for msg in Message.objects.get(id=self.messages[9].id).build_conversation()[1:]],
+            [f'Message {i}' for i in range(3, 10)]
+        )
+
+    def test_archive_respects_permissions(self):
+        self.summarize_through(self.messages[7])
+        self.assertEqual(archive_messages(), 7)
+        self.client.force_authenticate(self.owner)
+        response = self.client.get(f'/api/agents/{self.agent.id}/messages/history/')
+        self.assertEqual(response.data['results'], [])
+
+
+class ExportTests(APITestCase):
+    """Tickets and transcripts stream as CSV or JSON Lines."""
+
+    def setUp(self):
+        archive_root = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_root.cleanup)
+        settings_override = override_settings(MESSAGE_ARCHIVE_ROOT=archive_root.name, EXPORT_CHUNK_SIZE=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create_user(
+            email='admin@example.com', password='password', is_staff=True, role=User.Role.ADMIN
+        )
+        self.customer = User.objects.create_user(email='customer@example.com', password='password')
+        self.agent = Agent.objects.create(user=self.admin, name='Support')
+        for i in range(5):
+            Ticket.objects.create(
+                title=f'Ticket {i}', description='Help, "quoted", please', customer=self.customer,
+                status=Ticket.Status.CLOSED if i == 0 else Ticket.Status.OPEN
+            )
+
+    def test_tickets_csv(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/tickets/export/?status=OPEN')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('filename="tickets.csv"', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['title'] for row in rows], [f'Ticket {i}' for i in (4, 3, 2, 1)])
+        self.assertEqual(rows[0]['description'], 'Help, "quoted", please')
+        self.assertEqual(rows[0]['customer_email'], self.customer.email)
+
+    def test_tickets_jsonl(self):
+        self.client.force_authenticate(self.customer)
+        response = self.client.get('/api/tickets/export/?format=jsonl&status=CLOSED')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Ticket 0'])
+
+        response = self.client.get('/api/tickets/export/?format=jsonl&status=unknown')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('status', json.loads(response.content))
+
+    def test_transcript_includes_archive(self):
+        conversation = Conversation.objects.create(agent=self.agent, user=self.customer)
+        for i in range(4):
+            message = Message.objects.create(
+                agent=self.agent, conversation=conversation, user=self.customer, content=f'Message {i}'
+            )
+            if i < 2:
+                Message.objects.filter(id=message.id).update(created_at=timezone.now() - timedelta(days=100 - i))
+            elif i == 2:
+                conversation.summarized_through = message
+                conversation.save()
+        archive_messages()
+
+        self.client.force_authenticate(self.customer)
+        url = f'/api/agents/{self.agent.id}/messages/export/?format=jsonl&conversation={conversation.id}'
+        response = self.client.get(url)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['content'] for row in rows], [f'Message {i}' for i in range(4)])
+        self.assertEqual(rows[0]['agent'], self.agent.id)
+
+        response = self.client.get(url + '&archived=false')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['content'] for row in rows], ['Message 2', 'Message 3'])
+
+    def test_transcript_merges_senders(self):
+        conversation = Conversation.objects.create(agent=self.agent, user=self.customer)
+        start = timezone.now() - timedelta(days=100)
+        for i in range(7):
+            message = Message.objects.create(
+                agent=self.agent, conversation=conversation, content=f'Message {i}',
+                role='user' if i % 2 == 0 else 'assistant', user=self.customer if i % 2 == 0 else None
+            )
+            Message.objects.filter(id=message.id).update(created_at=start + timedelta(minutes=i))
+        conversation.summarized_through = message
+        conversation.save()
+        # Two segments, each with a block per sender
+        self.assertEqual(archive_messages(segment_size=4), 6)
+        self.assertEqual(ArchivedMessageBlock.objects.count(), 4)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(f'/api/agents/{self.agent.id}/messages/export/?format=jsonl')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['content'] for row in rows], [f'Message {i}' for i in range(7)])
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('export_data', 'tickets', '--format', 'jsonl', '--status', 'OPEN', stdout=output)
+        self.assertEqual(len(output.getvalue().splitlines()), 4)
+
+        with tempfile.NamedTemporaryFile('r', suffix='.csv', newline='') as file:
+            call_command('export_data', 'tickets', '--output', file.name, stdout=io.StringIO())
+            self.assertEqual(len(list(csv.DictReader(file))), 5)
@@ -0,0 +1,306 @@
+"""
+Rate limits and concurrency caps for chat messages.
+
+Sending a chat message triggers an LLM call, so message creation is limited
+with token buckets keyed by agent, user, anonymous visitor and client IP.
+Each bucket holds up to N tokens for a rate of ``'N/period'`` and refills
+continuously, so short bursts are allowed while the average stays within the
+rate. Rates are set in ``CHAT_RATE_LIMITS``.
+
+Buckets live in process memory (``RATE_LIMIT_BACKEND = 'memory'``) or in the
+Django cache (``'cache'``), which is shared by all workers when ``REDIS_URL``
+is set. On Redis each bucket is updated by one Lua script, so concurrent
+requests cannot overspend it; other caches are updated under a process lock.
+
+Client addresses come from DRF's ``get_ident``, which only trusts
+``X-Forwarded-For`` as far as ``NUM_PROXIES`` reverse proxies are configured.
+
+Separately, ``generation_limiter`` caps the generations each agent may have
+in flight (``AGENT_MAX_CONCURRENT_GENERATIONS``), so one busy agent cannot
+starve the others; requests over the cap get a 429 with ``Retry-After``.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.exceptions import Throttled
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from .models import GenerationJob
+from .visitors import Visitor
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+
+def parse_rate(rate):
+    """Parse ``'N/period'`` into (capacity, tokens per second)."""
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period]
+
+
+def take_token(state, capacity, refill_rate, now):
+    """
+    Refill ``state`` (tokens, timestamp) up to ``now`` and take one token.
+
+    Returns the new state and the seconds to wait before a token is
+    available (0 if one was taken).
+    """
+    if state is None:
+        tokens = float(capacity)
+    else:
+        tokens, updated_at = state
+        tokens = min(float(capacity), tokens + (now - updated_at) * refill_rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / refill_rate
+
+
+class MemoryBucketBackend:
+    """Token buckets in process memory, bounded to the ``maxsize`` most recent keys."""
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate):
+        with self._lock:
+            state, wait = take_token(self._buckets.get(key), capacity, refill_rate, time.time())
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# take_token() as one atomic Redis command
+TAKE_TOKEN_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = capacity
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+if state[1] then
+    tokens = math.min(capacity, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * refill_rate)
+end
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / refill_rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+return tostring(wait)
+"""
+
+
+class CacheBucketBackend:
+    """Token buckets in the Django cache, shared between workers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate):
+        # Keep the bucket until it would be full again anyway
+        timeout = math.ceil(capacity / refill_rate) + 1
+        if isinstance(cache, RedisCache):
+            key = cache.make_key(key)
+            client = cache._cache.get_client(key, write=True)
+            return float(client.eval(TAKE_TOKEN_SCRIPT, 1, key, capacity, refill_rate, time.time(), timeout))
+
+        with self._lock:
+            state, wait = take_token(cache.get(key), capacity, refill_rate, time.time())
+            cache.set(key, state, timeout=timeout)
+        return wait
+
+    def clear(self):
+        pass
+
+
+BACKENDS = {
+    'memory': MemoryBucketBackend(),
+    'cache': CacheBucketBackend(),
+}
+
+
+def get_bucket_backend():
+    return BACKENDS[getattr(settings, 'RATE_LIMIT_BACKEND', 'cache')]
+
+
+class ChatRateThrottle(BaseThrottle):
+    """
+    Token bucket throttle for requests that send a chat message.
+
+    Subclasses set ``scope`` (a key of ``CHAT_RATE_LIMITS``) and implement
+    ``get_ident_key``. Safe methods (including CORS preflights) are never
+    throttled.
+    """
+    scope = None
+
+    def get_ident_key(self, request, view):
+        """Return what the bucket is keyed by, or None to skip this throttle."""
+        raise NotImplementedError('.get_ident_key() must be overridden')
+
+    def allow_request(self, request, view):
+        self.delay = 0
+        if request.method in SAFE_METHODS:
+            return True
+
+        rate = getattr(settings, 'CHAT_RATE_LIMITS', {}).get(self.scope)
+        ident = self.get_ident_key(request, view)
+        if rate is None or ident is None:
+            return True
+
+        capacity, refill_rate = parse_rate(rate)
+        key = f'ratelimit:chat:{self.scope}:{ident}'
+        self.delay = get_bucket_backend().consume(key, capacity, refill_rate)
+        return self.delay == 0
+
+    def wait(self):
+        return self.delay
+
+
+def get_view_agent_id(view):
+    return view.kwargs.get('agent_pk') or view.kwargs.get('agent_id')
+
+
+class AgentChatThrottle(ChatRateThrottle):
+    """Limits the messages sent to one agent by everyone together."""
+    scope = 'agent'
+
+    def get_ident_key(self, request, view):
+        return get_view_agent_id(view)
+
+
+class UserChatThrottle(ChatRateThrottle):
+    """Limits the messages an authenticated user sends."""
+    scope = 'user'
+
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
+
+
+class VisitorChatThrottle(ChatRateThrottle):
+    """Limits the messages an anonymous widget visitor sends, by session or IP."""
+    scope = 'visitor'
+
+    def get_ident_key(self, request, view):
+        if isinstance(request.auth, Visitor):
+            return request.auth.id
+        return self.get_ident(request)
+
+
+class IPChatThrottle(ChatRateThrottle):
+    """
+    Limits the messages sent from one address, whoever sends them. This also
+    stops clients from escaping the visitor limit by dropping their session.
+    """
+    scope = 'ip'
+
+    def get_ident_key(self, request, view):
+        return self.get_ident(request)
+
+
+class GenerationLimiter:
+    """
+    Cap on the generations an agent has in flight.
+
+    Replies generated within the request (inline or streamed) hold a slot
+    counted in the Django cache; queued replies count as in flight until
+    their job finishes. Each acquire pushes the counter's expiry
+    ``GENERATION_JOB_LOCK_TIMEOUT`` ahead, so it only expires (recovering
+    slots leaked by a crashed worker) once no generation has started for
+    that long, and releases never take it below zero.
+    """
+
+    def get_timeout(self):
+        return getattr(settings, 'GENERATION_JOB_LOCK_TIMEOUT', 300)
+
+    def get_limit(self):
+        return getattr(settings, 'AGENT_MAX_CONCURRENT_GENERATIONS', 10)
+
+    def get_retry_after(self):
+        return getattr(settings, 'GENERATION_RETRY_AFTER', 5)
+
+    def counter_key(self, agent_id):
+        return f'generations:agent:{agent_id}:in_flight'
+
+    def count_queued(self, agent_id):
+        if not getattr(settings, 'GENERATION_QUEUE_ENABLED', False):
+            return 0
+        return GenerationJob.objects.filter(
+            message__agent_id=agent_id,
+            status__in=[GenerationJob.Status.PENDING, GenerationJob.Status.RUNNING]
+        ).count()
+
+    def reject(self):
+        raise Throttled(
+            wait=self.get_retry_after(),
+            detail='This agent is handling too many messages right now. Please try again shortly.'
+        )
+
+    def check_queue(self, agent_id):
+        """Raise ``Throttled`` if another reply to the agent cannot be queued."""
+        limit = self.get_limit()
+        if not limit:
+            return
+        in_flight = self.count_queued(agent_id) + (cache.get(self.counter_key(agent_id)) or 0)
+        if in_flight >= limit:
+            self.reject()
+
+    def acquire(self, agent_id):
+        """Take a slot for a reply generated within the request, or raise ``Throttled``."""
+        limit = self.get_limit()
+        if not limit:
+            return
+        key = self.counter_key(agent_id)
+        cache.add(key, 0, timeout=self.get_timeout())
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            cache.set(key, 1, timeout=self.get_timeout())
+            count = 1
+        else:
+            # incr() keeps the expiry set by the first add()
+            cache.touch(key, self.get_timeout())
+        if count + self.count_queued(agent_id) > limit:
+            self.release(agent_id)
+            self.reject()
+
+    def release(self, agent_id):
+        if not self.get_limit():
+            return
+        key = self.counter_key(agent_id)
+        try:
+            count = cache.decr(key)
+        except ValueError:
+            return
+        if count < 0:
+            # The counter expired and was recreated while this slot was held
+            cache.incr(key, -count)
+
+    @contextmanager
+    def slot(self, agent_id):
+        self.acquire(agent_id)
+        try:
+            yield
+        finally:
+            self.release(agent_id)
+
+
+generation_limiter = GenerationLimiter()
@@ -1,8 +1,10 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter, SimpleRouter
 from rest_framework_nested import routers
 from . import views
-from .views_widget import WidgetEmbedCodeView, WidgetConfigView
+from .views_widget import (
+    WidgetEmbedCodeView, WidgetConfigView, WidgetBootstrapView, WidgetChatView, WidgetChatJobView
+)
 
 # Main router for top-level endpoints
 router = DefaultRouter()
@@ -12,16 +14,30 @@ router.register(r'tickets', views.TicketViewSet, basename='ticket')
 # Nested router for agent messages
 agent_router = routers.NestedSimpleRouter(router, r'agents', lookup='agent')
 agent_router.register(r'messages', views.MessageViewSet, basename='agent-messages')
+agent_router.register(r'conversations', views.ConversationViewSet, basename='agent-conversations')
+agent_router.register(r'documents', views.KnowledgeDocumentViewSet, basename='agent-documents')
 
 app_name = 'api'
 
 # Widget endpoints
 widget_urls = [
-    path('<uuid:agent_id>/embed-code/', WidgetEmbedCodeView.as_view(), name='widget-embed-code'),
-    path('<uuid:agent_id>/config/', WidgetConfigView.as_view(), name='widget-config'),
+    path('<int:agent_id>/embed-code/', WidgetEmbedCodeView.as_view(), name='widget-embed-code'),
+    path('<int:agent_id>/config/', WidgetConfigView.as_view(), name='widget-config'),
+    path('<int:agent_id>/bootstrap/', WidgetBootstrapView.as_view(), name='widget-bootstrap'),
+]
+
+# Anonymous widget chat; the loader posts to /chat without a trailing slash
+widget_chat_urls = [
+    re_path(r'^agents/(?P<agent_id>\d+)/chat/?$', WidgetChatView.as_view(), name='widget-chat'),
+    re_path(
+        r'^agents/(?P<agent_id>\d+)/chat/jobs/(?P<job_id>\d+)/?$',
+        WidgetChatJobView.as_view(),
+        name='widget-chat-job'
+    ),
 ]
 
 urlpatterns = [
+    path('', include(widget_chat_urls)),
     path('', include(router.urls)),
     path('', include(agent_router.urls)),
     path('widgets/', include((widget_urls, 'widget'), namespace='widget')),
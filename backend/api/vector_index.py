@@ -0,0 +1,257 @@
+"""
+Append-only on-disk vector index with brute-force cosine search.
+
+An index is a directory holding:
+
+- ``meta.json``: the vector dimension and the committed row and payload byte
+  counts
+- ``vectors.f32``: L2-normalized float32 vectors, one row per entry
+- ``payloads.jsonl``: one JSON payload per entry
+- ``offsets.i64``: byte offset of each payload line, for random access
+
+Vectors are memory-mapped for search, so the OS page cache keeps hot indexes
+in memory without loading them into every process. Entries are appended under
+an exclusive file lock and committed by atomically replacing ``meta.json``
+once the data files are synced. Readers only see committed rows, and the next
+writer truncates whatever a crashed writer left past them, so the three files
+never drift out of step.
+"""
+import fcntl
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+VECTOR_DTYPE = np.float32
+OFFSET_DTYPE = np.int64
+
+
+def normalize(vectors):
+    """Return ``vectors`` as a 2-D float32 array of unit-length rows."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=VECTOR_DTYPE))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+class VectorIndex:
+    """A single on-disk vector index. Use ``get_index`` to obtain one."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._offsets = None
+        self._mapped_file = None
+
+    @property
+    def vectors_path(self):
+        return self.path / 'vectors.f32'
+
+    @property
+    def payloads_path(self):
+        return self.path / 'payloads.jsonl'
+
+    @property
+    def offsets_path(self):
+        return self.path / 'offsets.i64'
+
+    @property
+    def meta_path(self):
+        return self.path / 'meta.json'
+
+    @contextmanager
+    def write_lock(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read_meta(self):
+        try:
+            meta = json.loads(self.meta_path.read_text())
+        except FileNotFoundError:
+            return None
+        if 'rows' not in meta:
+            # Written before row counts were committed; trust the whole rows on disk
+            try:
+                meta['rows'] = min(
+                    self.vectors_path.stat().st_size // (meta['dim'] * VECTOR_DTYPE().itemsize),
+                    self.offsets_path.stat().st_size // OFFSET_DTYPE().itemsize,
+                )
+                meta['payload_bytes'] = self.payloads_path.stat().st_size
+            except FileNotFoundError:
+                meta.update(rows=0, payload_bytes=0)
+        return meta
+
+    def write_meta(self, meta):
+        """Atomically replace ``meta.json``, committing the rows it counts."""
+        staging = self.meta_path.with_name('meta.json.tmp')
+        with open(staging, 'w') as meta_file:
+            meta_file.write(json.dumps(meta))
+            meta_file.flush()
+            os.fsync(meta_file.fileno())
+        os.replace(staging, self.meta_path)
+
+    @property
+    def dim(self):
+        meta = self.read_meta()
+        return meta['dim'] if meta else None
+
+    def __len__(self):
+        meta = self.read_meta()
+        return meta['rows'] if meta else 0
+
+    def truncate(self, meta):
+        """Drop anything a crashed writer appended past the committed rows."""
+        rows = meta['rows'] if meta else 0
+        sizes = {
+            self.vectors_path: rows * meta['dim'] * VECTOR_DTYPE().itemsize if meta else 0,
+            self.offsets_path: rows * OFFSET_DTYPE().itemsize,
+            self.payloads_path: meta['payload_bytes'] if meta else 0,
+        }
+        for path, size in sizes.items():
+            try:
+                if path.stat().st_size > size:
+                    os.truncate(path, size)
+            except FileNotFoundError:
+                pass
+
+    def add(self, vectors, payloads):
+        """Append ``vectors`` with their JSON-serializable ``payloads``."""
+        vectors = normalize(vectors)
+        if len(vectors) != len(payloads):
+            raise ValueError('Each vector needs exactly one payload')
+        if not len(vectors):
+            return
+
+        with self.write_lock():
+            meta = self.read_meta()
+            if meta and vectors.shape[1] != meta['dim']:
+                raise ValueError(f'Expected vectors of dimension {meta["dim"]}, got {vectors.shape[1]}')
+            self.truncate(meta)
+
+            offsets = []
+            with open(self.payloads_path, 'ab') as payload_file:
+                for payload in payloads:
+                    offsets.append(payload_file.tell())
+                    payload_file.write(json.dumps(payload).encode('utf-8') + b'\n')
+                payload_bytes = payload_file.tell()
+                payload_file.flush()
+                os.fsync(payload_file.fileno())
+            with open(self.offsets_path, 'ab') as offsets_file:
+                offsets_file.write(np.asarray(offsets, dtype=OFFSET_DTYPE).tobytes())
+                offsets_file.flush()
+                os.fsync(offsets_file.fileno())
+            with open(self.vectors_path, 'ab') as vectors_file:
+                vectors_file.write(vectors.tobytes())
+                vectors_file.flush()
+                os.fsync(vectors_file.fileno())
+
+            self.write_meta({
+                'dim': vectors.shape[1],
+                'rows': (meta['rows'] if meta else 0) + len(vectors),
+                'payload_bytes': payload_bytes,
+            })
+
+    def _mapped(self):
+        """
+        Return memory maps of (vectors, offsets), remapped if the index grew
+        or was rebuilt since they were created.
+        """
+        rows = len(self)
+        try:
+            mapped_file = (self.vectors_path.stat().st_ino, rows)
+        except FileNotFoundError:
+            mapped_file = None
+        with self._lock:
+            if self._vectors is None or self._mapped_file != mapped_file:
+                self._mapped_file = mapped_file
+                if rows == 0:
+                    self._vectors = self._offsets = None
+                else:
+                    self._vectors = np.memmap(
+                        self.vectors_path, dtype=VECTOR_DTYPE, mode='r', shape=(rows, self.dim)
+                    )
+                    self._offsets = np.memmap(
+                        self.offsets_path, dtype=OFFSET_DTYPE, mode='r', shape=(rows,)
+                    )
+            return self._vectors, self._offsets
+
+    def get_payloads(self, rows, offsets=None):
+        if offsets is None:
+            _, offsets = self._mapped()
+        payloads = []
+        with open(self.payloads_path, 'rb') as payload_file:
+            for row in rows:
+                payload_file.seek(int(offsets[row]))
+                payloads.append(json.loads(payload_file.readline()))
+        return payloads
+
+    def search(self, vector, k=1):
+        """
+        Return up to ``k`` ``(score, payload)`` pairs most similar to
+        ``vector``, best first. Scores are cosine similarities.
+        """
+        vectors, offsets = self._mapped()
+        if vectors is None:
+            return []
+
+        query = normalize(vector)[0]
+        if query.shape[0] != vectors.shape[1]:
+            raise ValueError(f'Expected a vector of dimension {vectors.shape[1]}, got {query.shape[0]}')
+
+        scores = vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return list(zip(scores[top].tolist(), self.get_payloads(top, offsets)))
+
+    def rebuild(self, vectors, payloads):
+        """
+        Replace the whole index with ``vectors`` and ``payloads``.
+
+        The new index is written next to the current one and swapped in, so
+        readers see either the old or the new entries.
+        """
+        if not len(payloads):
+            self.clear()
+            return
+
+        staging = get_index(self.path.with_name(self.path.name + '.rebuild'))
+        staging.clear()
+        staging.add(vectors, payloads)
+
+        retired = self.path.with_name(self.path.name + '.old')
+        with self.write_lock():
+            shutil.rmtree(retired, ignore_errors=True)
+            self.path.rename(retired)
+            staging.path.rename(self.path)
+        shutil.rmtree(retired, ignore_errors=True)
+
+    def clear(self):
+        """Delete the index from disk."""
+        with self._lock:
+            self._vectors = self._offsets = None
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path):
+    """Return the process-wide ``VectorIndex`` for ``path``."""
+    path = Path(path)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = VectorIndex(path)
+        return index
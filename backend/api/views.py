@@ -1,18 +1,154 @@
 from rest_framework import viewsets, status, permissions, filters, serializers
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied, NotFound, APIException
+from rest_framework.exceptions import PermissionDenied, NotFound, APIException, ValidationError
+from rest_framework.settings import api_settings
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db import transaction
-from django.db.models import Q
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import DateTimeField, Q, Value
+from django.db.models.functions import Coalesce
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+import codecs
+from asgiref.sync import sync_to_async
 import openai
 
-from .models import Agent, Ticket, Message
-from .serializers import AgentSerializer, TicketSerializer, TicketStatusUpdateSerializer, MessageSerializer
+from .models import (
+    Agent, Ticket, TicketRollup, Conversation, Message, GenerationJob, KnowledgeDocument, ArchivedMessageBlock
+)
+from .serializers import (
+    AgentSerializer, TicketSerializer, TicketStatusUpdateSerializer, MessageSerializer,
+    ConversationSerializer, GenerationJobSerializer, KnowledgeDocumentSerializer,
+    TicketBulkStatusSerializer, TicketBulkPrioritySerializer, TicketBulkAssignSerializer,
+    AgentHeartbeatSerializer
+)
+from .assignment import tracking_load
+from .stats import summarize, tracking_stats
+from .realtime import tickets_updated
+from .presence import get_interval, get_presence, record_heartbeat
+from .imports import FORMATS, detect_format, import_tickets
+from .knowledge import delete_document
+from .pagination import KeysetPagination, ArchivedHistoryPagination
+from .search import (
+    INDEXED_FIELDS, TicketSearchFilter, TicketOrderingFilter, is_supported, search_tickets,
+    update_search_index
+)
+from .throttling import AgentChatThrottle, UserChatThrottle, IPChatThrottle, generation_limiter
+from .jobs import enqueue_generation, wait_for_job
+from .renderers import CSVRenderer, EventStreamRenderer, JSONLinesRenderer, format_sse
+from .exports import FORMATS as EXPORT_FORMATS, MESSAGE_COLUMNS, TICKET_COLUMNS, encode_export, iter_rows, iter_transcript
 from users.models import User
 
+def wants_event_stream(request):
+    """
+    Return True if the client asked for a server-sent event stream, either
+    with ``Accept: text/event-stream``/``?format=sse`` or ``?stream=true``.
+    """
+    if isinstance(request.accepted_renderer, EventStreamRenderer):
+        return True
+    return request.query_params.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+async def iterate_in_thread(iterator):
+    """
+    Yield the chunks of a sync ``iterator``, each produced in a worker thread.
+    
+    Under ASGI, Django reads a sync streaming body to the end before sending
+    any of it; an async iterator is sent chunk by chunk instead.
+    """
+    iterator = iter(iterator)
+    done = object()
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk(iterator, done)
+            if chunk is done:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close, thread_sensitive=True)()
+
+
+def streaming_response(request, chunks, on_close=None, **kwargs):
+    """
+    A ``StreamingHttpResponse`` that streams under both WSGI and ASGI.
+    
+    ``on_close`` is called when the server closes the response, which it
+    does even if the client went away before the body was read.
+    """
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = iterate_in_thread(chunks)
+    response = StreamingHttpResponse(chunks, **kwargs)
+    if on_close is not None:
+        response._resource_closers.append(on_close)
+    return response
+
+
+def stream_agent_reply(request, message, message_data, events=()):
+    """
+    Stream the agent's reply to ``message`` as server-sent events.
+    
+    Emits any extra ``(event, data)`` pairs in ``events``, a ``user_message``
+    event, one ``token`` event per text delta and a final ``agent_message``
+    event once the full reply has been saved. The caller must hold a
+    generation slot for the agent; it is released when the response is
+    closed, whether or not the stream was read.
+    """
+    def event_stream():
+        for event, data in events:
+            yield format_sse(event, data)
+        yield format_sse('user_message', message_data)
+        
+        parts = []
+        for delta in message.stream_agent_response():
+            parts.append(delta)
+            yield format_sse('token', {'delta': delta})
+        
+        content = ''.join(parts).strip()
+        if not content:
+            yield format_sse('done', {'agent_message': None})
+            return
+        
+        agent_message = message.save_agent_response(content)
+        yield format_sse('agent_message', MessageSerializer(agent_message).data)
+        yield format_sse('done', {'agent_message': agent_message.id})
+    
+    response = streaming_response(
+        request,
+        event_stream(),
+        on_close=lambda: generation_limiter.release(message.agent_id),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx and similar proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Exports honour ?format=csv|jsonl and Accept; errors are still JSON by default
+EXPORT_RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + [CSVRenderer, JSONLinesRenderer]
+
+
+def export_response(request, columns, rows, filename):
+    """Stream `rows` as CSV (the default) or JSON Lines, as the client asked."""
+    fmt = request.accepted_renderer.format
+    if fmt not in EXPORT_FORMATS:
+        fmt = 'csv'
+    response = streaming_response(
+        request,
+        encode_export(fmt, columns, rows),
+        content_type=f'{EXPORT_FORMATS[fmt]}; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
 class IsAdminOrReadOnly(permissions.BasePermission):
     """
     Custom permission to only allow admin users to edit objects.
@@ -29,21 +165,43 @@ class IsOwnerOrAdmin(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.user.is_staff:
             return True
-        return obj.customer == request.user or (hasattr(obj, 'agent') and obj.agent.user == request.user)
+        # Compare ids so no related rows are loaded just to check ownership
+        return obj.customer_id == request.user.id or (
+            obj.agent_id is not None and obj.agent.user_id == request.user.id
+        )
+
+    def filter_editable(self, request, queryset):
+        """Set-wise counterpart of `has_object_permission` for bulk updates."""
+        if request.user.is_staff:
+            return queryset
+        return queryset.filter(Q(customer=request.user) | Q(agent__user=request.user))
 
 class AgentViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows agents to be viewed or edited.
     """
-    queryset = Agent.objects.all()
+    queryset = Agent.objects.select_related('user')
     serializer_class = AgentSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['is_active', 'status']
+    filterset_fields = ['is_active']
     search_fields = ['name', 'description', 'user__email']
     ordering_fields = ['name', 'created_at', 'updated_at']
     ordering = ['name']
 
+    def filter_queryset(self, queryset):
+        """Apply the list filters, and `?status=` on heartbeat presence (see `api.presence`)."""
+        queryset = super().filter_queryset(queryset)
+        agent_status = self.request.query_params.get('status')
+        if agent_status:
+            if agent_status not in Agent.Status.values:
+                raise ValidationError({'status': f'Expected one of {", ".join(Agent.Status.values)}.'})
+            presence = get_presence(queryset.order_by().values_list('id', flat=True))
+            queryset = queryset.filter(id__in=[
+                agent_id for agent_id, data in presence.items() if data['status'] == agent_status
+            ])
+        return queryset
+
     def get_queryset(self):
         """
         Return agents based on the user's role:
@@ -82,13 +240,45 @@ class AgentViewSet(viewsets.ModelViewSet):
         
         agent = self.get_object()
         agent.is_active = not agent.is_active
-        agent.save()
+        agent.save(update_fields=['is_active', 'updated_at'])
         
         return Response({
             'id': agent.id,
             'is_active': agent.is_active,
             'message': f'Agent {agent.name} is now {"active" if agent.is_active else "inactive"}.'
         })
+    
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def heartbeat(self, request, pk=None):
+        """
+        Report that the agent is being attended, as `ONLINE` or `BUSY`;
+        `OFFLINE` signs off. Presence expires unless renewed.
+        """
+        agent = self.get_object()
+        serializer = AgentHeartbeatSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        record_heartbeat(agent.id, serializer.validated_data['status'])
+        return Response({
+            'id': agent.id,
+            **get_presence([agent.id])[agent.id],
+            'heartbeat_interval': get_interval()
+        })
+    
+    @action(detail=False, methods=['get'])
+    def presence(self, request):
+        """
+        Presence of many agents in one call: those in `?ids=1,2,3`, or all
+        agents matching the list filters. Agents you cannot see are left out.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        ids = request.query_params.get('ids')
+        if ids:
+            try:
+                queryset = queryset.filter(id__in=[int(agent_id) for agent_id in ids.split(',') if agent_id])
+            except ValueError:
+                raise ValidationError({'ids': 'Expected a comma-separated list of agent ids.'})
+        agent_ids = queryset.order_by().values_list('id', flat=True)
+        return Response(get_presence(agent_ids))
 
 class TicketViewSet(viewsets.ModelViewSet):
     """
@@ -96,10 +286,13 @@ class TicketViewSet(viewsets.ModelViewSet):
     """
     serializer_class = TicketSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdmin]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = KeysetPagination
+    # Search uses the full-text index and orders results by relevance
+    filter_backends = [DjangoFilterBackend, TicketSearchFilter, TicketOrderingFilter]
     filterset_fields = ['status', 'priority', 'agent', 'customer']
     search_fields = ['title', 'description', 'customer__email', 'agent__name']
-    ordering_fields = ['created_at', 'updated_at', 'closed_at', 'priority']
+    # Keyset pagination needs a non-nullable ordering field
+    ordering_fields = ['created_at', 'updated_at', 'priority']
     ordering = ['-created_at']
 
     def get_queryset(self):
@@ -108,7 +301,9 @@ class TicketViewSet(viewsets.ModelViewSet):
         or only the tickets related to the current user (as customer or agent).
         """
         user = self.request.user
-        queryset = Ticket.objects.all()
+        # Load the customer and the agent with its user, which the serializer
+        # and permission checks need, in the same query
+        queryset = Ticket.objects.select_related('customer', 'agent__user')
         
         if user.is_staff:
             return queryset
@@ -137,13 +332,13 @@ class TicketViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             # Only allow status update if user is staff, the ticket owner, or the assigned agent
             if (request.user.is_staff or 
-                ticket.customer == request.user or 
-                (ticket.agent and ticket.agent.user == request.user)):
+                ticket.customer_id == request.user.id or 
+                (ticket.agent_id and ticket.agent.user_id == request.user.id)):
                 
                 ticket.status = serializer.validated_data['status']
                 if ticket.status == Ticket.Status.CLOSED and not ticket.closed_at:
                     ticket.closed_at = timezone.now()
-                ticket.save()
+                ticket.save(update_fields=['status', 'closed_at', 'updated_at'])
                 
                 return Response(
                     {'status': 'Status updated', 'new_status': ticket.get_status_display()},
@@ -189,6 +384,231 @@ class TicketViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=False, methods=['get'], renderer_classes=EXPORT_RENDERER_CLASSES)
+    def export(self, request):
+        """
+        Stream every ticket matching the list filters, search and ordering,
+        as CSV (`?format=csv`, the default) or JSON Lines (`?format=jsonl`).
+        """
+        tickets = self.filter_queryset(self.get_queryset())
+        return export_response(request, TICKET_COLUMNS, iter_rows(tickets, TICKET_COLUMNS), 'tickets')
+    
+    def get_bulk_queryset(self, data):
+        """Return the tickets selected by a bulk update's `ids` or `filter`."""
+        queryset = self.get_queryset()
+        if 'ids' in data:
+            return queryset.filter(id__in=data['ids'])
+        
+        params = dict(data['filter'])
+        search = str(params.pop('search', '') or '')
+        unknown = set(params) - set(self.filterset_fields)
+        if unknown:
+            raise ValidationError({'filter': f'Unknown filter(s): {", ".join(sorted(unknown))}'})
+        
+        filterset_class = DjangoFilterBackend().get_filterset_class(self, queryset)
+        filterset = filterset_class(data=params, queryset=queryset, request=self.request)
+        if not filterset.is_valid():
+            raise ValidationError({'filter': filterset.errors})
+        queryset = filterset.qs
+        
+        if search.strip():
+            if not is_supported():
+                raise ValidationError({'filter': 'search is not supported on this database.'})
+            queryset = search_tickets(queryset, search)
+        return queryset
+
+    def bulk_update(self, request, serializer_class, get_changes, staff_only=False):
+        """
+        Apply the changes returned by `get_changes(validated_data)` to the
+        selected tickets in one UPDATE. Permissions are checked for the whole
+        set first; nothing is changed if any ticket may not be edited.
+        """
+        if staff_only and not request.user.is_staff:
+            return Response(
+                {"detail": "You do not have permission to perform this action."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        serializer = serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        max_tickets = getattr(settings, 'TICKET_BULK_MAX_TICKETS', 5000)
+        
+        with transaction.atomic():
+            selected = self.get_bulk_queryset(data)
+            ids = list(selected.order_by().values_list('id', flat=True)[:max_tickets + 1])
+            if len(ids) > max_tickets:
+                raise ValidationError(f'A bulk update may change at most {max_tickets} tickets.')
+            
+            if 'ids' in data:
+                missing = set(data['ids']) - set(ids)
+                if missing:
+                    raise NotFound(f'Tickets not found: {", ".join(map(str, sorted(missing)))}')
+            
+            editable = set(
+                IsOwnerOrAdmin().filter_editable(request, Ticket.objects.filter(id__in=ids))
+                .order_by().values_list('id', flat=True)
+            )
+            denied = set(ids) - editable
+            if denied:
+                return Response(
+                    {
+                        'detail': 'You do not have permission to update these tickets.',
+                        'ids': sorted(denied)
+                    },
+                    status=status.HTTP_403_FORBIDDEN
+                )
+            
+            changes = get_changes(data)
+            with tracking_load(ids), tracking_stats(ids):
+                updated = Ticket.objects.filter(id__in=ids).update(updated_at=timezone.now(), **changes)
+            # update() sends no signals, so re-index tickets whose indexed fields changed
+            # and push the changes to WebSocket clients here
+            if INDEXED_FIELDS & set(changes):
+                update_search_index(Ticket.objects.filter(id__in=ids))
+            tickets_updated(Ticket.objects.filter(id__in=ids))
+        
+        return Response({'updated': updated, 'ids': ids}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        Ticket counts by status, priority and agent, and resolution times,
+        read from the statistics rollup. Admins see every ticket; other users
+        the tickets assigned to their agents. Filter with `?agent=<id>`.
+        """
+        rollups = TicketRollup.objects.select_related('agent')
+        if not request.user.is_staff:
+            rollups = rollups.filter(agent__user=request.user)
+        
+        agent_id = request.query_params.get('agent')
+        if agent_id:
+            if not agent_id.isdigit():
+                return Response({'agent': 'A valid integer is required.'}, status=status.HTTP_400_BAD_REQUEST)
+            rollups = rollups.filter(agent_id=agent_id)
+        
+        return Response(summarize(rollups))
+
+    @action(detail=False, methods=['post'], url_path='bulk/status')
+    def bulk_update_status(self, request):
+        """
+        Change the status of many tickets. Closing sets `closed_at` unless the
+        ticket was already closed; any other status clears it.
+        """
+        def get_changes(data):
+            if data['status'] == Ticket.Status.CLOSED:
+                closed_at = Coalesce('closed_at', Value(timezone.now(), output_field=DateTimeField()))
+            else:
+                closed_at = None
+            return {'status': data['status'], 'closed_at': closed_at}
+        
+        return self.bulk_update(request, TicketBulkStatusSerializer, get_changes)
+
+    @action(detail=False, methods=['post'], url_path='bulk/priority')
+    def bulk_update_priority(self, request):
+        """Change the priority of many tickets."""
+        return self.bulk_update(
+            request, TicketBulkPrioritySerializer, lambda data: {'priority': data['priority']}
+        )
+
+    @action(detail=False, methods=['post'], url_path='bulk/assign')
+    def bulk_assign_agent(self, request):
+        """
+        Assign many tickets to an agent and mark them in progress.
+        Only accessible by admin users.
+        """
+        return self.bulk_update(
+            request,
+            TicketBulkAssignSerializer,
+            lambda data: {
+                'agent': data['agent_id'],
+                'status': Ticket.Status.IN_PROGRESS,
+                'closed_at': None,
+            },
+            staff_only=True
+        )
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_tickets(self, request):
+        """
+        Import tickets from an uploaded CSV or JSON Lines `file`, creating
+        missing customers. Only accessible by admin users.
+        """
+        if not request.user.is_staff:
+            return Response(
+                {"detail": "You do not have permission to perform this action."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': 'No file was uploaded.'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        fmt = request.data.get('format') or detect_format(upload.name)
+        if fmt not in FORMATS:
+            return Response(
+                {'format': f'Pass one of: {", ".join(FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Rows are decoded and imported as the upload is read
+        lines = codecs.iterdecode(upload, 'utf-8-sig', errors='replace')
+        result = import_tickets(lines, fmt)
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
+
+
+class ConversationViewSet(viewsets.ModelViewSet):
+    """
+    API endpoint that allows chat sessions with a specific agent to be listed
+    or started.
+    """
+    serializer_class = ConversationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def get_agent(self):
+        return get_object_or_404(Agent, id=self.kwargs.get('agent_pk'), is_active=True)
+
+    def get_queryset(self):
+        """
+        Return conversations with the specified agent.
+        Non-admin users only see their own conversations.
+        """
+        queryset = Conversation.objects.filter(agent=self.get_agent())
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        return queryset
+
+    def perform_create(self, serializer):
+        """Start a new conversation between the current user and the agent."""
+        serializer.save(agent=self.get_agent(), user=self.request.user)
+
+
+class KnowledgeDocumentViewSet(viewsets.ModelViewSet):
+    """
+    API endpoint that allows an agent's knowledge base documents to be viewed
+    or edited. Uploaded documents are indexed by `manage.py ingest_knowledge`.
+    """
+    serializer_class = KnowledgeDocumentSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdminOrReadOnly]
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def get_agent(self):
+        queryset = Agent.objects.all()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        return get_object_or_404(queryset, id=self.kwargs.get('agent_pk'))
+
+    def get_queryset(self):
+        return KnowledgeDocument.objects.filter(agent=self.get_agent())
+
+    def perform_create(self, serializer):
+        serializer.save(agent=self.get_agent())
+
+    def perform_destroy(self, instance):
+        """Delete the document and rebuild the agent's index without it."""
+        delete_document(instance)
+
 
 class MessageViewSet(viewsets.ModelViewSet):
     """
@@ -196,10 +616,18 @@ class MessageViewSet(viewsets.ModelViewSet):
     """
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + [EventStreamRenderer]
+    pagination_class = KeysetPagination
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['created_at']
     ordering = ['created_at']
 
+    def get_throttles(self):
+        """Sending a message is rate limited; reading messages is not."""
+        if self.action == 'create':
+            return [AgentChatThrottle(), UserChatThrottle(), IPChatThrottle()]
+        return super().get_throttles()
+
     def get_queryset(self):
         """
         Return messages for the specified agent.
@@ -212,14 +640,41 @@ class MessageViewSet(viewsets.ModelViewSet):
         # Verify agent exists and is active
         agent = get_object_or_404(Agent, id=agent_id, is_active=True)
         
-        queryset = Message.objects.filter(agent=agent)
+        queryset = Message.objects.filter(agent=agent).select_related('user')
         
-        # Non-admin users can only see their own messages
+        # Non-admin users can only see their own messages and the replies in
+        # their conversations
         if not self.request.user.is_staff:
-            queryset = queryset.filter(user=self.request.user)
+            queryset = queryset.filter(
+                Q(user=self.request.user) |
+                Q(conversation__user=self.request.user)
+            )
+        
+        conversation_id = self.request.query_params.get('conversation')
+        if conversation_id:
+            queryset = queryset.filter(conversation_id=conversation_id)
             
         return queryset
     
+    def save_message(self, agent, serializer):
+        """
+        Save the user's message, attaching it to the requested conversation or
+        to the user's latest conversation with the agent (starting one if
+        needed).
+        """
+        user = self.request.user
+        conversation = serializer.validated_data.get('conversation')
+        if conversation is None:
+            conversation = (
+                Conversation.objects.latest_for(agent, user) or
+                Conversation.objects.create(agent=agent, user=user)
+            )
+        elif conversation.agent_id != agent.id or (
+                conversation.user_id != user.id and not user.is_staff):
+            raise serializers.ValidationError({'conversation': 'Invalid conversation for this agent.'})
+        
+        return serializer.save(user=user, conversation=conversation)
+    
     def create(self, request, *args, **kwargs):
         """Create a new message for the specified agent and generate a response."""
         agent_id = self.kwargs.get('agent_pk')
@@ -236,50 +691,155 @@ class MessageViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
         
+        if self.wants_stream(request):
+            # The stream releases the generation slot once the reply is done
+            generation_limiter.acquire(agent.id)
+            try:
+                # Commit the user's message before streaming so the response
+                # is not generated inside a transaction.
+                message = self.save_message(agent, serializer)
+            except Exception:
+                generation_limiter.release(agent.id)
+                raise
+            return self.stream_response(agent, message, serializer.data)
+        
+        if not getattr(settings, 'GENERATION_QUEUE_ENABLED', False):
+            with generation_limiter.slot(agent.id):
+                return self.create_inline(agent, serializer)
+        
+        if serializer.validated_data.get('role') == Message.Role.USER:
+            generation_limiter.check_queue(agent.id)
+        
         try:
             with transaction.atomic():
-                # Save the user's message
-                message = serializer.save(user=request.user)
+                # Save the user's message and queue the agent's reply in the same
+                # transaction; the LLM call itself happens in a worker.
+                message = self.save_message(agent, serializer)
+                job = enqueue_generation(message) if message.role == 'user' else None
+        except DatabaseError as e:
+            raise APIException(f"Error processing message: {str(e)}")
+        
+        headers = self.get_success_headers(serializer.data)
+        if job is None:
+            return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        
+        return Response(
+            {
+                'user_message': serializer.data,
+                'job': GenerationJobSerializer(job).data
+            },
+            status=status.HTTP_202_ACCEPTED,
+            headers=headers
+        )
+    
+    def create_inline(self, agent, serializer):
+        """
+        Save the user's message and generate the reply within the request.
+        
+        Used when the generation queue is disabled. The user's message is
+        committed before the LLM is called so no transaction is held open
+        during generation.
+        """
+        message = self.save_message(agent, serializer)
+        try:
+            # Only generate response for user messages
+            if message.role == 'user':
+                # Generate agent response
+                agent_response_content = message.generate_agent_response()
                 
-                # Only generate response for user messages
-                if message.role == 'user':
-                    # Generate agent response
-                    agent_response_content = message.generate_agent_response()
+                if agent_response_content:
+                    # Create agent's response message
+                    agent_message = message.save_agent_response(agent_response_content)
                     
-                    if agent_response_content:
-                        # Create agent's response message
-                        agent_message = Message.objects.create(
-                            agent=agent,
-                            content=agent_response_content,
-                            role='assistant',
-                            user=None  # System-generated message
-                        )
-                        
-                        # Include both messages in the response
-                        response_data = {
-                            'user_message': serializer.data,
-                            'agent_message': self.get_serializer(agent_message).data
-                        }
-                        
-                        return Response(
-                            response_data,
-                            status=status.HTTP_201_CREATED,
-                            headers=self.get_success_headers(serializer.data)
-                        )
-                
-                # If no agent response was generated, just return the user's message
-                return Response(
-                    serializer.data,
-                    status=status.HTTP_201_CREATED,
-                    headers=self.get_success_headers(serializer.data)
-                )
-                
+                    # Include both messages in the response
+                    response_data = {
+                        'user_message': serializer.data,
+                        'agent_message': self.get_serializer(agent_message).data
+                    }
+                    
+                    return Response(
+                        response_data,
+                        status=status.HTTP_201_CREATED,
+                        headers=self.get_success_headers(serializer.data)
+                    )
+            
+            # If no agent response was generated, just return the user's message
+            return Response(
+                serializer.data,
+                status=status.HTTP_201_CREATED,
+                headers=self.get_success_headers(serializer.data)
+            )
+            
         except Exception as e:
             raise APIException(f"Error processing message: {str(e)}")
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'], url_path=r'jobs/(?P<job_id>\d+)')
+    def job(self, request, agent_pk=None, job_id=None):
+        """
+        Get the status of a reply generation job.
+        
+        Pass ``?wait=<seconds>`` to long-poll until the job has finished (capped
+        by ``GENERATION_JOB_MAX_WAIT``).
+        """
+        job = get_object_or_404(
+            GenerationJob.objects.select_related('message', 'response'),
+            id=job_id,
+            message__agent_id=agent_pk
+        )
+        if not request.user.is_staff and job.message.user_id != request.user.id:
+            raise NotFound("Job not found")
+        
+        try:
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError:
+            raise serializers.ValidationError({'wait': 'Must be a number of seconds.'})
+        wait = min(max(wait, 0), getattr(settings, 'GENERATION_JOB_MAX_WAIT', 5))
+        if wait and not job.is_finished:
+            job = wait_for_job(job, wait)
+        
+        return Response(GenerationJobSerializer(job).data)
+    
+    def wants_stream(self, request):
+        return wants_event_stream(request)
+    
+    def stream_response(self, agent, message, message_data):
+        """Stream the agent's reply to ``message`` as server-sent events."""
+        return stream_agent_reply(self.request, message, message_data)
+    
+    def get_archived_blocks(self):
+        """The archived message blocks (see `api.archive`) matching `get_queryset`."""
+        blocks = ArchivedMessageBlock.objects.filter(agent_id=self.kwargs.get('agent_pk'))
+        if not self.request.user.is_staff:
+            blocks = blocks.filter(
+                Q(user=self.request.user) |
+                Q(conversation__user=self.request.user)
+            )
+        conversation_id = self.request.query_params.get('conversation')
+        if conversation_id:
+            blocks = blocks.filter(conversation_id=conversation_id)
+        return blocks
+    
+    @action(detail=False, methods=['get'], renderer_classes=EXPORT_RENDERER_CLASSES)
+    def export(self, request, agent_pk=None):
+        """
+        Stream the messages `history` would list, archived ones included
+        unless `?archived=false`, as CSV or JSON Lines (`?format=`).
+        """
+        blocks = None
+        if request.query_params.get('archived', 'true').lower() not in ('false', '0'):
+            blocks = self.get_archived_blocks()
+        messages = iter_transcript(self.get_queryset(), blocks)
+        return export_response(request, MESSAGE_COLUMNS, messages, f'agent-{agent_pk}-messages')
+    
+    @action(detail=False, methods=['get'], pagination_class=ArchivedHistoryPagination)
     def history(self, request, agent_pk=None):
-        """Get chat history for the specified agent."""
+        """
+        Get chat history for the specified agent.
+        
+        Opens on the newest page (oldest message first within the page); follow
+        the ``previous`` link to scroll back, past the live messages into the
+        archived ones.
+        """
         messages = self.get_queryset()
         page = self.paginate_queryset(messages)
         if page is not None:
@@ -1,17 +1,37 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import status, serializers
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.settings import api_settings
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.conf import settings
-from api.models import Agent
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from api.cache import LocalCache, agent_cache_key
+from api.jobs import enqueue_generation, wait_for_job
+from api.models import Agent, Conversation, GenerationJob, Message
+from api.presence import is_online
+from api.renderers import EventStreamRenderer
+from api.serializers import GenerationJobSerializer, MessageSerializer
+from api.throttling import AgentChatThrottle, IPChatThrottle, VisitorChatThrottle, generation_limiter
+from api.views import stream_agent_reply, wants_event_stream
+from api.visitors import VISITOR_TOKEN_HEADER, Visitor, VisitorTokenAuthentication, get_visitor
+from users.authentication import CachedJWTAuthentication
+import hashlib
 import json
 
+# Rendered widget configs, keyed by agent version
+widget_config_cache = LocalCache(maxsize=10000, ttl=300)
+
 class WidgetEmbedCodeView(APIView):
     """
     API endpoint to generate embed code for the chat widget.
     """
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, agent_id):
@@ -60,35 +80,289 @@ class WidgetEmbedCodeView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+def render_entry(status_code, payload):
+    """Cache entry holding a response's status, payload, JSON body and ETag."""
+    body = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+    return {
+        'status': status_code,
+        'payload': payload,
+        'body': body,
+        'etag': f'"{hashlib.sha1(body).hexdigest()}"',
+    }
+
+
+def get_public_agent(agent_id):
+    return Agent.objects.filter(id=agent_id, is_active=True).first()
+
+
+def build_widget_config(agent_id, online):
+    """Render an agent's public widget config."""
+    agent = get_public_agent(agent_id)
+    if agent is None:
+        return render_entry(status.HTTP_404_NOT_FOUND, {'success': False, 'error': 'Agent not found or inactive'})
+    
+    return render_entry(status.HTTP_200_OK, {
+        'success': True,
+        'data': {
+            'agent_id': str(agent.id),
+            'name': agent.name,
+            'description': agent.description,
+            'widget_config': agent.widget_config,
+            'is_online': online
+        }
+    })
+
+
+def build_widget_bootstrap(agent_id, online):
+    """Render the parts of the widget bootstrap payload shared by all visitors."""
+    agent = get_public_agent(agent_id)
+    if agent is None:
+        return render_entry(status.HTTP_404_NOT_FOUND, {'success': False, 'error': 'Agent not found or inactive'})
+    
+    return render_entry(status.HTTP_200_OK, {
+        'success': True,
+        'data': {
+            'agent_id': str(agent.id),
+            'name': agent.name,
+            'widget_config': agent.widget_config,
+            'welcome_message': agent.welcome_message,
+            'is_online': online,
+            'conversation': None,
+            'messages': []
+        }
+    })
+
+
+def get_widget_entry(agent_id, name, build):
+    """
+    Return a cached widget response entry for an agent, building it on a miss.
+    
+    Entries are keyed by the agent's cache version, which is bumped whenever
+    the agent is saved, and by whether the agent is online (see
+    ``api.presence``), so a warm lookup costs two shared cache reads and
+    never touches the database. Not-found entries are only kept in the
+    bounded local cache, so clients probing ids cannot fill the shared one.
+    """
+    online = is_online(agent_id)
+    key = agent_cache_key(agent_id, f"{name}:{'online' if online else 'offline'}")
+    entry = widget_config_cache.get(key)
+    if entry is None:
+        entry = cache.get(key)
+        if entry is None:
+            entry = build(agent_id, online)
+            if entry['status'] == status.HTTP_200_OK:
+                cache.set(key, entry, timeout=getattr(settings, 'WIDGET_CONFIG_CACHE_TTL', 3600))
+        widget_config_cache.set(key, entry)
+    return entry
+
+
+def cached_entry_response(request, entry):
+    """
+    Serve a cache entry with an ETag and public caching headers, answering
+    If-None-Match with a 304 when it has not changed.
+    """
+    response = HttpResponse(entry['body'], status=entry['status'], content_type='application/json')
+    if entry['status'] != status.HTTP_200_OK:
+        return response
+    
+    response['ETag'] = entry['etag']
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=getattr(settings, 'WIDGET_CONFIG_MAX_AGE', 60)
+    )
+    return get_conditional_response(request, etag=entry['etag'], response=response)
+
+
 class WidgetConfigView(APIView):
     """
     API endpoint to get widget configuration.
-    Public endpoint used by the widget.
+    Public endpoint used by the widget, served from the cache with an ETag
+    so browsers and CDNs can revalidate it cheaply.
     """
+    authentication_classes = []
     permission_classes = [AllowAny]
     
     def get(self, request, agent_id):
-        try:
-            agent = Agent.objects.get(id=agent_id, is_active=True)
-            
-            return Response({
-                'success': True,
-                'data': {
-                    'agent_id': str(agent.id),
-                    'name': agent.name,
-                    'description': agent.description,
-                    'widget_config': agent.widget_config,
-                    'is_online': agent.is_online
-                }
-            })
-            
-        except Agent.DoesNotExist:
+        return cached_entry_response(request, get_widget_entry(agent_id, 'widget_config', build_widget_config))
+
+
+class WidgetBootstrapView(APIView):
+    """
+    API endpoint returning everything the widget needs to start in one
+    request: config, welcome message, online status and, for a returning
+    visitor, the tail of their latest conversation.
+    
+    The shared part is cached per agent version. Anonymous visitors get it
+    with public caching headers; the conversation tail is added per request
+    and marked private.
+    """
+    authentication_classes = [CachedJWTAuthentication, VisitorTokenAuthentication]
+    permission_classes = [AllowAny]
+    
+    def get_conversation(self, request, agent_id):
+        """The visitor's latest conversation with the agent, if they are known."""
+        if request.user.is_authenticated:
+            return Conversation.objects.latest_for(agent_id, request.user)
+        if isinstance(request.auth, Visitor) and request.auth.agent_id == agent_id:
+            return Conversation.objects.latest_for_visitor(agent_id, request.auth.id)
+        return None
+    
+    def get_history(self, conversation):
+        limit = getattr(settings, 'WIDGET_BOOTSTRAP_HISTORY', 20)
+        messages = conversation.messages.order_by('-created_at', '-id')[:limit]
+        return [
+            {
+                'id': msg.id,
+                'role': msg.role,
+                'content': msg.content,
+                'created_at': msg.created_at,
+            }
+            for msg in reversed(messages)
+        ]
+    
+    def get(self, request, agent_id):
+        entry = get_widget_entry(agent_id, 'widget_bootstrap', build_widget_bootstrap)
+        conversation = None
+        if entry['status'] == status.HTTP_200_OK:
+            conversation = self.get_conversation(request, agent_id)
+        
+        if conversation is None:
+            response = cached_entry_response(request, entry)
+        else:
+            payload = dict(entry['payload'])
+            payload['data'] = dict(payload['data'], conversation=conversation.id, messages=self.get_history(conversation))
+            response = HttpResponse(
+                json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':')),
+                content_type='application/json'
+            )
+            patch_cache_control(response, private=True, no_cache=True)
+        
+        # The payload depends on who is asking
+        patch_vary_headers(response, ['Authorization', VISITOR_TOKEN_HEADER])
+        return response
+
+
+class WidgetChatView(APIView):
+    """
+    Public chat endpoint for anonymous website visitors.
+    
+    Visitors are identified by a signed session token (see ``api.visitors``)
+    instead of a user account. Every response includes a refreshed
+    ``session`` token to send back in the ``X-Visitor-Token`` header. Replies
+    are streamed, queued or generated inline just like authenticated chat
+    messages.
+    """
+    authentication_classes = [VisitorTokenAuthentication]
+    permission_classes = [AllowAny]
+    renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + [EventStreamRenderer]
+    throttle_classes = [AgentChatThrottle, VisitorChatThrottle, IPChatThrottle]
+    
+    def get_message_content(self, request):
+        content = request.data.get('message') or request.data.get('content') or ''
+        if not isinstance(content, str) or not content.strip():
+            raise serializers.ValidationError({'message': 'This field is required.'})
+        max_length = getattr(settings, 'WIDGET_MESSAGE_MAX_LENGTH', 4000)
+        if len(content) > max_length:
+            raise serializers.ValidationError(
+                {'message': f'Ensure this field has no more than {max_length} characters.'}
+            )
+        return content.strip()
+    
+    def save_message(self, agent, visitor, content):
+        """Save the visitor's message in their latest conversation, starting one if needed."""
+        conversation = (
+            Conversation.objects.latest_for_visitor(agent, visitor.id) or
+            Conversation.objects.create(agent=agent, visitor_id=visitor.id)
+        )
+        return Message.objects.create(
+            agent=agent,
+            conversation=conversation,
+            content=content,
+            role=Message.Role.USER
+        )
+    
+    def post(self, request, agent_id):
+        agent = get_public_agent(agent_id)
+        if agent is None:
             return Response(
                 {'success': False, 'error': 'Agent not found or inactive'},
                 status=status.HTTP_404_NOT_FOUND
             )
-        except Exception as e:
-            return Response(
-                {'success': False, 'error': str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        
+        content = self.get_message_content(request)
+        visitor = get_visitor(request, agent.id)
+        session = visitor.get_token()
+        
+        if wants_event_stream(request):
+            # The stream releases the generation slot once the reply is done
+            generation_limiter.acquire(agent.id)
+            try:
+                message = self.save_message(agent, visitor, content)
+            except Exception:
+                generation_limiter.release(agent.id)
+                raise
+            return stream_agent_reply(
+                request,
+                message,
+                MessageSerializer(message).data,
+                events=[('session', {'session': session, 'conversation': message.conversation_id})]
             )
+        
+        if not getattr(settings, 'GENERATION_QUEUE_ENABLED', False):
+            with generation_limiter.slot(agent.id):
+                message = self.save_message(agent, visitor, content)
+                try:
+                    reply = message.generate_agent_response()
+                except Exception as e:
+                    raise APIException(f"Error processing message: {str(e)}")
+                agent_message = message.save_agent_response(reply) if reply else None
+            return Response({
+                'session': session,
+                'conversation': message.conversation_id,
+                'user_message': MessageSerializer(message).data,
+                'agent_message': MessageSerializer(agent_message).data if agent_message else None
+            }, status=status.HTTP_201_CREATED)
+        
+        generation_limiter.check_queue(agent.id)
+        with transaction.atomic():
+            message = self.save_message(agent, visitor, content)
+            job = enqueue_generation(message)
+        
+        return Response({
+            'session': session,
+            'conversation': message.conversation_id,
+            'user_message': MessageSerializer(message).data,
+            'job': GenerationJobSerializer(job).data
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class WidgetChatJobView(APIView):
+    """
+    Get the status of the reply to a visitor's message.
+    
+    Pass ``?wait=<seconds>`` to long-poll until the reply is ready.
+    """
+    authentication_classes = [VisitorTokenAuthentication]
+    permission_classes = [AllowAny]
+    
+    def get(self, request, agent_id, job_id):
+        visitor = request.auth if isinstance(request.auth, Visitor) else None
+        if visitor is None or visitor.agent_id != int(agent_id):
+            raise NotFound("Job not found")
+        
+        job = get_object_or_404(
+            GenerationJob.objects.select_related('response'),
+            id=job_id,
+            message__agent_id=agent_id,
+            message__conversation__visitor_id=visitor.id
+        )
+        try:
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError:
+            raise serializers.ValidationError({'wait': 'Must be a number of seconds.'})
+        wait = min(max(wait, 0), getattr(settings, 'GENERATION_JOB_MAX_WAIT', 5))
+        if wait and not job.is_finished:
+            job = wait_for_job(job, wait)
+        
+        return Response(GenerationJobSerializer(job).data)
@@ -0,0 +1,74 @@
+"""
+Anonymous widget visitors.
+
+Website visitors chatting through the embeddable widget have no ``User`` row.
+Each one gets a random visitor id inside a signed, timestamped session token
+that the widget sends back in the ``X-Visitor-Token`` header. Tokens are
+verified with ``SECRET_KEY`` alone, so no per-visitor state is stored; their
+conversations are tagged with the visitor id instead of a user.
+"""
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from rest_framework.authentication import BaseAuthentication
+
+VISITOR_TOKEN_HEADER = 'X-Visitor-Token'
+
+VISITOR_TOKEN_SALT = 'api.visitors.session'
+
+
+class Visitor:
+    """An anonymous widget visitor, available as ``request.auth``."""
+
+    def __init__(self, agent_id, visitor_id=None):
+        self.agent_id = int(agent_id)
+        self.id = visitor_id or uuid.uuid4().hex
+
+    def __repr__(self):
+        return f'<Visitor {self.id} of agent {self.agent_id}>'
+
+    def get_token(self):
+        """A fresh session token; reissued on each response so active sessions never expire."""
+        return signing.dumps({'a': self.agent_id, 'v': self.id}, salt=VISITOR_TOKEN_SALT)
+
+    @classmethod
+    def from_token(cls, token):
+        """Return the visitor of a valid, unexpired token, or None."""
+        try:
+            data = signing.loads(
+                token,
+                salt=VISITOR_TOKEN_SALT,
+                max_age=getattr(settings, 'WIDGET_SESSION_MAX_AGE', 30 * 24 * 3600)
+            )
+            return cls(data['a'], data['v'])
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            return None
+
+
+def get_visitor(request, agent_id):
+    """Return the request's visitor for ``agent_id``, or a new visitor."""
+    visitor = request.auth if isinstance(request.auth, Visitor) else None
+    if visitor is None or visitor.agent_id != int(agent_id):
+        visitor = Visitor(agent_id)
+    return visitor
+
+
+class VisitorTokenAuthentication(BaseAuthentication):
+    """
+    Identify anonymous widget visitors by their session token.
+
+    The request stays anonymous (``request.user`` is an ``AnonymousUser``)
+    and ``request.auth`` is the ``Visitor``. Invalid or expired tokens are
+    ignored rather than rejected, so the visitor just starts a new session.
+    """
+
+    def authenticate(self, request):
+        token = request.META.get('HTTP_' + VISITOR_TOKEN_HEADER.upper().replace('-', '_'))
+        if not token:
+            return None
+        visitor = Visitor.from_token(token)
+        if visitor is None:
+            return None
+        return (AnonymousUser(), visitor)
@@ -2,6 +2,8 @@
 ASGI config for support_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django; WebSocket connections to ``/ws/`` receive
+real-time updates (see ``api.consumers``).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,18 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'support_backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from api.consumers import websocket_application  # noqa: E402
+
+WEBSOCKET_PATHS = ('/ws', '/ws/')
+
+
+async def application(scope, receive, send):
+    if scope['type'] != 'websocket':
+        return await django_application(scope, receive, send)
+    if scope['path'] not in WEBSOCKET_PATHS:
+        await receive()
+        return await send({'type': 'websocket.close'})
+    return await websocket_application(scope, receive, send)
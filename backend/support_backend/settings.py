@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 import os
 
 # Load environment variables from .env file
@@ -22,6 +23,56 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 # OpenAI API Key
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+
+# LLM provider used for agent replies: 'openai', 'fake' (offline echo provider)
+# or a dotted path to a provider class
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'openai')
+
+# Shared LLM HTTP client settings (timeouts in seconds)
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '5'))
+LLM_MAX_RETRIES = 2
+LLM_MAX_CONNECTIONS = 100
+LLM_MAX_KEEPALIVE_CONNECTIONS = 20
+LLM_KEEPALIVE_EXPIRY = 60
+
+# Generate agent replies in `manage.py run_generation_worker` processes instead
+# of within the request. Only enable it when such a worker is deployed.
+GENERATION_QUEUE_ENABLED = os.getenv('GENERATION_QUEUE_ENABLED', 'False') == 'True'
+GENERATION_JOB_MAX_ATTEMPTS = 3
+GENERATION_JOB_LOCK_TIMEOUT = 300  # seconds before a running job is retried
+GENERATION_JOB_MAX_WAIT = 5  # longest allowed ?wait= on the job endpoints; each wait holds a worker
+
+# Chat rate limits ('<requests>/<s|min|hour|day>'), enforced as token buckets
+# allowing bursts of up to <requests>. RATE_LIMIT_BACKEND is 'cache' (shared
+# through CACHES) or 'memory' (per process).
+CHAT_RATE_LIMITS = {
+    'agent': os.getenv('CHAT_RATE_LIMIT_AGENT', '300/min'),
+    'user': os.getenv('CHAT_RATE_LIMIT_USER', '20/min'),
+    'visitor': os.getenv('CHAT_RATE_LIMIT_VISITOR', '10/min'),
+    'ip': os.getenv('CHAT_RATE_LIMIT_IP', '60/min'),
+}
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'cache')
+# Replies each agent may have in flight (queued or generating); further
+# messages get a 429 asking to retry after GENERATION_RETRY_AFTER seconds.
+AGENT_MAX_CONCURRENT_GENERATIONS = int(os.getenv('AGENT_MAX_CONCURRENT_GENERATIONS', 10))
+GENERATION_RETRY_AFTER = 5
+
+# Conversation context sent to the model with each turn. Recent turns are sent
+# verbatim up to CONTEXT_HISTORY_TOKEN_BUDGET tokens; when the budget is
+# exceeded, older turns are folded into a stored rolling summary, keeping the
+# newest CONTEXT_KEEP_RATIO of the budget verbatim.
+CONTEXT_HISTORY_TOKEN_BUDGET = 3000
+CONTEXT_KEEP_RATIO = 0.5
+CONTEXT_SUMMARY_MAX_TOKENS = 300
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-4': 8192,
+    'gpt-4-turbo': 128000,
+    'gpt-4o': 128000,
+    'gpt-4o-mini': 128000,
+    'gpt-3.5-turbo': 16385,
+}
 
 
 # Quick-start development settings - unsuitable for production
@@ -98,6 +149,113 @@ DATABASES = {
 }
 
 
+# Cache
+# Shared by all workers when REDIS_URL is set; per-process memory otherwise.
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Agent cache versions (see api.cache) expire after AGENT_CACHE_VERSION_TTL
+# seconds without a change; an expired version is reseeded, which only costs
+# the agent's cached entries being rebuilt once.
+AGENT_CACHE_VERSION_TTL = 24 * 3600
+
+# Agent reply cache (for agents with cache_responses enabled). Entries live in
+# an in-process LRU for RESPONSE_CACHE_LOCAL_TTL seconds and in the shared
+# cache above for RESPONSE_CACHE_TTL seconds.
+RESPONSE_CACHE_TTL = 3600
+RESPONSE_CACHE_LOCAL_TTL = 300
+RESPONSE_CACHE_LOCAL_MAXSIZE = 1000
+
+# Users authenticated by JWT are cached for USER_AUTH_CACHE_TTL seconds, or
+# until they are saved (password change, profile update, deactivation). Only
+# enabled with a shared cache (REDIS_URL), unless USER_AUTH_CACHE_ENABLED is set:
+# a per-process cache would keep deactivated users signed in on other workers.
+USER_AUTH_CACHE_TTL = 300
+
+# Public widget config: rendered once per agent version and cached for
+# WIDGET_CONFIG_CACHE_TTL seconds; browsers and CDNs may reuse it for
+# WIDGET_CONFIG_MAX_AGE seconds before revalidating with its ETag.
+WIDGET_CONFIG_CACHE_TTL = 3600
+WIDGET_CONFIG_MAX_AGE = int(os.getenv('WIDGET_CONFIG_MAX_AGE', 60))
+# Number of recent messages returned to a returning visitor on widget bootstrap
+WIDGET_BOOTSTRAP_HISTORY = 20
+# Anonymous widget visitors: session tokens expire after WIDGET_SESSION_MAX_AGE
+# seconds without activity
+WIDGET_SESSION_MAX_AGE = int(os.getenv('WIDGET_SESSION_MAX_AGE', 30 * 24 * 3600))
+WIDGET_MESSAGE_MAX_LENGTH = 4000
+
+# Embeddings and on-disk vector indexes (semantic answer cache)
+EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small')
+VECTOR_INDEX_ROOT = os.getenv('VECTOR_INDEX_ROOT', BASE_DIR / 'var' / 'vector_indexes')
+
+# Message archive: `manage.py archive_messages` moves messages older than
+# MESSAGE_ARCHIVE_AFTER_DAYS into compressed segment files ('gzip', or 'zstd'
+# with the zstandard package) of up to MESSAGE_ARCHIVE_SEGMENT_SIZE messages.
+MESSAGE_ARCHIVE_ROOT = os.getenv('MESSAGE_ARCHIVE_ROOT', BASE_DIR / 'var' / 'message_archive')
+MESSAGE_ARCHIVE_AFTER_DAYS = int(os.getenv('MESSAGE_ARCHIVE_AFTER_DAYS', 90))
+MESSAGE_ARCHIVE_COMPRESSION = os.getenv('MESSAGE_ARCHIVE_COMPRESSION', 'gzip')
+MESSAGE_ARCHIVE_SEGMENT_SIZE = 10000
+
+# Knowledge base retrieval: documents are split into chunks of
+# KNOWLEDGE_CHUNK_WORDS words and the KNOWLEDGE_TOP_K chunks most similar to
+# the user's message (scoring at least KNOWLEDGE_MIN_SCORE) go in the prompt.
+KNOWLEDGE_CHUNK_WORDS = 200
+KNOWLEDGE_CHUNK_OVERLAP = 40
+KNOWLEDGE_EMBED_BATCH_SIZE = 64
+KNOWLEDGE_TOP_K = 4
+KNOWLEDGE_MIN_SCORE = 0.2
+# Seconds after which a document stuck PROCESSING (crashed worker) is retried
+KNOWLEDGE_INGEST_TIMEOUT = 600
+
+# Automatic ticket routing: new unassigned tickets go to the online (then
+# busy) agent with the fewest open tickets. Agents with TICKET_ROUTING_MAX_OPEN
+# open tickets only receive high and urgent ones.
+TICKET_AUTO_ROUTING = os.getenv('TICKET_AUTO_ROUTING', 'True') == 'True'
+TICKET_ROUTING_MAX_OPEN = 25
+
+# Real-time updates over WebSockets (/ws/ on the ASGI application).
+# REALTIME_CHANNEL_LAYER is 'redis' (shared by all workers through REDIS_URL)
+# or 'memory' (per process). Clients more than REALTIME_QUEUE_SIZE events
+# behind lose the oldest ones.
+REALTIME_REDIS_URL = os.getenv('REDIS_URL')
+REALTIME_CHANNEL_LAYER = os.getenv('REALTIME_CHANNEL_LAYER', 'redis' if REALTIME_REDIS_URL else 'memory')
+# The memory layer only reaches clients of the process that published the
+# event, so it cannot serve replies saved by generation workers or several
+# web workers (WEB_CONCURRENCY, read by gunicorn).
+if REALTIME_CHANNEL_LAYER == 'memory' and (
+        GENERATION_QUEUE_ENABLED or int(os.getenv('WEB_CONCURRENCY', 1)) > 1):
+    raise ImproperlyConfigured(
+        "REALTIME_CHANNEL_LAYER='memory' only works with a single web worker and "
+        "GENERATION_QUEUE_ENABLED=False; set REDIS_URL to share events between processes."
+    )
+REALTIME_QUEUE_SIZE = 100
+REALTIME_MAX_SUBSCRIPTIONS = 50
+
+# Agent presence: dashboards send a heartbeat every AGENT_HEARTBEAT_INTERVAL
+# seconds; agents without one for AGENT_PRESENCE_TTL seconds are offline.
+AGENT_HEARTBEAT_INTERVAL = 30
+AGENT_PRESENCE_TTL = 90
+
+# Bulk ticket import: rows inserted per transaction
+TICKET_IMPORT_BATCH_SIZE = 1000
+# Ticket and transcript exports: rows fetched and written at a time
+EXPORT_CHUNK_SIZE = 2000
+# Bulk ticket updates: most tickets one request may change
+TICKET_BULK_MAX_TICKETS = 5000
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -155,7 +313,7 @@ AUTH_USER_MODEL = 'users.User'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
@@ -163,6 +321,9 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # Reverse proxies in front of the app; X-Forwarded-For is only trusted
+    # that far, so clients cannot pick the address they are rate limited by.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
 # JWT Settings
@@ -201,8 +362,12 @@ SIMPLE_JWT = {
 }
 
 # CORS settings (for development)
+from corsheaders.defaults import default_headers as default_cors_headers
+
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 CORS_ALLOW_CREDENTIALS = True
+# Widget visitors send their session token in a custom header
+CORS_ALLOW_HEADERS = (*default_cors_headers, 'x-visitor-token')
 
 # Email settings (for password reset, etc.)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # For development
@@ -0,0 +1,41 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import get_cached_user, is_enabled, set_cached_user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that resolves the token's user from the cache.
+
+    The user row is loaded once and reused until the user changes (see
+    ``users.cache``); the active and revoked-token checks still run on every
+    request. Without a shared cache the user is loaded on every request.
+    """
+
+    def get_user(self, validated_token):
+        if not is_enabled():
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = get_cached_user(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            set_cached_user(user)
+            return user
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(
+                _("The user's password has been changed."), code='password_changed'
+            )
+        return user
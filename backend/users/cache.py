@@ -0,0 +1,74 @@
+"""
+Cache of authenticated users.
+
+JWT-authenticated requests would otherwise load the user row on every call.
+Users are cached under a per-user version kept in the shared Django cache; the
+version is bumped whenever the user is saved or deleted (see
+``users.signals``), so a password change, profile update or deactivation takes
+effect on the next request. Code that changes users without ``save()``
+(``QuerySet.update()``) must call ``bump_user_version`` itself.
+
+Invalidation only reaches every worker through a shared cache, so users are
+only cached when ``CACHES['default']`` is shared (Redis, Memcached, ...);
+with a per-process cache each request loads the user from the database.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+# Caches private to one process, whose invalidations other workers never see
+LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+def is_enabled():
+    """
+    Whether authenticated users are cached: ``USER_AUTH_CACHE_ENABLED``, or by
+    default whether the default cache is shared between workers.
+    """
+    enabled = getattr(settings, 'USER_AUTH_CACHE_ENABLED', None)
+    if enabled is None:
+        return not isinstance(caches['default'], LOCAL_CACHES)
+    return enabled
+
+
+def user_version_key(user_id):
+    return f'user:{user_id}:version'
+
+
+def get_user_version(user_id):
+    """Return the current cache version of a user."""
+    version = cache.get(user_version_key(user_id))
+    if version is None:
+        # Seeded with a timestamp, as for agents, so a flushed version never
+        # resurrects a stale entry.
+        version = int(time.time() * 1000)
+        if not cache.add(user_version_key(user_id), version, timeout=None):
+            version = cache.get(user_version_key(user_id), version)
+    return version
+
+
+def user_cache_key(user_id):
+    return f'user:{user_id}:v{get_user_version(user_id)}:auth'
+
+
+def bump_user_version(user_id):
+    """Invalidate the cached copy of a user."""
+    try:
+        return cache.incr(user_version_key(user_id))
+    except ValueError:
+        return get_user_version(user_id)
+
+
+def get_cached_user(user_id):
+    return cache.get(user_cache_key(user_id))
+
+
+def set_cached_user(user):
+    cache.set(
+        user_cache_key(user.pk),
+        user,
+        timeout=getattr(settings, 'USER_AUTH_CACHE_TTL', 300)
+    )
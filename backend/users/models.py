@@ -59,3 +59,6 @@ class User(AbstractUser):
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
+        indexes = [
+            models.Index(fields=['role'], name='users_user_role_idx'),
+        ]
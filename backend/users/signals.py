@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_user_version
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """Drop the cached copy used to authenticate the user's requests."""
+    bump_user_version(instance.pk)
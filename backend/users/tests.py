@@ -1,3 +1,54 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from .models import User
+
+
+@override_settings(USER_AUTH_CACHE_ENABLED=True)
+class CachedJWTAuthenticationTests(APITestCase):
+    """JWT requests reuse the cached user until it changes."""
+
+    url = '/api/auth/check-auth/'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='user@example.com', password='password')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_cached_user_skips_database(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_invalidated_on_profile_update(self):
+        self.client.get(self.url)
+        self.user.first_name = 'Ada'
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).data['first_name'], 'Ada')
+
+    def test_invalidated_on_password_change(self):
+        self.client.get(self.url)
+        response = self.client.put('/api/auth/change-password/', {
+            'old_password': 'password', 'new_password': 'new-password-123', 'new_password2': 'new-password-123'
+        })
+        self.assertEqual(response.status_code, 200, response.data)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_deactivated_user_rejected(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    @override_settings(USER_AUTH_CACHE_ENABLED=None)
+    def test_not_cached_in_process_local_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        # Another worker deactivating the user leaves this process's cache alone
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
@@ -58,14 +58,14 @@ class ChangePasswordView(generics.UpdateAPIView):
         
         if serializer.is_valid():
             # Check old password
-            if not self.object.check_password(serializer.data.get("old_password")):
+            if not self.object.check_password(serializer.validated_data.get("old_password")):
                 return Response(
                     {"old_password": ["Wrong password."]}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
             # Set new password
-            self.object.set_password(serializer.data.get("new_password"))
+            self.object.set_password(serializer.validated_data.get("new_password"))
             self.object.save()
             
             return Response(
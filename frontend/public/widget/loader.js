@@ -10,6 +10,7 @@
     zIndex: 9999,
     autoOpen: false,
     hideWhenOffline: false,
+    apiUrl: null,
   };
 
   // Merge default config with data attributes
@@ -44,6 +45,11 @@
       return null;
     }
 
+    // Talk to the server the script was loaded from unless told otherwise
+    if (!config.apiUrl) {
+      config.apiUrl = new URL(script.src, window.location.href).origin;
+    }
+
     return config;
   }
 
@@ -352,6 +358,137 @@
     return container;
   }
 
+  // Anonymous visitors are identified by a signed session token issued by
+  // the server; keep it per agent so returning visitors see their history
+  function getSessionKey(config) {
+    return `support-widget-session-${config.agentId}`;
+  }
+
+  function getSessionHeaders(config) {
+    try {
+      const session = window.localStorage.getItem(getSessionKey(config));
+      return session ? { 'X-Visitor-Token': session } : {};
+    } catch (error) {
+      return {};
+    }
+  }
+
+  function saveSession(config, session) {
+    try {
+      window.localStorage.setItem(getSessionKey(config), session);
+    } catch (error) {
+      // Storage may be unavailable (e.g. private browsing); the session just
+      // won't survive a page reload
+    }
+  }
+
+  // Resolve to the agent's reply pushed over a WebSocket, or to null when
+  // WebSockets are unavailable, fail or time out so the caller polls instead
+  function waitForReply(config, data, jobUrl) {
+    return new Promise((resolve) => {
+      let socket;
+      try {
+        const url = new URL('/ws/', config.apiUrl);
+        url.protocol = url.protocol === 'https:' ? 'wss:' : 'ws:';
+        url.searchParams.set('visitor', data.session);
+        socket = new WebSocket(url.toString());
+      } catch (error) {
+        resolve(null);
+        return;
+      }
+
+      let done = false;
+      const finish = (reply) => {
+        if (done) return;
+        done = true;
+        clearTimeout(timer);
+        socket.close();
+        resolve(reply);
+      };
+      const timer = setTimeout(() => finish(null), 30000);
+
+      socket.onopen = () => {
+        socket.send(JSON.stringify({ action: 'subscribe', stream: 'conversation', id: data.conversation }));
+      };
+      socket.onmessage = async (event) => {
+        const payload = JSON.parse(event.data);
+        if (payload.type === 'error') {
+          finish(null);
+        } else if (payload.type === 'subscribed') {
+          // The reply may have been saved before we subscribed
+          const poll = await fetch(jobUrl, { headers: getSessionHeaders(config) });
+          const job = poll.ok ? await poll.json() : null;
+          if (!job || job.status === 'COMPLETED' || job.status === 'FAILED') {
+            finish(null);
+          }
+        } else if (payload.type === 'message.created' && payload.data.role === 'assistant' &&
+                   payload.data.id > data.user_message.id) {
+          finish(payload.data);
+        }
+      };
+      socket.onerror = () => finish(null);
+      socket.onclose = () => finish(null);
+    });
+  }
+
+  // Send a visitor message and wait for the agent's reply
+  async function sendMessage(config, message) {
+    const baseUrl = `${config.apiUrl}/api/agents/${config.agentId}/chat`;
+    const response = await fetch(baseUrl, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        ...getSessionHeaders(config),
+      },
+      body: JSON.stringify({ message })
+    });
+    if (!response.ok) {
+      throw new Error(`Chat request failed with status ${response.status}`);
+    }
+
+    const data = await response.json();
+    saveSession(config, data.session);
+    if (!data.job) {
+      return data.agent_message;
+    }
+
+    // The reply is generated in the background; wait for it over a
+    // WebSocket, or long-poll until it is ready
+    const reply = await waitForReply(config, data, `${baseUrl}/jobs/${data.job.id}/`);
+    if (reply) {
+      return reply;
+    }
+    let job = data.job;
+    while (job.status !== 'COMPLETED' && job.status !== 'FAILED') {
+      const poll = await fetch(`${baseUrl}/jobs/${job.id}/?wait=25`, {
+        headers: getSessionHeaders(config)
+      });
+      if (!poll.ok) {
+        throw new Error(`Polling failed with status ${poll.status}`);
+      }
+      job = await poll.json();
+    }
+    if (job.status === 'FAILED') {
+      throw new Error(job.error);
+    }
+    return job.response;
+  }
+
+  // Fetch config, welcome message, online status and recent history at once
+  async function loadBootstrap(config) {
+    try {
+      const response = await fetch(`${config.apiUrl}/api/widgets/${config.agentId}/bootstrap/`, {
+        headers: getSessionHeaders(config)
+      });
+      if (!response.ok) return null;
+      const payload = await response.json();
+      return payload.data;
+    } catch (error) {
+      console.error('Error loading widget:', error);
+      return null;
+    }
+  }
+
   // Initialize the widget
   function init() {
     const config = getConfig();
@@ -377,6 +514,20 @@
     document.body.appendChild(widgetContainer);
     document.body.appendChild(widgetButton);
 
+    // Apply the server-side settings as soon as they arrive
+    loadBootstrap(config).then((data) => {
+      if (!data) return;
+      if (data.welcome_message) {
+        welcomeMessage.textContent = data.welcome_message;
+      }
+      if (config.hideWhenOffline && !data.is_online) {
+        widgetButton.style.display = 'none';
+      }
+      data.messages.forEach((msg) => {
+        addMessage(msg.role === 'user' ? 'user' : 'bot', msg.content);
+      });
+    });
+
     // Show welcome message after a short delay
     setTimeout(() => {
       welcomeMessage.style.opacity = '1';
@@ -428,32 +579,18 @@
       typingIndicator.style.display = 'block';
       messageArea.scrollTop = messageArea.scrollHeight;
       
-      // Simulate bot response (in a real app, this would be an API call)
-      setTimeout(() => {
-        typingIndicator.style.display = 'none';
-        addMessage('bot', "I'm a demo bot. In a real implementation, I would connect to your Lyzr agent here!");
-      }, 1500);
-      
-      // In a real implementation, you would make an API call to your backend:
-      /*
       try {
-        const response = await fetch(`/api/agents/${config.agentId}/chat`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify({ message })
-        });
-        
-        const data = await response.json();
+        const reply = await sendMessage(config, message);
         typingIndicator.style.display = 'none';
-        addMessage('bot', data.response);
+        if (reply) {
+          addMessage('bot', reply.content);
+          showNotification();
+        }
       } catch (error) {
         console.error('Error sending message:', error);
         typingIndicator.style.display = 'none';
         addMessage('bot', 'Sorry, there was an error processing your message.');
       }
-      */
     });
 
     // Add a message to the chat
@@ -530,11 +667,7 @@
         toggleWidget(true);
       }, 1000);
     }
-    
-    // Example: Simulate a notification after 5 seconds
-    setTimeout(() => {
-      showNotification();
-    }, 5000);
+
   }
 
   // Initialize when DOM is loaded
@@ -5,7 +5,7 @@ import { useEffect, useRef, useState } from 'react';
 import { toast } from 'sonner';
 import { agentsApi } from '@/lib/api';
 import type { Agent } from '@/types';
-import { Message, ChatMessage } from '@/types/message';
+import { Message, ChatMessage, GenerationJob } from '@/types/message';
 import Button from '@/components/ui/button';
 import { ChevronLeft, RefreshCw, Send, Loader2, Ticket } from 'lucide-react';
 import { CreateTicketFromChat } from '@/features/tickets/components/CreateTicketFromChat';
@@ -289,6 +289,28 @@ export default function AgentChatPage() {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
 
+  const toChatMessage = (msg: any, role: 'user' | 'assistant'): ChatMessage => ({
+    id: msg.id || `msg-${Date.now()}`,
+    content: msg.content || '',
+    role,
+    isUser: role === 'user',
+    createdAt: msg.created_at || msg.createdAt || new Date().toISOString(),
+    updatedAt: msg.updated_at || msg.updatedAt || new Date().toISOString(),
+    agent: typeof msg.agent === 'string' ? msg.agent : agent?.id,
+    user: msg.user || '',
+  });
+  
+  // Poll a queued reply until its job has completed or failed
+  const waitForJob = async (agentId: string, job: GenerationJob): Promise<GenerationJob> => {
+    const deadline = Date.now() + 2 * 60 * 1000;
+    while (job.status !== 'COMPLETED' && job.status !== 'FAILED' && Date.now() < deadline) {
+      // The server holds each poll for up to a few seconds while the job runs
+      const response = await agentsApi.getMessageJob(agentId, job.id, 5);
+      job = response.data;
+    }
+    return job;
+  };
+  
   const handleSendMessage = async (e: React.FormEvent) => {
     e.preventDefault();
     
@@ -360,10 +382,33 @@ export default function AgentChatPage() {
                typeof data === 'object' && 
                ('id' in data || 'content' in data);
       };
+      // Type guard to check if the reply was queued as a generation job
+      const isQueuedMessage = (data: any): data is { user_message: any; job: GenerationJob } => {
+        return data && 
+               typeof data === 'object' && 
+               'user_message' in data && 
+               'job' in data;
+      };
       const messagesToAdd: ChatMessage[] = [];
       
       // Handle the response which may contain both user and agent messages
-      if (isDualMessage(responseData)) {
+      if (isQueuedMessage(responseData)) {
+        // Case 0: The reply is generated in the background; poll its job
+        const { user_message: userMsg } = responseData;
+        setMessages(prev => [
+          ...prev.filter(msg => msg.id !== tempMessageId),
+          toChatMessage(userMsg, 'user')
+        ]);
+        
+        const job = await waitForJob(agent.id, responseData.job);
+        if (job.status !== 'COMPLETED') {
+          toast.error('The agent could not reply. Please try again.');
+          return;
+        }
+        if (job.response) {
+          messagesToAdd.push(toChatMessage(job.response, 'assistant'));
+        }
+      } else if (isDualMessage(responseData)) {
         // Case 1: Response contains both user and agent messages
         const { user_message: userMsg, agent_message: agentMsg } = responseData;
         
@@ -118,11 +118,10 @@ export default function AgentsPage() {
     try {
       setIsToggling(id);
       const newActiveState = !isActive;
-      const newStatus = newActiveState ? 'ONLINE' : 'OFFLINE';
       
-      // Update the agent's status directly
+      // Status is heartbeat presence and read-only, so toggle is_active
       const response = await agentsApi.updateAgent(id, { 
-        status: newStatus
+        is_active: newActiveState
       } as any); // Using type assertion as a last resort
       
       // The response data is in response.data.data according to ApiResponse<T>
@@ -134,7 +133,7 @@ export default function AgentsPage() {
               ...agent, 
               is_active: newActiveState,
               isActive: newActiveState, // For backward compatibility
-              status: updatedAgent?.status || newStatus,
+              status: updatedAgent?.status || agent.status,
               // Preserve existing widget config
               widget_config: agent.widget_config || {}
             }
@@ -2,14 +2,30 @@
 
 import { useRouter } from 'next/navigation';
 import { useEffect } from 'react';
+import { useQuery } from '@tanstack/react-query';
 import { useAuth } from '@/contexts/AuthContext';
 import Button from '@/components/ui/button';
 import { LogOut, Bot, MessageSquare, Settings } from 'lucide-react';
 import Link from 'next/link';
+import { getTicketStats } from '@/features/tickets/api/tickets';
+import { TicketStats } from '@/features/tickets/types';
+
+function formatDuration(seconds: number | null) {
+  if (seconds === null) return '—';
+  const hours = seconds / 3600;
+  if (hours < 1) return `${Math.round(seconds / 60)}m`;
+  if (hours < 48) return `${hours.toFixed(1)}h`;
+  return `${(hours / 24).toFixed(1)}d`;
+}
 
 export default function DashboardPage() {
   const { user, logout, isAuthenticated } = useAuth();
   const router = useRouter();
+  const { data: stats } = useQuery<TicketStats>({
+    queryKey: ['ticket-stats'],
+    queryFn: getTicketStats,
+    enabled: isAuthenticated,
+  });
 
   useEffect(() => {
     if (!isAuthenticated) {
@@ -102,6 +118,52 @@ export default function DashboardPage() {
               </Link>
             </div>
 
+            {/* Ticket Overview Section */}
+            {stats && (
+              <div className="mt-8">
+                <h2 className="text-lg font-medium text-gray-900 mb-4">Tickets</h2>
+                <div className="grid grid-cols-2 gap-6 lg:grid-cols-4">
+                  {[
+                    { label: 'Total', value: stats.total },
+                    { label: 'Open', value: stats.open },
+                    { label: 'Resolved', value: stats.resolution.resolved },
+                    { label: 'Avg. resolution', value: formatDuration(stats.resolution.average_seconds) },
+                  ].map(({ label, value }) => (
+                    <div key={label} className="bg-white shadow rounded-lg p-6">
+                      <p className="text-sm text-gray-500">{label}</p>
+                      <p className="mt-1 text-2xl font-semibold text-gray-900">{value}</p>
+                    </div>
+                  ))}
+                </div>
+                {stats.by_agent.length > 0 && (
+                  <div className="mt-6 bg-white shadow overflow-hidden sm:rounded-lg">
+                    <table className="min-w-full divide-y divide-gray-200">
+                      <thead className="bg-gray-50">
+                        <tr>
+                          <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase">Agent</th>
+                          <th className="px-6 py-3 text-right text-xs font-medium text-gray-500 uppercase">Open</th>
+                          <th className="px-6 py-3 text-right text-xs font-medium text-gray-500 uppercase">Total</th>
+                          <th className="px-6 py-3 text-right text-xs font-medium text-gray-500 uppercase">Avg. resolution</th>
+                        </tr>
+                      </thead>
+                      <tbody className="divide-y divide-gray-200">
+                        {stats.by_agent.map((agent) => (
+                          <tr key={agent.agent ?? 'unassigned'}>
+                            <td className="px-6 py-3 text-sm text-gray-900">{agent.name ?? 'Unassigned'}</td>
+                            <td className="px-6 py-3 text-sm text-right text-gray-700">{agent.open}</td>
+                            <td className="px-6 py-3 text-sm text-right text-gray-700">{agent.total}</td>
+                            <td className="px-6 py-3 text-sm text-right text-gray-700">
+                              {formatDuration(agent.average_resolution_seconds)}
+                            </td>
+                          </tr>
+                        ))}
+                      </tbody>
+                    </table>
+                  </div>
+                )}
+              </div>
+            )}
+
             {/* Recent Activity Section */}
             <div className="mt-8">
               <h2 className="text-lg font-medium text-gray-900 mb-4">Recent Activity</h2>
@@ -1,6 +1,6 @@
 // Import types from the root types file to avoid conflicts
 import { Ticket as ApiTicket, ApiResponse } from '@/types';
-import { Ticket, Comment, Agent, User } from '../types';
+import { Ticket, Comment, Agent, User, TicketStats } from '../types';
 import api from '@/lib/api';
 
 // Helper type for the API response structure
@@ -411,3 +411,10 @@ export async function getTicketHistory(ticketId: string): Promise<Array<{
   const response = await fetchWithAuth(`${API_URL}/api/tickets/${ticketId}/history/`);
   return response.json();
 }
+
+// Dashboard statistics, read from the server-side rollup rather than
+// aggregated from the ticket list
+export async function getTicketStats(): Promise<TicketStats> {
+  const response = await api.get<TicketStats>('/tickets/stats/');
+  return response.data;
+}
@@ -60,3 +60,26 @@ export interface AssignAgentData {
 export interface AddCommentData {
   content: string;
 }
+
+export interface TicketAgentStats {
+  agent: number | null;
+  name: string | null;
+  total: number;
+  open: number;
+  by_status: Record<string, number>;
+  resolved: number;
+  average_resolution_seconds: number | null;
+}
+
+export interface TicketStats {
+  total: number;
+  open: number;
+  by_status: Record<string, number>;
+  by_priority: Record<string, number>;
+  by_agent: TicketAgentStats[];
+  resolution: {
+    resolved: number;
+    average_seconds: number | null;
+    by_priority: Record<string, { resolved: number; average_seconds: number | null }>;
+  };
+}
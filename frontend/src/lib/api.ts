@@ -1,6 +1,6 @@
 import axios, { AxiosError, AxiosRequestConfig, AxiosResponse } from 'axios';
 import { ApiResponse, User, Agent, Ticket, CreateAgentData } from '@/types';
-import { Message } from '@/types/message';
+import { GenerationJob, Message } from '@/types/message';
 
 // Create axios instance
 const api = axios.create({
@@ -219,6 +219,12 @@ export const agentsApi = {
     });
   },
   
+  getMessageJob: (agentId: string, jobId: string | number, wait?: number) => {
+    return api.get<GenerationJob>(`/agents/${agentId}/messages/jobs/${jobId}/`, {
+      params: wait ? { wait } : undefined
+    });
+  },
+  
   getAgentEmbedCode: (agentId: string) => {
     return api.get<ApiResponse<{ embed_code: string }>>(`/agents/${agentId}/embed/`);
   },
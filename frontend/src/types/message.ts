@@ -13,3 +13,14 @@ export interface ChatMessage extends Omit<Message, 'created_at' | 'updated_at'>
   createdAt: string;
   updatedAt: string;
 }
+
+export interface GenerationJob {
+  id: number;
+  message: number;
+  status: 'PENDING' | 'RUNNING' | 'COMPLETED' | 'FAILED';
+  response: Message | null;
+  error: string;
+  attempts: number;
+  created_at: string;
+  updated_at: string;
+}